@@ -2,6 +2,8 @@ from google import genai
 from google.genai import types
 import pandas as pd
 
+TOP_ANOMALIES = 30  # самых сильных аномалий в контексте
+
 def prepare_ai_context(df: pd.DataFrame, file_info: list) -> str:
     """
     Готовит контекст с ПОЧАСОВОЙ детализацией для точного анализа пиков и аномалий.
@@ -15,7 +17,7 @@ def prepare_ai_context(df: pd.DataFrame, file_info: list) -> str:
 
     # 2. Общая статистика (Сумма, Пик, Среднее)
     # Это помогает ИИ быстро понять масштаб цифр
-    stats = df.groupby(['MeterID', 'Type'])['Value'].agg(['sum', 'max', 'mean']).reset_index()
+    stats = df.groupby(['MeterID', 'Type'], observed=True)['Value'].agg(['sum', 'max', 'mean']).reset_index()
     stats['sum'] = stats['sum'].round(0)
     stats['max'] = stats['max'].round(2)
     stats['mean'] = stats['mean'].round(2)
@@ -27,7 +29,7 @@ def prepare_ai_context(df: pd.DataFrame, file_info: list) -> str:
     if not pd.api.types.is_datetime64_any_dtype(df_work['DateTime']):
         df_work['DateTime'] = pd.to_datetime(df_work['DateTime'])
 
-    hourly = df_work.set_index('DateTime').groupby(['MeterID', 'Type'])['Value'].resample('1h').sum().reset_index()
+    hourly = df_work.set_index('DateTime').groupby(['MeterID', 'Type'], observed=True)['Value'].resample('1h').sum().reset_index()
     
     # Оптимизация формата для экономии токенов
     # Убираем секунды, округляем значения
@@ -36,6 +38,15 @@ def prepare_ai_context(df: pd.DataFrame, file_info: list) -> str:
     
     # Преобразуем в CSV (самый экономный формат для ИИ)
     csv_data = hourly.to_csv(index=False)
+
+    # 4. АНОМАЛИИ - из слоя куба (медиана/MAD по часу недели), самые сильные отклонения
+    anomalies_str = "Не обнаружены."
+    if "is_anomaly" in df.columns and df["is_anomaly"].any():
+        anom = df[df["is_anomaly"]]
+        top = anom.loc[anom["anomaly_score"].abs().nlargest(TOP_ANOMALIES).index, ['DateTime', 'MeterID', 'Type', 'Value', 'anomaly_score']]
+        top['DateTime'] = pd.to_datetime(top['DateTime']).dt.strftime('%Y-%m-%d %H:%M')
+        top = top.round({'Value': 2, 'anomaly_score': 1})
+        anomalies_str = f"Всего: {len(anom)} (|z| по сезонной базе > порога). Сильнейшие:\n{top.to_csv(index=False)}"
     
     system_prompt = f"""
     ТЫ - ЭКСПЕРТ-ЭНЕРГЕТИК. Твоя цель - найти аномалии, пики и неэффективность.
@@ -48,10 +59,13 @@ def prepare_ai_context(df: pd.DataFrame, file_info: list) -> str:
     
     ДЕТАЛЬНЫЕ ДАННЫЕ (ПОЧАСОВЫЕ ЗНАЧЕНИЯ):
     {csv_data}
+
+    АНОМАЛИИ (30-МИН ИНТЕРВАЛЫ, z - ОТКЛОНЕНИЕ ОТ ТИПИЧНОГО ДЛЯ ЭТОГО ЧАСА НЕДЕЛИ):
+    {anomalies_str}
     
     ИНСТРУКЦИЯ:
     1. Ищи конкретные часы пиковой нагрузки. Укажи дату и время.
-    2. Проверь наличие аномального потребления ночью (когда производство должно стоять).
+    2. Проверь наличие аномального потребления ночью (когда производство должно стоять) и объясни найденные аномалии.
     3. Сравнивай показатели между счетчиками, если их несколько.
     4. Отвечай на украинском языке. Будь краток и используй списки.
     """
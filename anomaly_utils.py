@@ -0,0 +1,119 @@
+import numpy as np
+import schema_utils
+
+# Сезонний детектор аномалій: для кожної серії - медіана й MAD значень за годиною тижня (7 × 24 = 168 кошиків),
+# робастна оцінка z = (x - медіана) / (1.4826 · MAD). База рахується раз на стан набору даних (не на фільтр),
+# тож позначка точки не залежить від вибраного періоду. Усе векторизовано по всіх серіях одразу.
+SLOTS = schema_utils.SLOTS
+HOURS_OF_WEEK = 7 * 24
+MAD_SCALE = 1.4826      # MAD -> σ нормального розподілу
+MEANAD_SCALE = 1.2533   # середнє абсолютне відхилення -> σ (коли MAD = 0, напр. нічна генерація)
+Z_LIMIT = 3.5
+CHUNK = 256             # серій за прохід - обмежує пам'ять на проміжні масиви
+
+def hour_of_week(days):
+    """(доби, 48) - година тижня кожного слота, понеділок 00:00 = 0."""
+    weekday = (np.asarray(days, dtype="datetime64[D]").astype(np.int64) + 3) % 7  # 1970-01-01 - четвер
+    return weekday[:, None] * 24 + (np.arange(SLOTS) // 2)[None, :]
+
+def _nanmedian_sorted(s):
+    """Медіана по останній осі вже відсортованого масиву (NaN - у кінці); порожній ряд - NaN."""
+    n = (~np.isnan(s)).sum(axis=-1)
+    lo = np.take_along_axis(s, np.maximum((n - 1) // 2, 0)[..., None], axis=-1)[..., 0]
+    hi = np.take_along_axis(s, (n // 2)[..., None].clip(max=s.shape[-1] - 1), axis=-1)[..., 0]
+    return np.where(n > 0, (lo + hi) / 2, np.nan)
+
+class Baseline:
+    """center/spread [серія, 168] (float32): медіана і робастна σ серії для кожної години тижня."""
+    def __init__(self, series, center, spread):
+        self.series = list(series)
+        self.center = center
+        self.spread = spread
+        self._index = {s: i for i, s in enumerate(self.series)}
+
+    @classmethod
+    def empty(cls):
+        return cls([], np.empty((0, HOURS_OF_WEEK), np.float32), np.empty((0, HOURS_OF_WEEK), np.float32))
+
+    @classmethod
+    def from_cube(cls, cube):
+        """
+        База з куба: значення кожної серії групуються за годиною тижня в масив (серії, 168, n) з NaN-доповненням,
+        медіана й MAD - одним сортуванням по останній осі для всіх серій порції.
+        """
+        if cube.n_series == 0 or cube.n_days == 0: return cls.empty().select(cube.series)
+        how = hour_of_week(cube.days()).ravel()
+        order = np.argsort(how, kind="stable")
+        counts = np.bincount(how, minlength=HOURS_OF_WEEK)
+        starts = np.r_[0, np.cumsum(counts)[:-1]]
+        width = int(counts.max())
+        pad = np.arange(width)[None, :] >= counts[:, None]
+        take = order[np.minimum(starts[:, None] + np.arange(width)[None, :], len(order) - 1)]
+        center = np.empty((cube.n_series, HOURS_OF_WEEK), np.float32)
+        spread = np.empty((cube.n_series, HOURS_OF_WEEK), np.float32)
+        for c0 in range(0, cube.n_series, CHUNK):
+            flat = cube.values[c0:c0 + CHUNK].reshape(-1, cube.n_days * SLOTS)
+            g = np.take(flat, take, axis=1)        # (серії, 168, n), суцільний - сортування по останній осі швидше
+            g[:, pad] = np.nan
+            med = _nanmedian_sorted(np.sort(g, axis=2))
+            dev = np.abs(g - med[..., None])
+            mad = _nanmedian_sorted(np.sort(dev, axis=2)) * MAD_SCALE
+            zero = mad == 0
+            if zero.any():
+                with np.errstate(invalid="ignore"):
+                    mad[zero] = np.nanmean(dev[zero], axis=1) * MEANAD_SCALE
+            center[c0:c0 + CHUNK] = med
+            spread[c0:c0 + CHUNK] = mad
+        return cls(cube.series, center, spread)
+
+    @classmethod
+    def concat(cls, parts):
+        """Бази з різними серіями -> одна (порядок рядків - як у parts)."""
+        if not parts: return cls.empty()
+        return cls([s for b in parts for s in b.series], np.concatenate([b.center for b in parts]), np.concatenate([b.spread for b in parts]))
+
+    def select(self, series):
+        """База для списку серій у його порядку; серій без бази - NaN (позначок не буде)."""
+        out_c = np.full((len(series), HOURS_OF_WEEK), np.nan, np.float32)
+        out_s = np.full((len(series), HOURS_OF_WEEK), np.nan, np.float32)
+        pairs = [(j, self._index[s]) for j, s in enumerate(series) if s in self._index]
+        if pairs:
+            dst, src = map(list, zip(*pairs))
+            out_c[dst], out_s[dst] = self.center[src], self.spread[src]
+        return Baseline(series, out_c, out_s)
+
+    def update(self, other):
+        """Нова база: рядки other замінюють наявні (перерахунок зачеплених лічильників)."""
+        series = sorted(set(self.series) | set(other.series))
+        out = self.select(series)
+        pos = [out._index[s] for s in other.series]
+        out.center[pos], out.spread[pos] = other.center, other.spread
+        return out
+
+    def scores(self, cube):
+        """Робастні z-оцінки [серії, доби, 48] для куба з тими самими серіями; NaN - немає даних, без бази - 0."""
+        if cube.n_series == 0: return np.empty(cube.values.shape, np.float32)
+        how = hour_of_week(cube.days())
+        with np.errstate(invalid="ignore", divide="ignore"):
+            z = (cube.values - np.take(self.center, how, axis=1)) / np.take(self.spread, how, axis=1)
+        # 0/0 (значення дорівнює сталій базі) і відсутня база - не аномалія
+        return np.where(np.isnan(z) & cube.mask, 0, z).astype(np.float32, copy=False)
+
+    def flags(self, cube, z_limit=Z_LIMIT):
+        """
+        |z| > z_limit без ділення: |x - медіана| > z_limit · σ, порціями серій.
+        NaN (немає даних чи бази) дає False, як і збіг зі сталою базою (σ = 0).
+        """
+        out = np.zeros(cube.values.shape, bool)
+        if cube.n_series == 0: return out
+        how = hour_of_week(cube.days())
+        for c0 in range(0, cube.n_series, CHUNK):
+            c, sp = np.take(self.center[c0:c0 + CHUNK], how, axis=1), np.take(self.spread[c0:c0 + CHUNK], how, axis=1)
+            with np.errstate(invalid="ignore"):
+                np.greater(np.abs(cube.values[c0:c0 + CHUNK] - c), sp * np.float32(z_limit), out=out[c0:c0 + CHUNK])
+        return out
+
+def bucket_flags(flags, width):
+    """Прапорці кошиків по width слотів (рівні rollup_utils): чи є в кошику хоч одна аномалія."""
+    s, d = flags.shape[:2]
+    return flags.reshape(s, d, SLOTS // width, width).any(axis=3)
@@ -4,7 +4,7 @@ import os
 import math
 import base64
 import io
-from datetime import datetime
+from datetime import datetime, timedelta
 import numpy as np
 
 # Local Modules
@@ -14,14 +14,30 @@ import parser
 import graph_utils
 import export_utils
 import selection_utils
+import tariff_utils
+import peak_utils
+import compare_utils
+import forecast_utils
+import rollup_utils
 import ai_utils
 import mail_utils
+import schema_utils
+import ingest_utils
+import pipeline_utils
+import quality_utils
+import virtual_utils
+import warehouse_utils
+from cube_utils import SeriesCube
+from coverage_utils import Coverage
 
 # 1. Config
 st.set_page_config(page_title="АСКОЕ Pro", layout="wide", page_icon="⚡", initial_sidebar_state="expanded")
+COMPACT_SCHEMA = True  # Категорії/int8/float32, Date і Time виводяться з DateTime (див. schema_utils)
+WAREHOUSE_DEFAULT_DAYS = 31  # Період фільтра за замовчуванням для сховища: останні N діб, а не весь архів
 
 # 2. State Initialization
-if "data_df" not in st.session_state: st.session_state["data_df"] = pd.DataFrame()
+# Канонічне сховище - куб серія × доба × 48 (cube_utils); довга таблиця будується лише на вимогу
+if "cube" not in st.session_state: st.session_state["cube"] = SeriesCube.empty()
 if "file_info" not in st.session_state: st.session_state["file_info"] = []
 if "messages" not in st.session_state: st.session_state["messages"] = []
 if "lang" not in st.session_state: st.session_state["lang"] = "ua"
@@ -31,33 +47,47 @@ if "palette_name" not in st.session_state: st.session_state["palette_name"] = "D
 if "custom_colors" not in st.session_state: st.session_state["custom_colors"] = ["#FF0000"] * 8
 if "pdf_bytes" not in st.session_state: st.session_state["pdf_bytes"] = None
 if "sys_prompt_loaded" not in st.session_state: st.session_state["sys_prompt_loaded"] = False
+# Спільне сховище на диску (warehouse_utils) - лише якщо ввімкнене (ASKUE_WAREHOUSE=1); сесія може від нього від'єднатися
+if "use_warehouse" not in st.session_state: st.session_state["use_warehouse"] = warehouse_utils.is_enabled()
+USE_WAREHOUSE = st.session_state["use_warehouse"]
 
 # Report State
 if "report_blocks" not in st.session_state: 
     st.session_state["report_blocks"] = [{"type": "stats", "id": 0, "title": "Зведена статистика"}]
 if "report_counter" not in st.session_state: st.session_state["report_counter"] = 1
+if "virtual_meters" not in st.session_state: st.session_state["virtual_meters"] = []  # [{"name", "formula"}]
+if "tariff_preset" not in st.session_state: st.session_state["tariff_preset"] = "Тризонний"
+if "tariff" not in st.session_state: st.session_state["tariff"] = tariff_utils.with_prices("Тризонний", {})  # і для блоку звіту
 
 defaults = {
     "chart_h": 500, "chart_type": "Line", "line_w": 2, 
     "show_pts": False, "show_anom": False, "legend_pos_val": "top", "bw_mode": False,
-    "resample_val": "30T", "theme_mode": "Light", "show_vals": False
+    "resample_val": "30T", "theme_mode": "Light", "show_vals": False, "compare_with": [],
+    "show_forecast": False, "forecast_days": 1, "chart_window": None, "heatmap_grid": False
 }
 for k, v in defaults.items():
     if k not in st.session_state: st.session_state[k] = v
 
 # --- ФУНКЦІЇ ---
-def merge_new_data(new_df, new_files):
+def merge_new_data(new_cube, new_files):
     """Об'єднує нові дані з існуючими"""
-    if new_df.empty: return
-    if st.session_state["data_df"].empty:
-        st.session_state["data_df"] = new_df
+    if new_cube.is_empty(): return
+    if USE_WAREHOUSE:
+        # Перезаписуються лише зачеплені партиції (місяць × лічильник); список файлів - у каталозі
+        inserted, replaced = warehouse_utils.write_cube(new_cube, new_files)
+        if replaced: st.toast(f"Оновлено інтервалів: {replaced}, нових: {inserted}")
+        st.session_state["sys_prompt_loaded"] = False
+    elif st.session_state["cube"].is_empty():
+        # Однакові набори з різних сесій - один спільний куб у пам'яті процесу (ключ - хеші вмісту файлів з кешу розбору)
+        keys = dataset_key(new_files)
+        st.session_state["cube"] = shared_dataset(keys, new_cube) if keys else new_cube
         st.session_state["file_info"] = new_files
     else:
-        old_df = st.session_state["data_df"]
-        combined = pd.concat([old_df, new_df], ignore_index=True)
-        combined = combined.drop_duplicates(subset=["DateTime", "MeterID", "Type"], keep="last")
-        combined = combined.sort_values("DateTime")
-        st.session_state["data_df"] = combined
+        # Злиття на місці: вартість пропорційна новому пакету, а не всій історії.
+        # Спільний куб не змінюється - сесія отримує власний (copy-on-write при першому записі)
+        if st.session_state["cube"].is_frozen: st.session_state["cube"] = st.session_state["cube"].thaw()
+        inserted, replaced = st.session_state["cube"].update(new_cube)
+        if replaced: st.toast(f"Оновлено інтервалів: {replaced}, нових: {inserted}")
         existing_names = {f['name'] for f in st.session_state["file_info"]}
         for f in new_files:
             if f['name'] not in existing_names:
@@ -79,6 +109,77 @@ def add_report_block(b_type, title, default_meters=None, default_types=None):
     }
     st.session_state["report_blocks"].append(new_block)
 
+def current_dataset():
+    """Метадані для фільтрів: каталог сховища (без читання даних) або куб сесії."""
+    if USE_WAREHOUSE: return warehouse_utils.load_catalog()
+    return st.session_state["cube"]
+
+# Спільні для всіх сесій процесу і незмінні (freeze): сесії беруть з них лише view через select()
+def dataset_key(files):
+    """Відсортовані ключі вмісту файлів (cache_utils.file_key); None - якщо хоч для одного ключа немає (кеш вимкнено)."""
+    keys = [f.get("key") for f in files]
+    return tuple(sorted(keys)) if keys and all(keys) else None
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def shared_dataset(keys, _cube):
+    return _cube.freeze()
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def load_warehouse_window(version, meters, d_start, d_end):
+    """Вікно сховища: лише потрібні лічильники (None - усі) за період; сесії з однаковими фільтрами ділять один куб."""
+    cube = warehouse_utils.load_cube(meters and list(meters), d_start, d_end)
+    # Аномалії - за базою всього архіву, а не лише цих місяців
+    cube.set_baseline(load_warehouse_baseline(version))
+    return cube.freeze()
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def load_warehouse_baseline(version):
+    return warehouse_utils.load_baseline()
+
+def load_view(meters=None, types=None, d_start=None, d_end=None):
+    """
+    Куб вибірки: зі сховища читаються лише вибрані лічильники (і джерела віртуальних) за вибраний період.
+    Віртуальні лічильники сесії рахуються раз на весь куб (етап "virtual"), а вибірка береться з них select() -
+    як і для справжніх, база, аномалії й прогноз ідуть з усього набору, а не з вибраного вікна.
+    """
+    defs = [v for v in st.session_state["virtual_meters"] if meters is None or v["name"] in meters]
+    if USE_WAREHOUSE:
+        need = None if meters is None else tuple(sorted(set(meters) - set(virtual_utils.names(defs)) | set(virtual_utils.sources(defs))))
+        cube = load_warehouse_window(current_dataset().version, need, d_start, d_end)
+    else:
+        cube = st.session_state["cube"]
+    view = cube.select(meters, types, d_start, d_end)
+    if not defs or cube.is_empty(): return view
+    virt = pipeline_utils.run("virtual", pipeline_utils.signature(cube.version, defs), lambda: virtual_utils.evaluate(cube, defs))
+    return SeriesCube.stack([view, virt.select(None, types, d_start, d_end)])
+
+def filter_meters(ds):
+    """Лічильники для фільтрів: справжні, потім віртуальні."""
+    return ds.meters() + virtual_utils.names(st.session_state["virtual_meters"])
+
+def delete_virtual_meter(idx):
+    if 0 <= idx < len(st.session_state["virtual_meters"]):
+        st.session_state["virtual_meters"].pop(idx)
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def load_warehouse_coverage(version):
+    return warehouse_utils.load_coverage()
+
+def load_coverage(meters=None, types=None, d_start=None, d_end=None):
+    """Карта покриття: у сховищі - індекс усього архіву (без читання значень), інакше - з маски куба сесії."""
+    if USE_WAREHOUSE: cov = load_warehouse_coverage(current_dataset().version)
+    else: cov = Coverage.from_cube(st.session_state["cube"])
+    return cov.select(meters, types, d_start, d_end)
+
+def default_period(ds):
+    d_min, d_max = ds.date_range()
+    if USE_WAREHOUSE: d_min = max(d_min, d_max - timedelta(days=WAREHOUSE_DEFAULT_DAYS - 1))
+    return [d_min, d_max]
+
+def full_df():
+    """Повна довга таблиця з шаром аномалій - матеріалізується лише для тих, кому потрібні всі рядки (ШІ)."""
+    return load_view().to_frame(compact=COMPACT_SCHEMA, anomalies=True)
+
 def delete_report_block(idx):
     if 0 <= idx < len(st.session_state["report_blocks"]):
         st.session_state["report_blocks"].pop(idx)
@@ -87,27 +188,31 @@ def delete_report_block(idx):
 if os.path.exists("logo.png"): st.image("logo.png", width=250)
 else: st.title(f"⚡ АСКОЕ Pro")
 
-df = st.session_state["data_df"]
+ds = current_dataset()
+if USE_WAREHOUSE: st.session_state["file_info"] = ds.file_info
 
 # --- APP LOGIC: ЗАВАНТАЖЕННЯ ---
-if df.empty:
+if ds.is_empty():
     ui.render_sidebar()
     ui.render_start_screen()
+    if warehouse_utils.is_enabled() and not USE_WAREHOUSE and not warehouse_utils.load_catalog().is_empty():
+        if st.button("🗄️ Відкрити спільне сховище", key="wh_attach_btn"):
+            st.session_state["use_warehouse"] = True
+            st.rerun()
     st.markdown("### Джерело даних")
     src_tab1, src_tab2 = st.tabs(["📂 Завантаження файлів", "📧 Завантаження з пошти"])
     
     with src_tab1:
-        up = st.file_uploader("Оберіть .txt (Формат 30917)", type=["txt"], accept_multiple_files=True, label_visibility="collapsed")
+        up = st.file_uploader("Оберіть .txt або .zip (Формат 30917)", type=["txt", "zip"], accept_multiple_files=True, label_visibility="collapsed")
         if up:
-            files = [(f.name, f.read()) for f in up]
+            # Потоково: файли й вміст архівів читаються по одному, без f.read() всього пакета
             with st.spinner("Обробка файлів..."):
-                d, i, errs = parser.parse_askue_files(files)
+                d, i, errs = parser.parse_askue_stream_cube(ingest_utils.iter_uploads(up))
             if errs:
                 st.error("Помилки читання файлів:")
                 for e in errs: st.write(f"- {e}")
-            if not d.empty:
-                st.session_state["data_df"] = d
-                st.session_state["file_info"] = i
+            if not d.is_empty():
+                merge_new_data(d, i)
                 st.rerun()
 
     with src_tab2:
@@ -119,54 +224,77 @@ if df.empty:
                 elif not mail_files: st.warning("Вкладень не знайдено.")
                 else:
                     st.success(f"Знайдено файлів: {len(mail_files)}")
-                    d, i, errs = parser.parse_askue_files(mail_files)
-                    if not d.empty:
-                        st.session_state["data_df"] = d
-                        st.session_state["file_info"] = i
+                    d, i, errs = parser.parse_askue_cube(mail_files)
+                    if not d.is_empty():
+                        merge_new_data(d, i)
                         st.rerun()
     ui.render_footer()
 
 else:
     # --- БОКОВА ПАНЕЛЬ: ДЖЕРЕЛО ---
-    ui.render_sidebar(df_context=df, file_info=[])
+    ui.render_sidebar(df_context=ds.series_frame(), file_info=[])
     
     with st.sidebar:
         with st.expander("📂 Джерело даних", expanded=False):
             sb_tab1, sb_tab2 = st.tabs(["Інфо", "Додати"])
             with sb_tab1:
-                dr = None
-                if not st.session_state["data_df"].empty:
-                    dr = (st.session_state["data_df"]["Date"].min(), st.session_state["data_df"]["Date"].max())
+                dr = ds.date_range()
                 ui.render_file_grid(st.session_state.get("file_info", []), date_range=dr)
-                if st.button("🗑️ Очистити все", key="clear_all_btn"):
-                    st.session_state["data_df"] = pd.DataFrame()
+                st.caption(f"Повнота даних: {load_coverage().completeness() * 100:.1f}% (див. вкладку «{t('tab_coverage')}»)")
+                if st.button("🗑️ Очистити все", key="clear_all_btn", help="Лише для цієї сесії: спільне сховище не змінюється"):
+                    # Сесія від'єднується від сховища; дані інших сесій і кеші етапів лишаються
+                    st.session_state["use_warehouse"] = False
+                    st.session_state["cube"] = SeriesCube.empty()
                     st.session_state["file_info"] = []
+                    st.session_state["chart_window"] = None
                     st.rerun()
+                if USE_WAREHOUSE and warehouse_utils.ADMIN:
+                    confirm = st.checkbox("Підтверджую видалення сховища для всіх користувачів", key="wh_wipe_confirm")
+                    if st.button("⚠️ Видалити сховище", key="wh_wipe_btn", disabled=not confirm):
+                        # Версія каталогу після очищення продовжує зростати - ключі кешів етапів не збігаються зі старими
+                        warehouse_utils.clear()
+                        load_warehouse_window.clear(); load_warehouse_coverage.clear(); load_warehouse_baseline.clear()
+                        st.rerun()
             with sb_tab2:
                 st.caption("Додати до поточних даних:")
                 with st.form("add_files_form", clear_on_submit=True):
-                    add_up = st.file_uploader("Оберіть файли .txt", type=["txt"], accept_multiple_files=True, label_visibility="collapsed")
+                    add_up = st.file_uploader("Оберіть файли .txt або .zip", type=["txt", "zip"], accept_multiple_files=True, label_visibility="collapsed")
                     submitted = st.form_submit_button("📥 Завантажити")
                     if submitted and add_up:
-                        files = [(f.name, f.read(), datetime.now()) for f in add_up]
-                        d, i, _ = parser.parse_askue_files(files)
-                        if not d.empty:
+                        d, i, _ = parser.parse_askue_stream_cube(ingest_utils.iter_uploads(add_up, datetime.now()))
+                        if not d.is_empty():
                             merge_new_data(d, i)
-                            st.success(f"Додано файлів: {len(files)}")
+                            st.success(f"Додано файлів: {len(i)}")
                             st.rerun()
                 st.divider()
                 if st.button("📧 Додати з пошти", key="add_mail_btn"):
                     with st.spinner("Завантаження..."):
                         mail_files, err = mail_utils.fetch_attachments_from_mail(limit=10)
                         if mail_files:
-                            d, i, _ = parser.parse_askue_files(mail_files)
-                            if not d.empty:
+                            d, i, _ = parser.parse_askue_cube(mail_files)
+                            if not d.is_empty():
                                 merge_new_data(d, i)
                                 st.toast(f"Додано з пошти: {len(mail_files)}")
                                 st.rerun()
                         elif err: st.error(err)
                         else: st.toast("Нових файлів не знайдено.")
 
+        with st.expander("🧮 Віртуальні лічильники", expanded=False):
+            st.caption("Формула над лічильниками: 12345 + 12346 - 12350. Канал - через двокрапку (12345:1 - 12345:2), коефіцієнт - 0.5*12345.")
+            for i, vm in enumerate(st.session_state["virtual_meters"]):
+                vc1, vc2 = st.columns([6, 1])
+                vc1.markdown(f"**{vm['name']}** = `{vm['formula']}`")
+                vc2.button("❌", key=f"del_vm_{i}", on_click=delete_virtual_meter, args=(i,))
+            with st.form("add_virtual_form", clear_on_submit=True):
+                vm_name = st.text_input("Назва")
+                vm_formula = st.text_input("Формула")
+                if st.form_submit_button("➕ Додати"):
+                    err = virtual_utils.validate(vm_name, vm_formula, ds.meters(), virtual_utils.names(st.session_state["virtual_meters"]))
+                    if err: st.error(err)
+                    else:
+                        st.session_state["virtual_meters"].append({"name": vm_name.strip(), "formula": vm_formula.strip()})
+                        st.rerun()
+
         # --- ЧАТ В САЙДБАРІ ---
         st.markdown("---")
         
@@ -207,7 +335,7 @@ else:
                 st.session_state["chat_height"] = st.slider("Висота вікна (px)", 300, 800, 400)
 
                 if st.button("🔄 Оновити дані контексту"):
-                    sys_prompt = ai_utils.prepare_ai_context(df, st.session_state.get("file_info", []))
+                    sys_prompt = ai_utils.prepare_ai_context(full_df(), st.session_state.get("file_info", []))
                     st.session_state["messages"] = [{"role": "user", "content": sys_prompt}]
                     st.session_state["messages"].append({"role": "model", "content": "Дані оновлено. Готовий до аналізу."})
                     st.session_state["sys_prompt_loaded"] = True
@@ -225,8 +353,8 @@ else:
             chat_container = st.container(height=st.session_state["chat_height"])
             
             # Авто-завантаження
-            if not st.session_state.get("sys_prompt_loaded") and not df.empty:
-                sys_prompt = ai_utils.prepare_ai_context(df, st.session_state.get("file_info", []))
+            if not st.session_state.get("sys_prompt_loaded") and not ds.is_empty():
+                sys_prompt = ai_utils.prepare_ai_context(full_df(), st.session_state.get("file_info", []))
                 st.session_state["messages"] = [{"role": "user", "content": sys_prompt}]
                 st.session_state["sys_prompt_loaded"] = True
 
@@ -253,7 +381,9 @@ else:
     tabs_map = {
         "tab_graph": t("tab_graph"), "tab_daily": t("tab_daily"),
         "tab_matrix": t("tab_matrix"), "tab_pq": t("tab_pq"), 
-        "tab_dist": t("tab_dist"), "tab_table": t("tab_table"), "tab_report": t("tab_report")
+        "tab_dist": t("tab_dist"), "tab_table": t("tab_table"),
+        "tab_coverage": t("tab_coverage"), "tab_tariff": t("tab_tariff"),
+        "tab_peaks": t("tab_peaks"), "tab_report": t("tab_report")
     }
     nav = st.radio("Nav", list(tabs_map.keys()), format_func=lambda x: tabs_map[x], horizontal=True, label_visibility="collapsed")
     st.session_state["nav_tab"] = nav 
@@ -263,9 +393,8 @@ else:
     if show_filters:
         with st.expander("🔎 Фільтри даних", expanded=True):
             c1, c2, c3 = st.columns([1.5, 3, 1])
-            all_m = sorted(df["MeterID"].unique())
-            all_t = sorted(df["Type"].unique())
-            d_min, d_max = df["Date"].min(), df["Date"].max()
+            all_m = filter_meters(ds)
+            all_t = ds.types()
             
             def select_all_meters(all_m):
                 for m in all_m: st.session_state[f"chk_m_{m}"] = True
@@ -285,7 +414,8 @@ else:
                 with st.container(border=True):
                     h1, h2, h3 = st.columns([6, 2, 3])
                     h1.markdown('<span style="font-size:0.8rem;font-weight:700;color:#0068c9">ЛІЧИЛЬНИКИ</span>', unsafe_allow_html=True)
-                    if nav == "tab_matrix":
+                    # Матриця - один лічильник, у режимі сітки - кілька, як на інших вкладках
+                    if nav == "tab_matrix" and not st.session_state["heatmap_grid"]:
                         sel_m = [st.radio("Meter", all_m, label_visibility="collapsed")]
                     else:
                         h2.button("Всі", on_click=select_all_meters, args=(all_m,), key="btn_m_all")
@@ -308,7 +438,7 @@ else:
                     elif nav == "tab_pq":
                         st.markdown('<span style="font-size:0.8rem;font-weight:700;color:#0068c9">РЕЖИМ</span>', unsafe_allow_html=True)
                         pq_mode = st.radio("Mode", ["Споживання", "Генерація"], horizontal=True)
-                        sel_t = cons_list if pq_mode == "Споживання" else gen_list
+                        sel_t = quality_utils.real(cons_list if pq_mode == "Споживання" else gen_list)
                     else:
                         cc1, cc2 = st.columns(2)
                         with cc1:
@@ -317,7 +447,8 @@ else:
                             ch2.button("Всі", on_click=select_cons, args=(cons_list,), key="btn_c_all")
                             ch3.button("Скид", on_click=clear_cons, args=(cons_list,), key="btn_c_clr")
                             for item in cons_list:
-                                if f"chk_{item}" not in st.session_state: st.session_state[f"chk_{item}"] = True
+                                # Похідні канали (S, cos φ, ...) - лише на вибір користувача
+                                if f"chk_{item}" not in st.session_state: st.session_state[f"chk_{item}"] = not quality_utils.is_derived(item)
                                 if st.checkbox(item, key=f"chk_{item}"): sel_t.append(item)
                         with cc2:
                             gh1, gh2, gh3 = st.columns([6, 2, 3])
@@ -330,20 +461,46 @@ else:
             with c3:
                 with st.container(border=True):
                     st.markdown('<span style="font-size:0.8rem;font-weight:700;color:#0068c9">ПЕРІОД</span>', unsafe_allow_html=True)
-                    sel_d = st.date_input("D", [d_min, d_max], label_visibility="collapsed")
+                    sel_d = st.date_input("D", default_period(ds), label_visibility="collapsed")
 
-        mask = (df["MeterID"].isin(sel_m)) & (df["Type"].isin(sel_t))
-        if len(sel_d) == 2: mask &= (df["Date"] >= sel_d[0]) & (df["Date"] <= sel_d[1])
-        df_v = df[mask].copy()
+        # Вибірка - куб лише вибраних лічильників і періоду; довга таблиця лише для вкладок, яким потрібні рядки.
+        # Етапи конвеєра запам'ятовуються за сигнатурою (версія даних + фільтр), тож перезапуск без змін фільтра їх не повторює
+        view_sig = pipeline_utils.signature(USE_WAREHOUSE, ds.version, sel_m, sel_t, sel_d, st.session_state["virtual_meters"])
+        cube_v = pipeline_utils.run("view", view_sig, lambda: load_view(sel_m, sel_t, *sel_d) if len(sel_d) == 2 else load_view(sel_m, sel_t))
     else:
-        df_v = df.copy()
-
-    if not df_v.empty and "is_anomaly" not in df_v.columns:
-        grouped = df_v.groupby(["MeterID", "Type"])["Value"]
-        df_v["mean"] = grouped.transform("mean")
-        df_v["std"] = grouped.transform("std")
-        df_v["z_score"] = (df_v["Value"] - df_v["mean"]) / df_v["std"].replace(0, 1)
-        df_v["is_anomaly"] = df_v["z_score"].abs() > 3.0
+        cube_v = view_sig = None
+    # Графіки групують за серіями - їм рядки в порядку осей куба (MeterID, Type, DateTime), без сортування;
+    # таблиця показує хронологію
+    def series_frame(): return pipeline_utils.run("frame", view_sig + ("series",), lambda: cube_v.to_frame(compact=COMPACT_SCHEMA, order="series"))
+    def anomaly_frame(): return pipeline_utils.run("anomaly", view_sig, lambda: pipeline_utils.anomaly_frame(series_frame(), cube_v))
+    # Порівняння періодів: ті самі серії за зсунуті на цілі тижні періоди, вирівняні з вибіркою (compare_utils).
+    # Зміна періоду порівняння не перечитує й не перефільтровує базову вибірку - лише бере/кешує зсунуту
+    def shifted_view(d_start, d_end):
+        sig = pipeline_utils.signature(USE_WAREHOUSE, ds.version, sel_m, sel_t, (d_start, d_end), st.session_state["virtual_meters"])
+        return pipeline_utils.run("view", sig, lambda: load_view(sel_m, sel_t, d_start, d_end))
+    def comparison(labels): return pipeline_utils.run("compare", view_sig + pipeline_utils.signature(labels), lambda: compare_utils.Comparison.build(cube_v, shifted_view, labels))
+    # Прогноз - з моделі останніх тижнів набору (forecast_utils, кеш куба за версією) для серій вибірки,
+    # від кінця даних незалежно від вибраного періоду
+    def recent_view():
+        d_last = ds.date_range()[1]
+        return shifted_view(d_last - timedelta(days=forecast_utils.HISTORY_DAYS - 1), d_last)
+    def forecast_frame(n_days, res):
+        width = 1 if res == "30T" else rollup_utils.LEVELS[res]
+        return pipeline_utils.run("forecast", view_sig + (n_days, res), lambda: recent_view().forecast_model().select(cube_v.series).frame(n_days, width))
+    def show_forecast(n_days):
+        model = pipeline_utils.run("forecast", view_sig + (n_days, "model"), lambda: recent_view().forecast_model().select(cube_v.series))
+        summ = model.summary(n_days, [cube_v.label(i) for i in range(cube_v.n_series)]).dropna(subset=["Прогноз, сума"])
+        if summ.empty: return
+        st.markdown(f"**{t('forecast_hdr')}:** {pd.Timestamp(model.start):%d.%m.%Y} + {n_days} діб")
+        st.dataframe(summ.style.format({c: "{:,.2f}" for c in summ.columns[1:]}, na_rep="—"), use_container_width=True, hide_index=True)
+    def show_comparison(labels):
+        summ = comparison(labels).summary()
+        if summ.empty: return
+        st.markdown(f"**{t('compare_hdr')}**")
+        st.dataframe(summ.style.format({c: "{:,.2f}" for c in ["Поточний", "Порівняння", "Δ", "Δ, %", "Макс. |Δ| за 30 хв"]}, na_rep="—"), use_container_width=True, hide_index=True)
+    df_v = None
+    if nav == "tab_table":
+        df_v = pipeline_utils.run("frame", view_sig + ("time",), lambda: cube_v.to_frame(compact=COMPACT_SCHEMA))
 
     # === МАЙСТЕР ЗВІТІВ ===
     if nav == "tab_report":
@@ -351,12 +508,11 @@ else:
         with st.container(border=True):
             c1, c2 = st.columns(2)
             rep_title = c1.text_input("Заголовок звіту", "Звіт з енергоспоживання")
-            d_min, d_max = df["Date"].min(), df["Date"].max()
-            rep_dates = c2.date_input("Період звіту", [d_min, d_max])
+            rep_dates = c2.date_input("Період звіту", default_period(ds))
         
         st.subheader("Структура звіту")
-        all_meters = sorted(df["MeterID"].unique())
-        all_types = sorted(df["Type"].unique())
+        all_meters = filter_meters(ds)
+        all_types = ds.types()
         
         for i, block in enumerate(st.session_state["report_blocks"]):
             with st.expander(f"{i+1}. {block.get('title', 'Блок')} ({block['type']})", expanded=True):
@@ -409,10 +565,10 @@ else:
                             block["types"] = new_types
 
         st.markdown("---")
-        c_add1, c_add2, c_add3, c_add4, c_gen = st.columns(5)
+        c_add1, c_add2, c_add3, c_add4, c_add5, c_add6, c_gen = st.columns(7)
         
         safe_all_meters = all_meters if all_meters else []
-        safe_cons_types = [t for t in all_types if "потребление" in t.lower()]
+        safe_cons_types = [t for t in quality_utils.real(all_types) if "потребление" in t.lower()]
         safe_def_types = safe_cons_types if safe_cons_types else all_types
         safe_mat_m = [safe_all_meters[0]] if safe_all_meters else []
         safe_mat_t = [safe_def_types[0]] if safe_def_types else []
@@ -421,12 +577,16 @@ else:
         c_add2.button(t("rep_add_30m"), on_click=add_report_block, args=("graph_30m", "Графік навантаження", safe_all_meters, safe_def_types))
         c_add3.button(t("rep_add_daily"), on_click=add_report_block, args=("graph_daily", "Добовий графік", safe_all_meters, safe_def_types))
         c_add4.button(t("rep_add_matrix"), on_click=add_report_block, args=("graph_matrix", "Теплова карта", safe_mat_m, safe_mat_t))
+        c_add5.button(t("rep_add_tariff"), on_click=add_report_block, args=("tariff", "Вартість за тарифом", safe_all_meters, safe_def_types))
+        c_add6.button(t("rep_add_peaks"), on_click=add_report_block, args=("peaks", "Піки навантаження", safe_all_meters, safe_mat_t))
         
         if c_gen.button("🚀 Сформувати PDF", type="primary"):
             with st.spinner("Генерація звіту..."):
-                report_config = { "title": rep_title, "dates": rep_dates, "blocks": st.session_state["report_blocks"] }
+                report_config = { "title": rep_title, "dates": rep_dates, "blocks": st.session_state["report_blocks"], "tariff": st.session_state["tariff"] }
                 try:
-                    pdf_bytes = export_utils.export_custom_pdf(df, st.session_state["file_info"], report_config)
+                    rep_meters = sorted({m for b in st.session_state["report_blocks"] for m in b.get("meters", [])})
+                    rep_cube = load_view(rep_meters, None, *rep_dates)
+                    pdf_bytes = export_utils.export_custom_pdf(None, st.session_state["file_info"], report_config, cube=rep_cube)
                     st.session_state["pdf_bytes"] = pdf_bytes
                     st.success("Готово!")
                 except Exception as e:
@@ -437,13 +597,11 @@ else:
 
     # --- ОСНОВНИЙ ДАШБОРД ---
     elif nav != "tab_report":
-        if df_v.empty: st.warning("Немає даних для відображення.")
+        if cube_v.is_empty(): st.warning("Немає даних для відображення.")
         else:
-            cons_act = df_v[df_v["Suffix"] == 2]["Value"].sum(); cons_react = df_v[df_v["Suffix"] == 4]["Value"].sum()
-            peak_val = df_v[df_v["Suffix"] == 2]["Value"].max(); 
-            if pd.isna(peak_val): peak_val = 0
-            cos_phi = cons_act / math.sqrt(cons_act**2 + cons_react**2) if cons_act > 0 else 0
-            gen_act = df_v[df_v["Suffix"] == 1]["Value"].sum(); gen_react = df_v[df_v["Suffix"] == 3]["Value"].sum()
+            kpi = pipeline_utils.run("kpi", view_sig, lambda: pipeline_utils.kpis(cube_v))
+            cons_act, cons_react, gen_act, gen_react = kpi["cons_act"], kpi["cons_react"], kpi["gen_act"], kpi["gen_react"]
+            peak_val, cos_phi = kpi["peak"], kpi["cos_phi"]
             tm = st.session_state["theme_mode"]
 
             with st.container(border=True):
@@ -467,55 +625,93 @@ else:
             l_pos = st.session_state.get("legend_pos_val", "top")
             bw = st.session_state.get("bw_mode", False)
             pl_template = "plotly_dark" if st.session_state.get("theme_mode") == "Dark" else "plotly_white"
-            ap = df_v["Suffix"].isin([1, 2]).any(); rp = df_v["Suffix"].isin([3, 4]).any()
+            sfx = cube_v.suffixes(); ap = bool(sfx & {1, 2}); rp = bool(sfx & {3, 4})
             units = " (кВт)" if ap and not rp else " (кВАр)" if rp and not ap else " (кВт / кВАр)"
+            if not ap and not rp: units = ""  # лише похідні канали (S, cos φ, ...) - одиниці в назві каналу
             common_labels = {"x": "Дата і час", "y": "Значення" + units, "bw": bw}
             current_palette = st.session_state.get("palette_name", "Default")
             cust_colors = st.session_state.get("custom_colors") if current_palette == "Custom" else None
+            # Фігура - останній етап конвеєра: ключ = вибірка + вкладка + усі налаштування вигляду, від яких вона залежить
+            def memo_fig(*settings, build): return pipeline_utils.run("figure", view_sig + pipeline_utils.signature(nav, *settings), build)
             
             if nav == "tab_graph":
                 st.markdown(t("desc_30m"), unsafe_allow_html=True)
                 res_val = st.session_state.get("resample_val", "30T")
                 res = res_val.replace("H", "h") if "H" in res_val else res_val
                 anom = st.session_state["show_anom"]
-                if res == "30T": plot_df = df_v.copy()
-                else:
-                    grouped = df_v.set_index("DateTime").groupby(["MeterID", "Type"])["Value"]
-                    plot_df = grouped.resample(res).agg(['min', 'max', 'mean']).reset_index()
-                    plot_df = plot_df.rename(columns={'mean': 'Value', 'min': 'min_val', 'max': 'max_val'})
-                    if "is_anomaly" in df_v.columns:
-                        try:
-                            anoms = df_v.set_index("DateTime").groupby(["MeterID", "Type"])["is_anomaly"].resample(res).max().reset_index()
-                            anoms["is_anomaly"] = anoms["is_anomaly"].fillna(0).astype(bool)
-                            plot_df = pd.merge(plot_df, anoms, on=["DateTime", "MeterID", "Type"], how="left")
-                        except: pass
-                fig = graph_utils.plot_30min_graph(plot_df, h, w, st.session_state["show_pts"], anom, st.session_state["chart_type"], l_pos, bw, common_labels, pl_template, palette_name=current_palette, custom_colors=cust_colors)
+                # Крок від 1 год - рівень піраміди агрегатів куба; сирі 30-хв рядки лише для "30 хв"
+                if res == "30T": plot_df = anomaly_frame()
+                else: plot_df = pipeline_utils.run("plot_frame", view_sig + (res,), lambda: pipeline_utils.rollup_frame(cube_v, res))
+                show_pts, chart_type = st.session_state["show_pts"], st.session_state["chart_type"]
+                comp = st.session_state["compare_with"]
+                fc_days = st.session_state["forecast_days"] if st.session_state["show_forecast"] else 0
+                # У браузер іде проріджена таблиця (кошики min/max, pipeline_utils.downsample) - для всього періоду
+                # або для вікна «Наблизити до виділення», де точок менше і деталізація повна; статистика виділення - із сирих 30-хв даних
+                win = st.session_state["chart_window"]
+                zoom = win[1:] if win and win[0] == view_sig else None
+                def chart_frame(df): return pipeline_utils.downsample(pipeline_utils.window_frame(df, *zoom) if zoom else df)
+                def chart_table():
+                    win_df = pipeline_utils.window_frame(plot_df, *zoom) if zoom else plot_df
+                    return pipeline_utils.downsample(win_df), len(win_df)
+                chart_df, n_win = pipeline_utils.run("plot_frame", view_sig + (res, "chart") + pipeline_utils.signature(zoom), chart_table)
+                fig = memo_fig(res, h, w, show_pts, anom, chart_type, l_pos, bw, common_labels, pl_template, current_palette, cust_colors, comp, fc_days, zoom,
+                               build=lambda: graph_utils.plot_30min_graph(chart_df, h, w, show_pts, anom, chart_type, l_pos, bw, common_labels, pl_template, palette_name=current_palette, custom_colors=cust_colors,
+                                                                          overlays=[(lb, chart_frame(o)) for lb, o in comparison(comp).overlay_frames(res)] if comp else None,
+                                                                          forecast=chart_frame(forecast_frame(fc_days, res)) if fc_days else None))
                 ev = st.plotly_chart(fig, use_container_width=True, on_select="rerun", selection_mode="box")
+                if len(chart_df) < n_win or zoom:
+                    c_info, c_back = st.columns([4, 1])
+                    note = f"Показано {len(chart_df):,} з {n_win:,} точок".replace(",", " ")
+                    if len(chart_df) < n_win: note += " (мін./макс. у кошиках часу)"
+                    if zoom: note += f" · вікно {pd.Timestamp(zoom[0]):%d.%m.%Y %H:%M} - {pd.Timestamp(zoom[1]):%d.%m.%Y %H:%M}"
+                    else: note += ". Виділіть ділянку, щоб наблизити її з повною деталізацією."
+                    c_info.caption(note)
+                    if zoom and c_back.button("↔ Весь період"):
+                        st.session_state["chart_window"] = None
+                        st.rerun()
                 sel_range = None
                 if ev and ev.get("selection") and ev["selection"].get("box"):
                     xs = ev["selection"]["box"][0].get("x", [])
                     if len(xs) >= 2: sel_range = [pd.to_datetime(xs[0]), pd.to_datetime(xs[1])]
                 if sel_range:
-                    stats, tr = selection_utils.compute_detailed_selection_stats(df_v, sel_range)
+                    # Індекс діапазонних запитів - раз на вибірку, завжди із сирих 30-хв даних: межі виділення не прив'язуються
+                    # до кошиків агрегації (інакше 05:00-07:00 при 4 год не містить жодної точки); кожне виділення - лише запит
+                    index = pipeline_utils.run("range_index", view_sig, lambda: selection_utils.RangeIndex.from_frame(anomaly_frame()))
+                    stats, tr = index.query(*sel_range)
                     if stats: st.markdown(ui.generate_detailed_stats_html(stats, tr), unsafe_allow_html=True)
+                    if st.button("🔍 Наблизити до виділення"):
+                        st.session_state["chart_window"] = (view_sig, *sorted(sel_range))
+                        st.rerun()
+                if comp: show_comparison(comp)
+                if fc_days: show_forecast(fc_days)
 
             elif nav == "tab_daily": 
                 st.markdown(t("desc_daily"), unsafe_allow_html=True)
                 show_v = st.session_state.get("show_vals", False)
-                fig = graph_utils.plot_daily_bar(df_v, h, l_pos, common_labels, pl_template, palette_name=current_palette, custom_colors=cust_colors, show_vals=show_v)
+                comp = st.session_state["compare_with"]
+                fig = memo_fig(h, l_pos, common_labels, pl_template, current_palette, cust_colors, show_v, comp,
+                               build=lambda: graph_utils.plot_daily_bar(None, h, l_pos, common_labels, pl_template, palette_name=current_palette, custom_colors=cust_colors, show_vals=show_v, cube=cube_v,
+                                                                        overlays=comparison(comp).daily_frames() if comp else None))
                 st.plotly_chart(fig, use_container_width=True)
+                if comp: show_comparison(comp)
 
             elif nav == "tab_matrix": 
                 st.markdown(t("desc_matrix"), unsafe_allow_html=True)
                 matrix_palette = st.session_state.get("heatmap_palette_name", "Default")
-                fig = graph_utils.plot_heatmap(df_v, h, st.session_state.get("show_vals", False), common_labels, pl_template, palette_name=matrix_palette)
+                show_v = st.session_state.get("show_vals", False)
+                if st.session_state["heatmap_grid"]:
+                    fig = memo_fig(h, "grid", pl_template, matrix_palette, build=lambda: graph_utils.plot_heatmap_grid(h, pl_template, palette_name=matrix_palette, cube=cube_v))
+                else:
+                    fig = memo_fig(h, show_v, common_labels, pl_template, matrix_palette,
+                                   build=lambda: graph_utils.plot_heatmap(None, h, show_v, common_labels, pl_template, palette_name=matrix_palette, cube=cube_v))
                 st.plotly_chart(fig, use_container_width=True)
 
             elif nav == "tab_pq": 
                 st.markdown(t("desc_pq"), unsafe_allow_html=True)
                 pq_lbl = {"p": "P (Активна)", "q": "Q (Реактивна)", "bw": bw}
                 show_lbls = st.session_state.get("show_pq_labels", False)
-                fig = graph_utils.plot_pq_scatter(df_v, h, True, l_pos, bw, pq_lbl, pl_template, palette_name=current_palette, custom_colors=cust_colors, show_labels=show_lbls)
+                fig = memo_fig(h, l_pos, bw, pq_lbl, pl_template, current_palette, cust_colors, show_lbls,
+                               build=lambda: graph_utils.plot_pq_scatter(None, h, True, l_pos, bw, pq_lbl, pl_template, palette_name=current_palette, custom_colors=cust_colors, show_labels=show_lbls, cube=cube_v))
                 st.plotly_chart(fig, use_container_width=True)
             
             # --- НОВА ВКЛАДКА "РОЗПОДІЛ" ---
@@ -523,7 +719,8 @@ else:
                 st.markdown(t("desc_dist"), unsafe_allow_html=True)
                 dist_mode = st.radio("Групування:", ["По годинах доби (0-23)", "По днях тижня (Пн-Нд)"], horizontal=True)
                 group_key = 'Hour' if "годинах" in dist_mode else 'DayOfWeek'
-                fig = graph_utils.plot_violin_distribution(df_v, h, group_key, pl_template, palette_name=current_palette, custom_colors=cust_colors, labels=common_labels)
+                fig = memo_fig(h, group_key, pl_template, current_palette, cust_colors, common_labels,
+                               build=lambda: graph_utils.plot_violin_distribution(None, h, group_key, pl_template, palette_name=current_palette, custom_colors=cust_colors, labels=common_labels, cube=cube_v))
                 st.plotly_chart(fig, use_container_width=True)
             
             elif nav == "tab_table":
@@ -538,8 +735,7 @@ else:
                     display_df = df_v[cols_to_show].copy().rename(columns=col_map)
                     include_idx = False
                 else:
-                    pivot = df_v.pivot_table(index="DateTime", columns=["MeterID", "Type"], values="Value")
-                    pivot.columns = [f"{m} - {t.split('(')[0]}" for m, t in pivot.columns]
+                    pivot = cube_v.wide_frame()
                     pivot.index.name = col_map["DateTime"]
                     display_df = pivot
                     include_idx = True
@@ -547,4 +743,80 @@ else:
                 st.dataframe(display_df, use_container_width=True, height=600)
                 st.download_button("📥 Завантажити Excel", export_utils.export_excel_bytes(display_df, include_index=include_idx), "data.xlsx")
 
+            elif nav == "tab_coverage":
+                st.markdown(t("desc_coverage"), unsafe_allow_html=True)
+                cov = load_coverage(sel_m, sel_t, *sel_d) if len(sel_d) == 2 else load_coverage(sel_m, sel_t)
+                summ = cov.summary_frame()
+                k1, k2, k3 = st.columns(3)
+                k1.metric("Повнота", f"{cov.completeness() * 100:.1f}%")
+                k2.metric("Неповних серій-діб", int(summ["Неповних діб"].sum()))
+                k3.metric("Серій-діб без даних", int(summ["Діб без даних"].sum()))
+                st.plotly_chart(graph_utils.plot_coverage_heatmap(cov, h, pl_template), use_container_width=True)
+                c_m, c_d = st.columns([1, 3])
+                m_sel = c_m.selectbox("Лічильник", cov.meters())
+                if m_sel:
+                    miss = cov.missing_days(m_sel)
+                    part = [d for d in cov.missing_days(m_sel, partial=True) if d not in set(miss)]
+                    c_d.markdown(f"**Доби без даних ({len(miss)}):** " + (", ".join(d.strftime("%d.%m.%Y") for d in miss) or "—"))
+                    c_d.markdown(f"**Неповні доби ({len(part)}):** " + (", ".join(d.strftime("%d.%m.%Y") for d in part) or "—"))
+                st.dataframe(summ, use_container_width=True, hide_index=True)
+
+            elif nav == "tab_tariff":
+                st.markdown(t("desc_tariff"), unsafe_allow_html=True)
+                presets = list(tariff_utils.PRESETS)
+                c_p, c_z = st.columns([1, 3])
+                preset = c_p.selectbox("Тариф", presets, index=presets.index(st.session_state["tariff_preset"]))
+                zones = tariff_utils.PRESETS[preset]["zones"]
+                z_cols = c_z.columns(len(zones))
+                prices = {z: z_cols[i].number_input(f"{z}, грн/кВт·год", min_value=0.0, value=float(p), step=0.01, format="%.2f", key=f"tariff_{preset}_{z}")
+                          for i, (z, p) in enumerate(zones.items())}
+                tariff = tariff_utils.with_prices(preset, prices)
+                st.session_state["tariff_preset"], st.session_state["tariff"] = preset, tariff
+                st.caption(tariff_utils.describe(tariff))
+                # Календар зон спільний для всіх лічильників (tariff_utils); розрахунок - за вибіркою і тарифом
+                bill_df = pipeline_utils.run("tariff", view_sig + pipeline_utils.signature(tariff), lambda: tariff_utils.bill(cube_v, tariff))
+                if bill_df.empty: st.info("У вибірці немає каналів енергії для розрахунку.")
+                else:
+                    energy, cost = bill_df["Energy"].sum(), bill_df["Cost"].sum()
+                    k1, k2, k3 = st.columns(3)
+                    k1.metric("Енергія, кВт·год", f"{energy:,.0f}".replace(",", " "))
+                    k2.metric("Вартість, грн", f"{cost:,.2f}".replace(",", " "))
+                    k3.metric("Середня ціна, грн/кВт·год", f"{cost / energy:.2f}" if energy else "—")
+                    st.plotly_chart(graph_utils.plot_tariff_costs(bill_df, h, pl_template, current_palette, bw), use_container_width=True)
+                    summ = tariff_utils.summary(bill_df).rename(columns={"MeterID": "Лічильник", "Type": "Параметр"})
+                    st.dataframe(summ, use_container_width=True, hide_index=True)
+                    st.download_button("📥 Завантажити Excel", export_utils.export_excel_bytes(summ), "tariff.xlsx")
+
+            elif nav == "tab_peaks":
+                st.markdown(t("desc_peaks"), unsafe_allow_html=True)
+                chans = quality_utils.real(cube_v.types())
+                p1, p2, p3, p4 = st.columns([3, 2, 1, 1])
+                cons = [c for c in chans if "потребление" in c.lower()]
+                chan = p1.selectbox("Канал", chans, index=chans.index(cons[0]) if cons else 0)
+                top_n = p2.slider("Кількість піків", 5, 50, 10, 5)
+                window = p3.selectbox("Вікно", list(peak_utils.WINDOWS), index=1, format_func=peak_utils.WINDOWS.get)
+                by_month = p4.checkbox("Помісячно")
+                # Усі розрахунки - над кубом вибірки одного каналу: часткові сортування й ковзні вікна по всіх лічильниках разом
+                def peak_stats():
+                    cube_c = cube_v.select(None, [chan])
+                    coinc = peak_utils.coincident_peaks(cube_c, top_n)
+                    return cube_c, coinc, peak_utils.contributions(cube_c, coinc), peak_utils.top_peaks(cube_c, top_n, by_month), peak_utils.max_demand(cube_c, window, by_month)
+                cube_c, coinc, contrib, tops, md = pipeline_utils.run("peaks", view_sig + (chan, top_n, window, by_month), peak_stats)
+                if coinc.empty: st.info("Немає даних вибраного каналу.")
+                else:
+                    k1, k2, k3 = st.columns(3)
+                    k1.metric("Збіжний пік", f"{coinc['Total'].iloc[0]:,.1f}".replace(",", " "), f"{pd.Timestamp(coinc['DateTime'].iloc[0]):%d.%m.%Y %H:%M}", delta_color="off")
+                    k2.metric(f"Макс. потужність ({peak_utils.WINDOWS[window]})", f"{md['Demand'].max():,.1f}".replace(",", " ") if not md.empty else "—")
+                    k3.metric("Лічильників у піку", int(coinc["Meters"].iloc[0]))
+                    st.plotly_chart(graph_utils.plot_coincident_peaks(contrib, h, pl_template, current_palette, bw), use_container_width=True)
+                    peak_cols = {"MeterID": "Лічильник", "Type": "Параметр", "Month": "Місяць", "Rank": "№", "DateTime": "Дата та Час",
+                                 "Value": "Значення", "Demand": "Потужність", "Total": "Сума", "Meters": "Лічильників", "Contributors": "Найбільші внески"}
+                    st.markdown("**Збіжні піки**")
+                    st.dataframe(coinc.rename(columns=peak_cols), use_container_width=True, hide_index=True)
+                    c_top, c_md = st.columns(2)
+                    c_top.markdown("**Найбільші піки лічильників**")
+                    c_top.dataframe(tops.drop(columns="Suffix").rename(columns=peak_cols), use_container_width=True, hide_index=True, height=400)
+                    c_md.markdown(f"**Максимальна потужність за вікно {peak_utils.WINDOWS[window]}**")
+                    c_md.dataframe(md.drop(columns="Suffix").rename(columns=peak_cols), use_container_width=True, hide_index=True, height=400)
+
     ui.render_footer()
\ No newline at end of file
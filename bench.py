@@ -0,0 +1,394 @@
+import os
+import gc
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+from collections import namedtuple
+from datetime import datetime
+
+# Кеш парсера - у тимчасовий каталог, щоб бенчмарк не чіпав робочий .askue_cache
+_CACHE_TMP = tempfile.mkdtemp(prefix="askue_bench_")
+os.environ["ASKUE_CACHE_DIR"] = _CACHE_TMP
+
+import numpy as np
+import pandas as pd
+import plotly
+import parser
+import ingest_utils
+import graph_utils
+import export_utils
+import selection_utils
+import pipeline_utils
+import anomaly_utils
+import quality_utils
+import virtual_utils
+import tariff_utils
+import compare_utils
+import forecast_utils
+import peak_utils
+import synth_utils
+import schema_utils
+
+# Наскрізний бенчмарк: синтетичні файли 30917 -> парсинг -> злиття -> фільтр/аномалії -> графіки -> PDF.
+# Кожен етап міряється за часом (найкращий з --repeat) і за піком пам'яті (tracemalloc, окремий прохід).
+# Результат - JSON для порівняння між версіями (--compare).
+#
+#   python bench.py                                  # 10/100/1000 лічильників × 30/365 діб
+#   python bench.py --meters 10 100 --days 30        # менша сітка
+#   python bench.py --stages parse_cube plot_heatmap # лише вибрані етапи
+#   python bench.py --compare old.json               # код виходу 1, якщо є регресії
+
+DEFAULT_METERS = [10, 100, 1000]
+DEFAULT_DAYS = [30, 365]
+VIEW_METERS = 20  # скільки лічильників "вибрано у фільтрі" для графіків, як у реальній сесії
+LONG_VIEW = (VIEW_METERS, 365)  # лічильників × діб для етапів plot_30min_long*: не залежать від сітки --meters/--days
+CHART = dict(height=500, template="plotly_white", labels={"x": "Дата і час", "y": "Значення", "bw": False})
+
+Stage = namedtuple("Stage", ["name", "run", "setup", "describe"])
+
+# --- ЕТАПИ ---
+# run(ctx) - те, що міряється; setup(ctx) - підготовка поза заміром; describe(ctx, result) - розміри для звіту
+def _generate(ctx):
+    return synth_utils.generate_files(ctx["meters"], ctx["days"], header="mixed", gap_rate=0.001, seed=ctx["seed"])
+
+def _describe_files(ctx, files):
+    ctx["files"] = files
+    return {"files": len(files), "input_mb": round(sum(len(f[1]) for f in files) / 2**20, 2)}
+
+def _parse_frame(ctx):
+    return parser.parse_askue_files.__wrapped__(ctx["files"], compact=True, use_cache=False)
+
+def _describe_frame(ctx, res):
+    df = res[0]
+    return {"rows": len(df), "frame_mb": round(df.memory_usage(deep=True).sum() / 2**20, 2)}
+
+def _parse_cube(ctx):
+    return parser.parse_askue_cube.__wrapped__(ctx["files"], use_cache=False)
+
+def _describe_cube(ctx, res):
+    ctx["cube"] = res[0]
+    return {"series": res[0].n_series, "cube_days": res[0].n_days, "cube_mb": round(res[0].nbytes / 2**20, 2)}
+
+def _fill_cache(ctx):
+    parser.parse_askue_cube.__wrapped__(ctx["files"], use_cache=True)
+
+def _parse_cube_cached(ctx):
+    return parser.parse_askue_cube.__wrapped__(ctx["files"], use_cache=True)
+
+def _parse_stream(ctx):
+    return parser.parse_askue_stream_cube(ingest_utils.iter_bytes(ctx["files"]), use_cache=False)
+
+def _split_last_day(ctx):
+    # Історія без останньої доби + нова доба - типове натискання "додати файли"
+    last = max(f[0][-12:] for f in ctx["files"])
+    old = [f for f in ctx["files"] if not f[0].endswith(last)]
+    new = [f for f in ctx["files"] if f[0].endswith(last)]
+    ctx["merge_base"] = parser.parse_askue_cube.__wrapped__(old, use_cache=False)[0]
+    ctx["merge_new"] = parser.parse_askue_cube.__wrapped__(new, use_cache=False)[0]
+
+def _merge(ctx):
+    return ctx["merge_base"].merge(ctx["merge_new"])
+
+def _anomaly_engine(ctx):
+    # Шар аномалій усього набору: база (медіана/MAD за годиною тижня) + прапорці, без кешу куба
+    cube = ctx["cube"]
+    return anomaly_utils.Baseline.from_cube(cube).flags(cube)
+
+def _derive_quality(ctx):
+    # Усі похідні канали якості (S, cos φ, tg φ, понад tg φ) для всього набору, без кешу куба
+    cube = ctx["cube"]
+    return [quality_utils.derive(cube, sfx) for sfx in sorted(quality_utils.available(cube.suffixes()))]
+
+def _virtual_meters(ctx):
+    # Фідер із суми/різниці всіх лічильників і нетто одного лічильника - формули з десятками доданків
+    cube = ctx["cube"]
+    meters = cube.meters()
+    feeder = " + ".join(meters[:-1]) + f" - {meters[-1]}" if len(meters) > 1 else meters[0]
+    defs = [{"name": "Фідер", "formula": feeder}, {"name": "Нетто", "formula": f"{meters[0]}:1 - {meters[0]}:2"}]
+    return virtual_utils.evaluate(cube, defs)
+
+def _compare_periods(ctx):
+    # Останні 4 тижні набору проти всіх зсувів compare_utils: вирівнювання зрізами осі днів і зведення різниць
+    cube = ctx["cube"]
+    base = cube.select(None, None, cube.day0 + max(cube.n_days - 28, 0))
+    comp = compare_utils.Comparison.build(base, lambda a, b: cube.select(None, None, a, b), list(compare_utils.SHIFTS))
+    return comp.summary()
+
+def _forecast_fit(ctx):
+    # Модель прогнозу для всіх серій набору (без кешу куба) і прогноз на тиждень
+    model = forecast_utils.Model.fit(ctx["cube"])
+    return model.frame(7)
+
+def _peak_analytics(ctx):
+    # Панель піків для активного споживання всього набору: 10 збіжних піків, піки й годинна потужність кожного лічильника помісячно
+    cube = ctx["cube"]
+    chan = cube.select(None, [schema_utils.TYPE_LABELS[2]])
+    return peak_utils.coincident_peaks(chan), peak_utils.top_peaks(chan, 10, by_month=True), peak_utils.max_demand(chan, 2, by_month=True)
+
+def _tariff_billing(ctx):
+    # Тризонний сезонний тариф для всього набору (перший прохід рахує й погодинний рівень піраміди)
+    return tariff_utils.bill(ctx["cube"], tariff_utils.PRESETS["Тризонний сезонний"])
+
+def _filter_anomaly(ctx):
+    # Те саме, що блок фільтра та шар аномалій в app.py для вкладки 30 хв
+    cube = ctx["cube"]
+    d0, d1 = cube.date_range()
+    cube_v = cube.select(cube.meters()[:VIEW_METERS], quality_utils.real(cube.types()), d0, d1)
+    df_v = pipeline_utils.anomaly_frame(cube_v.to_frame(compact=True, order="series"), cube_v)
+    return cube_v, df_v
+
+def _describe_view(ctx, res):
+    ctx["cube_v"], ctx["df_v"] = res
+    return {"view_rows": len(res[1])}
+
+def _resample_1h(ctx):
+    # Гілка app.py для деталізації 1 год: рівень піраміди агрегатів (з побудовою, якщо ще не було)
+    return pipeline_utils.rollup_frame(ctx["cube_v"], "1h")
+
+def _describe_fig(ctx, fig):
+    return {"traces": len(fig.data), "payload_mb": round(len(fig.to_json()) / 2**20, 2)}
+
+def _plot_30min(ctx):
+    return graph_utils.plot_30min_graph(ctx["df_v"], CHART["height"], 2, False, True, "Line", "top", False, CHART["labels"], CHART["template"])
+
+def _plot_30min_downsampled(ctx):
+    # Те, що вкладка графіка 30 хв віддає браузеру: проріджена таблиця (кошики min/max) і фігура з неї
+    return graph_utils.plot_30min_graph(pipeline_utils.downsample(ctx["df_v"]), CHART["height"], 2, False, True, "Line", "top", False, CHART["labels"], CHART["template"])
+
+def _setup_long_view(ctx):
+    # Довга вибірка кількох лічильників (рік 30-хв точок на серію) - випадок, для якого проріджування й існує
+    if "df_long" in ctx: return
+    cube, _, _ = parser.parse_askue_cube.__wrapped__(synth_utils.generate_files(LONG_VIEW[0], LONG_VIEW[1], seed=ctx["seed"]), use_cache=False)
+    cube_l = cube.select(None, [schema_utils.TYPE_LABELS[2]])
+    ctx["df_long"] = pipeline_utils.anomaly_frame(cube_l.to_frame(compact=True, order="series"), cube_l)
+
+def _plot_30min_long(ctx):
+    return graph_utils.plot_30min_graph(ctx["df_long"], CHART["height"], 2, False, True, "Line", "top", False, CHART["labels"], CHART["template"])
+
+def _plot_30min_long_downsampled(ctx):
+    return graph_utils.plot_30min_graph(pipeline_utils.downsample(ctx["df_long"]), CHART["height"], 2, False, True, "Line", "top", False, CHART["labels"], CHART["template"])
+
+def _plot_daily(ctx):
+    return graph_utils.plot_daily_bar(None, CHART["height"], "top", CHART["labels"], CHART["template"], cube=ctx["cube_v"])
+
+def _plot_heatmap(ctx):
+    return graph_utils.plot_heatmap(None, CHART["height"], False, CHART["labels"], CHART["template"], cube=ctx["cube_v"])
+
+def _plot_heatmap_grid(ctx):
+    # Сітка малих теплових карт - по одній на серію вибірки
+    return graph_utils.plot_heatmap_grid(CHART["height"], CHART["template"], cube=ctx["cube_v"])
+
+def _plot_pq(ctx):
+    return graph_utils.plot_pq_scatter(None, CHART["height"], True, "top", False, {"p": "P", "q": "Q", "bw": False}, CHART["template"], cube=ctx["cube_v"])
+
+def _plot_violin(ctx):
+    return graph_utils.plot_violin_distribution(None, CHART["height"], "Hour", CHART["template"], labels=CHART["labels"], cube=ctx["cube_v"])
+
+def _dashboard(ctx):
+    # Шлях перезапуску вкладки графіка (крок 1 год) через конвеєр: вибірка -> KPI -> агрегати -> фігура
+    cube = ctx["cube"]
+    meters, types, period = cube.meters()[:VIEW_METERS], quality_utils.real(cube.types()), cube.date_range()
+    sig = pipeline_utils.signature(False, cube.version, meters, types, period)
+    cube_v = pipeline_utils.run("view", sig, lambda: cube.select(meters, types, *period))
+    kpi = pipeline_utils.run("kpi", sig, lambda: pipeline_utils.kpis(cube_v))
+    plot_df = pipeline_utils.run("plot_frame", sig + ("1h",), lambda: pipeline_utils.rollup_frame(cube_v, "1h"))
+    fig = pipeline_utils.run("figure", sig + ("1h",), lambda: graph_utils.plot_30min_graph(
+        plot_df, CHART["height"], 2, False, True, "Line", "top", False, CHART["labels"], CHART["template"]))
+    return kpi, fig
+
+def _dashboard_cold(ctx):
+    pipeline_utils.clear()
+    return _dashboard(ctx)
+
+def _dashboard_warm(ctx):
+    pipeline_utils.clear()
+    _dashboard(ctx)
+
+def _selection_stats(ctx):
+    # Перше виділення середньої третини періоду на графіку 30 хв: побудова індексу + запит
+    lo, hi = ctx["df_v"]["DateTime"].min(), ctx["df_v"]["DateTime"].max()
+    span = (hi - lo) / 3
+    return selection_utils.compute_detailed_selection_stats(ctx["df_v"], [lo + span, hi - span])
+
+def _build_range_index(ctx):
+    ctx["range_index"] = selection_utils.RangeIndex.from_frame(ctx["df_v"])
+
+def _selection_query(ctx):
+    # Повторне виділення на тому ж графіку: запит до вже побудованого індексу
+    lo, hi = ctx["df_v"]["DateTime"].min(), ctx["df_v"]["DateTime"].max()
+    span = (hi - lo) / 3
+    return ctx["range_index"].query(lo + span, hi - span)
+
+def _export_pdf(ctx):
+    cube = ctx["cube"]
+    meters = cube.meters()[:5]
+    cfg = {"title": "Бенчмарк", "dates": cube.date_range(), "blocks": [
+        {"type": t, "title": t, "meters": meters, "types": quality_utils.real(cube.types())}
+        for t in ("stats", "graph_30m", "graph_daily", "graph_matrix")]}
+    info = [{"name": f[0], "size": ""} for f in ctx["files"][:20]]
+    return export_utils.export_custom_pdf(None, info, cfg, cube=cube)
+
+def _describe_pdf(ctx, pdf):
+    return {"pdf_kb": round(len(pdf) / 1024, 1)}
+
+STAGES = [
+    Stage("generate", _generate, None, _describe_files),
+    Stage("parse_frame", _parse_frame, None, _describe_frame),
+    Stage("parse_cube", _parse_cube, None, _describe_cube),
+    Stage("parse_cube_cached", _parse_cube_cached, _fill_cache, None),
+    Stage("parse_stream", _parse_stream, None, None),
+    Stage("merge_new_data", _merge, _split_last_day, None),
+    Stage("anomaly_engine", _anomaly_engine, None, lambda ctx, r: {"anomalies": int(r.sum())}),
+    Stage("derive_quality", _derive_quality, None, lambda ctx, r: {"series": sum(c.n_series for c in r)}),
+    Stage("virtual_meters", _virtual_meters, None, lambda ctx, r: {"series": r.n_series}),
+    Stage("compare_periods", _compare_periods, None, lambda ctx, r: {"rows": len(r)}),
+    Stage("forecast_fit", _forecast_fit, None, lambda ctx, r: {"rows": len(r)}),
+    Stage("peak_analytics", _peak_analytics, None, lambda ctx, r: {"rows": sum(len(x) for x in r)}),
+    Stage("tariff_billing", _tariff_billing, None, lambda ctx, r: {"rows": len(r)}),
+    Stage("filter_anomaly", _filter_anomaly, None, _describe_view),
+    Stage("resample_1h", _resample_1h, None, lambda ctx, r: {"rows": len(r)}),
+    Stage("plot_30min", _plot_30min, None, _describe_fig),
+    Stage("plot_30min_downsampled", _plot_30min_downsampled, None, _describe_fig),
+    Stage("plot_30min_long", _plot_30min_long, _setup_long_view, _describe_fig),
+    Stage("plot_30min_long_downsampled", _plot_30min_long_downsampled, _setup_long_view, _describe_fig),
+    Stage("plot_daily", _plot_daily, None, _describe_fig),
+    Stage("plot_heatmap", _plot_heatmap, None, _describe_fig),
+    Stage("plot_heatmap_grid", _plot_heatmap_grid, None, _describe_fig),
+    Stage("plot_pq", _plot_pq, None, _describe_fig),
+    Stage("plot_violin", _plot_violin, None, _describe_fig),
+    Stage("selection_stats", _selection_stats, None, None),
+    Stage("selection_query", _selection_query, _build_range_index, None),
+    Stage("dashboard_cold", _dashboard_cold, None, None),
+    Stage("dashboard_rerun", _dashboard, _dashboard_warm, None),
+    Stage("export_pdf", _export_pdf, None, _describe_pdf),
+]
+# Етапи, без результату яких наступні не запускаються
+REQUIRED = {"generate", "parse_cube", "filter_anomaly"}
+
+# --- ЗАМІРИ ---
+def _time_stage(stage, ctx, repeat):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        result = None
+        gc.collect()
+        t0 = time.perf_counter()
+        result = stage.run(ctx)
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+def _peak_stage(stage, ctx):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        stage.run(ctx)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def run_size(n_meters, n_days, stages, repeat=1, memory=True, seed=0, log=print):
+    """Прогін усіх вибраних етапів для одного розміру; повертає список записів звіту."""
+    ctx = {"meters": n_meters, "days": n_days, "seed": seed}
+    out = []
+    for stage in STAGES:
+        if stage.name not in stages and stage.name not in REQUIRED: continue
+        rec = {"stage": stage.name, "meters": n_meters, "days": n_days}
+        try:
+            if stage.setup: stage.setup(ctx)
+            rec["seconds"], result = _time_stage(stage, ctx, repeat)
+            if stage.describe: rec.update(stage.describe(ctx, result))
+            del result
+            if memory: rec["peak_mb"] = round(_peak_stage(stage, ctx) / 2**20, 2)
+        except MemoryError:
+            rec["error"] = "MemoryError"
+        except Exception as e:
+            rec["error"] = f"{type(e).__name__}: {e}"
+        if "error" in rec and stage.name in REQUIRED:
+            log(_format_row(rec))
+            out.append(rec)
+            break
+        if stage.name in stages:
+            log(_format_row(rec))
+            out.append(rec)
+    return out
+
+def _format_row(rec):
+    if "error" in rec:
+        return f"{rec['meters']:>6} × {rec['days']:<4} {rec['stage']:<18} ПОМИЛКА {rec['error']}"
+    extra = ", ".join(f"{k}={v}" for k, v in rec.items() if k not in ("stage", "meters", "days", "seconds", "peak_mb"))
+    peak = f"{rec['peak_mb']:>9.1f} MB" if "peak_mb" in rec else " " * 12
+    return f"{rec['meters']:>6} × {rec['days']:<4} {rec['stage']:<18} {rec['seconds'] * 1000:>10.1f} ms {peak}  {extra}"
+
+def _meta():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        commit = ""
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "plotly": plotly.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+# --- ПОРІВНЯННЯ ---
+def compare(report, baseline, threshold=1.2, min_seconds=0.005):
+    """Записи, що стали повільнішими за threshold (і не коротші за min_seconds - шум таймера)."""
+    old = {(r["stage"], r["meters"], r["days"]): r for r in baseline.get("results", []) if "seconds" in r}
+    regressions = []
+    for r in report["results"]:
+        b = old.get((r["stage"], r["meters"], r["days"]))
+        if b is None or "seconds" not in r: continue
+        if r["seconds"] < min_seconds and b["seconds"] < min_seconds: continue
+        ratio = r["seconds"] / max(b["seconds"], 1e-9)
+        if ratio > threshold:
+            regressions.append({"stage": r["stage"], "meters": r["meters"], "days": r["days"],
+                                "old": b["seconds"], "new": r["seconds"], "ratio": round(ratio, 2)})
+    return regressions
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Наскрізний бенчмарк АСКОЕ на синтетичних файлах 30917")
+    ap.add_argument("--meters", type=int, nargs="+", default=DEFAULT_METERS)
+    ap.add_argument("--days", type=int, nargs="+", default=DEFAULT_DAYS)
+    ap.add_argument("--stages", nargs="+", default=[s.name for s in STAGES], choices=[s.name for s in STAGES])
+    ap.add_argument("--repeat", type=int, default=1, help="повторів на етап (береться найкращий час)")
+    ap.add_argument("--no-memory", action="store_true", help="без проходу tracemalloc")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default="bench_report.json")
+    ap.add_argument("--compare", help="попередній звіт для пошуку регресій")
+    ap.add_argument("--threshold", type=float, default=1.2)
+    args = ap.parse_args(argv)
+
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    report = {"meta": _meta(), "results": []}
+    try:
+        for n_days in args.days:
+            for n_meters in args.meters:
+                report["results"] += run_size(n_meters, n_days, set(args.stages), args.repeat,
+                                              not args.no_memory, args.seed)
+    finally:
+        shutil.rmtree(_CACHE_TMP, ignore_errors=True)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            report["regressions"] = compare(report, json.load(f), args.threshold)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    print(f"Звіт: {args.out}")
+    for r in report.get("regressions", []):
+        print(f"РЕГРЕСІЯ {r['stage']} {r['meters']}×{r['days']}: {r['old'] * 1000:.1f} -> {r['new'] * 1000:.1f} ms (×{r['ratio']})")
+    return 1 if report.get("regressions") else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
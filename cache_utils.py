@@ -0,0 +1,100 @@
+import os
+import hashlib
+import datetime
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+except ImportError:  # без pyarrow кеш просто вимкнений
+    pa = ipc = None
+
+# Кеш розібраних файлів на диску: ключ = SHA-256 вмісту + місяць контексту.
+# Формат - Arrow IPC (Feather v2, lz4): колонковий і читається через memory map
+CACHE_DIR = os.environ.get("ASKUE_CACHE_DIR", ".askue_cache")
+CACHE_MAX_MB = float(os.environ.get("ASKUE_CACHE_MAX_MB", 512))
+CACHE_FORMAT = 2  # 2: відсутні поля - NaN (раніше 0.0); зміна формату блоку робить старі записи недосяжними
+SLOTS = 48
+
+def is_enabled() -> bool:
+    return ipc is not None
+
+def file_key(b: bytes, context_date) -> str:
+    """
+    Ключ файлу. Від дати контексту залежить лише рік для заголовків MMDD
+    (з корекцією на стику років), тому в ключ іде тільки рік-місяць.
+    """
+    return f"{hashlib.sha256(b).hexdigest()}_{context_date:%Y%m}_v{CACHE_FORMAT}"
+
+def stream_key(stream, context_date, chunk_size=1 << 20) -> str:
+    """Той самий ключ, що й file_key, але вміст хешується порціями з потоку."""
+    h = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(chunk_size), b""):
+        h.update(chunk)
+    return f"{h.hexdigest()}_{context_date:%Y%m}_v{CACHE_FORMAT}"
+
+def _path(key, cache_dir):
+    return os.path.join(cache_dir, key[:2], f"{key}.arrow")
+
+def load_block(key: str, cache_dir=CACHE_DIR):
+    """Блок з кешу або None. Звернення оновлює mtime (для LRU-витіснення)."""
+    if not is_enabled(): return None
+    path = _path(key, cache_dir)
+    if not os.path.exists(path): return None
+    try:
+        with pa.memory_map(path) as src:
+            table = ipc.open_file(src).read_all()
+        meta = table.schema.metadata or {}
+        values = table.column("Values").combine_chunks().flatten().to_numpy(zero_copy_only=False)
+        block = {
+            "date": datetime.date.fromisoformat(meta[b"date"].decode()),
+            "meters": table.column("MeterID").to_pylist(),
+            "suffixes": table.column("Suffix").to_numpy().astype(np.int64),
+            "values": values.reshape(-1, SLOTS).astype(np.float64),
+        }
+        os.utime(path)
+        return block
+    except Exception:
+        # Пошкоджений запис - видаляємо, файл буде розібрано заново
+        try: os.unlink(path)
+        except OSError: pass
+        return None
+
+def save_block(key: str, block: dict, cache_dir=CACHE_DIR):
+    """Записує блок атомарно (через тимчасовий файл). Витіснення - окремо, раз на пакет (evict)."""
+    if not is_enabled(): return
+    path = _path(key, cache_dir)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        values = pa.array(np.ascontiguousarray(block["values"], dtype=np.float64).ravel())
+        table = pa.table({
+            "MeterID": pa.array(list(block["meters"]), type=pa.string()),
+            "Suffix": pa.array(np.asarray(block["suffixes"], dtype=np.int8)),
+            "Values": pa.FixedSizeListArray.from_arrays(values, SLOTS),
+        }).replace_schema_metadata({"date": block["date"].isoformat()})
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with ipc.new_file(tmp, table.schema, options=ipc.IpcWriteOptions(compression="lz4")) as writer:
+            writer.write_table(table)
+        os.replace(tmp, path)
+    except Exception:
+        pass
+
+def evict(max_mb=CACHE_MAX_MB, cache_dir=CACHE_DIR):
+    """Видаляє найдавніше використані записи, поки кеш більший за max_mb."""
+    entries = []
+    for root, _, names in os.walk(cache_dir):
+        for n in names:
+            if not n.endswith(".arrow"): continue
+            p = os.path.join(root, n)
+            try:
+                st = os.stat(p)
+                entries.append((st.st_mtime, st.st_size, p))
+            except OSError: pass
+    total = sum(e[1] for e in entries)
+    limit = max_mb * 2**20
+    for _, size, p in sorted(entries):
+        if total <= limit: break
+        try:
+            os.unlink(p)
+            total -= size
+        except OSError: pass
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+from cube_utils import SeriesCube
+
+# Порівняння періодів: інший період - та сама вибірка, зсунута на ціле число тижнів, тож доба i базового
+# періоду стоїть навпроти доби того ж дня тижня, а півгодина - навпроти тієї ж півгодини.
+# Вирівнювання - зріз масиву values[серії, доби, 48] зі зсувом осі днів; різниці - арифметика масивів, без join.
+SHIFTS = {"Попередній тиждень": 7, "2 тижні тому": 14, "4 тижні тому": 28, "Рік тому (52 тижні)": 364}
+
+def period(cube, shift):
+    """(перша, остання) доба періоду порівняння для осі днів куба."""
+    d0 = cube.day0 - np.timedelta64(shift, "D")
+    return d0.astype(object), (d0 + np.timedelta64(cube.n_days - 1, "D")).astype(object)
+
+def align(base, other, shift):
+    """
+    Куб other на осі base: ті самі серії й доби, доба i <- доба (base.day0 + i - shift) з other.
+    Серії, яких в other немає, і доби поза other - NaN.
+    """
+    values = np.full(base.values.shape, np.nan, np.float32)
+    pairs = [(i, other.series_index(m, s)) for i, (m, s) in enumerate(base.series)] if other.n_days else []
+    pairs = np.array([p for p in pairs if p[1] is not None], dtype=np.int64).reshape(-1, 2)
+    if len(pairs):
+        off = int((other.day0 - (base.day0 - np.timedelta64(shift, "D"))).astype(np.int64))
+        a, b = max(off, 0), min(off + other.n_days, base.n_days)
+        if a < b: values[pairs[:, 0], a:b] = other.values[pairs[:, 1], a - off:b - off]
+    return SeriesCube(list(base.series), base.day0, values, ~np.isnan(values))
+
+class Comparison:
+    """Базова вибірка й вирівняні з нею періоди порівняння: {назва: (зсув у добах, куб на осі base)}."""
+    def __init__(self, base, periods):
+        self.base = base
+        self.periods = periods
+
+    @classmethod
+    def build(cls, base, load, labels):
+        """load(d_start, d_end) - вибірка тих самих серій за інший період (кешована вище)."""
+        periods = {}
+        for label in labels:
+            shift = SHIFTS[label]
+            periods[label] = (shift, align(base, load(*period(base, shift)), shift))
+        return cls(base, periods)
+
+    def delta(self, label):
+        """base - період, (серії, доби, 48); NaN, де немає хоч одного з двох."""
+        return self.base.values - self.periods[label][1].values
+
+    def pct(self, label):
+        """Зміна у відсотках від періоду порівняння; NaN, де він нульовий або відсутній."""
+        ref = self.periods[label][1].values
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(ref != 0, self.delta(label) / np.abs(ref) * 100, np.nan)
+
+    def summary(self):
+        """Рядок на серію × період: суми базового періоду й порівняння (лише спільні інтервали), Δ, Δ% і найбільша |Δ| за 30 хв."""
+        rows = []
+        names = [self.base.label(i) for i in range(self.base.n_series)]
+        for label, (shift, cube) in self.periods.items():
+            d = self.delta(label)
+            both = ~np.isnan(d)
+            n = both.sum(axis=(1, 2))
+            cur = np.where(both, self.base.values, 0).sum(axis=(1, 2), dtype=np.float64)
+            ref = np.where(both, cube.values, 0).sum(axis=(1, 2), dtype=np.float64)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                peak = np.nanmax(np.abs(np.where(both, d, np.nan)).reshape(len(names), -1), axis=1, initial=-np.inf)
+                rows.append(pd.DataFrame({
+                    "Серія": names, "Період": label, "Інтервалів": n,
+                    "Поточний": np.where(n > 0, cur, np.nan), "Порівняння": np.where(n > 0, ref, np.nan),
+                    "Δ": np.where(n > 0, cur - ref, np.nan), "Δ, %": np.where((n > 0) & (ref != 0), (cur - ref) / np.abs(ref) * 100, np.nan),
+                    "Макс. |Δ| за 30 хв": np.where(n > 0, peak, np.nan),
+                }))
+        return pd.concat(rows, ignore_index=True) if rows else pd.DataFrame()
+
+    def overlay_frames(self, res="30T"):
+        """[(назва, таблиця для графіка)] на осі часу базового періоду; SourceTime - справжній час інтервалу."""
+        out = []
+        for label, (shift, cube) in self.periods.items():
+            if cube.is_empty(): continue
+            df = cube.to_frame(order="series") if res == "30T" else cube.rollup(res).to_frame()
+            df["SourceTime"] = df["DateTime"] - pd.Timedelta(days=shift)
+            out.append((label, df))
+        return out
+
+    def daily_frames(self):
+        """[(назва, добові суми)] на осі діб базового періоду."""
+        return [(label, cube.daily_frame()) for label, (shift, cube) in self.periods.items() if not cube.is_empty()]
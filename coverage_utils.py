@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+import schema_utils
+
+# Індекс покриття: 1 біт на (серія, доба, слот) - чи є значення за півгодину.
+# 48 слотів = 6 байт на серію-добу; відсутній рядок у файлі й порожнє поле - однаково "немає даних"
+SLOTS = schema_utils.SLOTS
+TYPE_LABELS = schema_utils.TYPE_LABELS
+BYTES_PER_DAY = SLOTS // 8
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+
+class Coverage:
+    """bits[серія, доба, 6] (uint8, np.packbits по слотах); series - відсортований список (MeterID, Suffix)."""
+    def __init__(self, series, day0, bits):
+        self.series = list(series)
+        self.day0 = None if day0 is None else np.datetime64(day0, "D")
+        self.bits = bits
+        self._index = {s: i for i, s in enumerate(self.series)}
+
+    @classmethod
+    def empty(cls):
+        return cls([], None, np.zeros((0, 0, BYTES_PER_DAY), np.uint8))
+
+    @classmethod
+    def from_cube(cls, cube):
+        """З маски куба (SeriesCube.mask) - один packbits, без проходу по довгій таблиці."""
+        if cube.n_series == 0 or cube.day0 is None: return cls.empty()
+        return cls(cube.series, cube.day0, np.packbits(cube.mask, axis=2))
+
+    @classmethod
+    def from_rows(cls, meters, suffixes, days, bits):
+        """Рядки (лічильник, канал, доба, 6 байт) - формат збереження у сховищі."""
+        if not len(meters): return cls.empty()
+        key = pd.MultiIndex.from_arrays([np.asarray(meters, dtype=object), np.asarray(suffixes, dtype=np.int64)])
+        uniq = key.unique().sort_values()
+        code = uniq.get_indexer(key)
+        day0 = days.min()
+        di = (days - day0).astype(np.int64)
+        out = np.zeros((len(uniq), int(di.max()) + 1, BYTES_PER_DAY), np.uint8)
+        out[code, di] = bits
+        return cls(list(uniq), day0, out)
+
+    def to_rows(self):
+        """(meters, suffixes, days, bits) лише для серій-діб, де є хоч один біт."""
+        s_idx, d_idx = np.nonzero(self.bits.any(axis=2))
+        return ([self.series[i][0] for i in s_idx], np.array([self.series[i][1] for i in s_idx], dtype=np.int8),
+                self.day0 + d_idx, self.bits[s_idx, d_idx])
+
+    def update(self, other):
+        """Нова карта: рядки (серія, доба) з other замінюють наявні - other несе повне покриття своїх діб."""
+        if other.n_series == 0: return self
+        if self.n_series == 0: return other
+        series = sorted(set(self.series) | set(other.series))
+        day0 = min(self.day0, other.day0)
+        n_days = int((max(self.day0 + self.n_days, other.day0 + other.n_days) - day0).astype(np.int64))
+        out = np.zeros((len(series), n_days, BYTES_PER_DAY), np.uint8)
+        pos = {s: i for i, s in enumerate(series)}
+        for src in (self, other):
+            si = np.array([pos[s] for s in src.series], dtype=np.int64)
+            d = int((src.day0 - day0).astype(np.int64))
+            has = src.bits.any(axis=2)
+            win = out[si, d:d + src.n_days]
+            win[has] = src.bits[has]
+            out[si, d:d + src.n_days] = win
+        return Coverage(series, day0, out)
+
+    # --- ЗАПИТИ ---
+    @property
+    def n_series(self): return len(self.series)
+
+    @property
+    def n_days(self): return self.bits.shape[1]
+
+    def days(self):
+        return self.day0 + np.arange(self.n_days)
+
+    def meters(self):
+        return sorted({m for m, _ in self.series})
+
+    def select(self, meters=None, types=None, d_start=None, d_end=None):
+        if self.n_series == 0: return self
+        meters = None if meters is None else set(map(str, meters))
+        types = None if types is None else set(types)
+        idx = [i for i, (m, s) in enumerate(self.series)
+               if (meters is None or m in meters) and (types is None or TYPE_LABELS[s] in types)]
+        a = 0 if d_start is None else int(np.clip((np.datetime64(d_start, "D") - self.day0).astype(np.int64), 0, self.n_days))
+        b = self.n_days if d_end is None else int(np.clip((np.datetime64(d_end, "D") - self.day0).astype(np.int64) + 1, a, self.n_days))
+        return Coverage([self.series[i] for i in idx], self.day0 + a, self.bits[idx, a:b])
+
+    def counts(self):
+        """(серії, доби): скільки слотів з 48 мають дані (popcount по 6 байтах)."""
+        return _POPCOUNT[self.bits].sum(axis=2, dtype=np.int16)
+
+    def slot_mask(self, i, d):
+        """48 bool для серії i на добу d (індекси осей)."""
+        return np.unpackbits(self.bits[i, d]).astype(bool)
+
+    def completeness(self):
+        """Частка наявних інтервалів усієї вибірки (0..1)."""
+        if self.bits.size == 0: return 0.0
+        return float(self.counts().sum()) / (self.n_series * self.n_days * SLOTS)
+
+    def missing_days(self, meter, suffix=None, partial=False):
+        """
+        Доби без даних для лічильника (усі його канали або лише suffix) у межах періоду карти.
+        partial=True - також доби, де бракує частини інтервалів.
+        """
+        rows = [i for i, (m, s) in enumerate(self.series) if m == str(meter) and (suffix is None or s == suffix)]
+        if not rows: return []
+        c = _POPCOUNT[self.bits[rows]].sum(axis=2, dtype=np.int16)
+        bad = (c < SLOTS).any(axis=0) if partial else (c == 0).all(axis=0)
+        return list((self.day0 + np.flatnonzero(bad)).astype(object))
+
+    def missing_slots(self, meter, suffix, day):
+        """Мітки 'HH:MM' відсутніх інтервалів серії за добу."""
+        i = self._index.get((str(meter), suffix))
+        if i is None or self.day0 is None: return list(schema_utils.SLOT_LABELS)
+        d = int((np.datetime64(day, "D") - self.day0).astype(np.int64))
+        if not 0 <= d < self.n_days: return list(schema_utils.SLOT_LABELS)
+        return [schema_utils.SLOT_LABELS[k] for k in np.flatnonzero(~self.slot_mask(i, d))]
+
+    def summary_frame(self):
+        """По рядку на серію: повні / неповні / порожні доби, повнота %."""
+        c = self.counts()
+        return pd.DataFrame({
+            "MeterID": [m for m, _ in self.series],
+            "Type": [TYPE_LABELS[s] for _, s in self.series],
+            "Повних діб": (c == SLOTS).sum(axis=1),
+            "Неповних діб": ((c > 0) & (c < SLOTS)).sum(axis=1),
+            "Діб без даних": (c == 0).sum(axis=1),
+            "Повнота, %": np.round(c.sum(axis=1) / max(1, self.n_days * SLOTS) * 100, 1),
+        })
+
+    def gap_matrix(self):
+        """(мітки серій, доби, повнота % [серії × доби]) - для теплової карти пропусків."""
+        labels = [f"{m} {TYPE_LABELS[s].split('(')[0].strip()}" for m, s in self.series]
+        return labels, self.days(), self.counts() * (100.0 / SLOTS)
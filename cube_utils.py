@@ -0,0 +1,583 @@
+import itertools
+import numpy as np
+import pandas as pd
+import schema_utils
+import rollup_utils
+import anomaly_utils
+import quality_utils
+import forecast_utils
+
+SLOTS = schema_utils.SLOTS
+TYPE_LABELS = schema_utils.CHANNEL_LABELS  # разом з похідними каналами (quality_utils)
+LABEL_SUFFIX = {v: k for k, v in TYPE_LABELS.items()}
+US_PER_DAY = 24 * 60 * 60 * 1_000_000
+US_PER_SLOT = US_PER_DAY // SLOTS
+_versions = itertools.count(1)
+
+class SeriesCube:
+    """
+    Щільне сховище 30917: values[серія, доба, слот] (float32, NaN - немає даних) і mask - валідність.
+    series - відсортований список (MeterID, Suffix); day0 - перша доба осі днів (datetime64[D]).
+    Довга таблиця матеріалізується лише на вимогу (to_frame).
+    """
+    def __init__(self, series, day0, values, mask):
+        self.series = list(series)
+        self.day0 = None if day0 is None else np.datetime64(day0, "D")
+        self.values = values
+        self.mask = mask
+        self._index = {s: i for i, s in enumerate(self.series)}
+        self._bounds = None
+        # Похідні шари: піраміда агрегатів (рівень -> масиви у геометрії буферів), база й прапорці аномалій,
+        # модель прогнозу (кешуються з номером версії). Під-куб select() бере зріз шарів батька (_parent), доки той не змінився;
+        # куб stack() - шари своїх частин (_parts), тож серії вибірки не втрачають базу всього набору
+        self._roll, self._parent, self._parts = {}, None, None
+        self._base = self._flags = self._model = None
+        self._derived = {}
+        # Номер стану в межах процесу: змінюється з кожним update() - ключ для кешів похідних результатів
+        self.version = next(_versions)
+        # Буфери з запасом для update(): values/mask - їхні view [:n_series, _lo:_lo + n_days].
+        # Куб, побудований над чужими масивами (select), перед першим update копіюється
+        self._buf_v, self._buf_m, self._lo = values, mask, 0
+        self._frozen = False
+
+    def __getstate__(self):
+        # Без запасу буферів: у pickle (st.cache_data, session) іде лише видимий куб
+        return {"series": self.series, "day0": self.day0, "values": self.values, "mask": self.mask}
+
+    def __setstate__(self, state):
+        self.__init__(state["series"], state["day0"], state["values"], state["mask"])
+
+    # --- ПОБУДОВА ---
+    @classmethod
+    def empty(cls):
+        return cls([], None, np.empty((0, 0, SLOTS), np.float32), np.empty((0, 0, SLOTS), bool))
+
+    @classmethod
+    def from_lines(cls, meters, suffixes, days, values, dtype=np.float32):
+        """
+        Рядки 'серія × доба' (n, 48) -> куб. Дублікати (серія, доба): перемагає останній.
+        days - масив datetime64[D].
+        """
+        if not len(meters): return cls.empty()
+        key = pd.MultiIndex.from_arrays([np.asarray(meters, dtype=object), np.asarray(suffixes, dtype=np.int64)])
+        uniq = key.unique().sort_values()
+        code = uniq.get_indexer(key)
+        day0 = days.min()
+        di = (days - day0).astype(np.int64)
+        n_days = int(di.max()) + 1
+
+        # Останнє входження кожної пари (серія, доба)
+        lin = code * n_days + di
+        _, first_rev = np.unique(lin[::-1], return_index=True)
+        keep = len(lin) - 1 - first_rev
+
+        vals = np.full((len(uniq), n_days, SLOTS), np.nan, dtype=dtype)
+        mask = np.zeros((len(uniq), n_days, SLOTS), dtype=bool)
+        vals[code[keep], di[keep]] = values[keep]
+        # NaN у рядку - інтервал без даних
+        mask[code[keep], di[keep]] = ~np.isnan(values[keep])
+        return cls(list(uniq), day0, vals, mask)
+
+    @classmethod
+    def from_blocks(cls, blocks, dtype=np.float32):
+        """Заповнення прямо з блоків парсера (parser._parse_file)."""
+        blocks = [b for b in blocks if len(b["meters"])]
+        if not blocks: return cls.empty()
+        return cls.from_lines(
+            np.concatenate([np.asarray(b["meters"], dtype=object) for b in blocks]),
+            np.concatenate([b["suffixes"] for b in blocks]),
+            np.concatenate([np.full(len(b["meters"]), np.datetime64(b["date"], "D")) for b in blocks]),
+            np.concatenate([b["values"] for b in blocks]),
+            dtype=dtype,
+        )
+
+    @classmethod
+    def from_frame(cls, df, dtype=np.float32):
+        """Куб з довгої таблиці (повна або компактна схема)."""
+        if df.empty: return cls.empty()
+        ts = df["DateTime"].to_numpy().astype("datetime64[us]")
+        days = ts.astype("datetime64[D]")
+        slot = ((ts - days).astype(np.int64) // US_PER_SLOT).astype(np.int64)
+        key = pd.MultiIndex.from_arrays([df["MeterID"].astype(str).to_numpy(dtype=object), df["Suffix"].to_numpy(np.int64)])
+        uniq = key.unique().sort_values()
+        code = uniq.get_indexer(key)
+        day0 = days.min()
+        di = (days - day0).astype(np.int64)
+        vals = np.full((len(uniq), int(di.max()) + 1, SLOTS), np.nan, dtype=dtype)
+        mask = np.zeros(vals.shape, dtype=bool)
+        vals[code, di, slot] = df["Value"].to_numpy()
+        mask[code, di, slot] = df["Value"].notna().to_numpy()
+        return cls(list(uniq), day0, vals, mask)
+
+    @classmethod
+    def stack(cls, cubes):
+        """Куби з однією віссю днів і різними серіями -> один куб (серії впорядковуються)."""
+        cubes = [c for c in cubes if c.n_series] or cubes[:1]
+        if len(cubes) == 1: return cubes[0]
+        series = [s for c in cubes for s in c.series]
+        order = sorted(range(len(series)), key=series.__getitem__)
+        out = cls([series[i] for i in order], cubes[0].day0,
+                  np.concatenate([c.values for c in cubes])[order], np.concatenate([c.mask for c in cubes])[order])
+        out._parts = (cubes, order, [c.version for c in cubes])
+        return out
+
+    def merge(self, other):
+        """Новий куб - об'єднання; там, де other має дані, перемагає other."""
+        if other.is_empty(): return self
+        if self.is_empty(): return other
+        series = sorted(set(self.series) | set(other.series))
+        day0 = min(self.day0, other.day0)
+        day_end = max(self.day0 + self.n_days, other.day0 + other.n_days)
+        n_days = int((day_end - day0).astype(np.int64))
+        vals = np.full((len(series), n_days, SLOTS), np.nan, dtype=self.values.dtype)
+        mask = np.zeros(vals.shape, dtype=bool)
+        pos = {s: i for i, s in enumerate(series)}
+        for src in (self, other):
+            si = np.array([pos[s] for s in src.series])
+            d = int((src.day0 - day0).astype(np.int64))
+            sub_v, sub_m = vals[si, d:d + src.n_days], mask[si, d:d + src.n_days]
+            np.copyto(sub_v, src.values, where=src.mask)
+            sub_m |= src.mask
+            vals[si, d:d + src.n_days], mask[si, d:d + src.n_days] = sub_v, sub_m
+        return SeriesCube(series, day0, vals, mask)
+
+    def update(self, other):
+        """
+        Злиття на місці: там, де other має дані, перемагає other.
+        Ключ інтервалу (DateTime, MeterID, Type) - це координати (серія, доба, слот), тож перезапис
+        і вставка - присвоєння у вікно куба; копіюється лише пакет other, а не вся історія.
+        Осі днів і серій ростуть геометрично (запас у буфері), тому додавання доби - амортизовано O(пакет).
+        Нова серія посеред відсортованого списку - повна перебудова (рідкісний випадок).
+        Повертає (нових інтервалів, перезаписаних).
+        """
+        if self._frozen: raise ValueError("Куб спільний (freeze) - для змін потрібна власна копія: thaw()")
+        if other.is_empty(): return 0, 0
+        self._parent = self._parts = None
+        if self.is_empty():
+            self._adopt(other.copy())
+            return int(other.mask.sum()), 0
+        new = sorted(set(other.series) - set(self._index))
+        if new and new[0] < self.series[-1]:
+            # Вставка всередину осі серій - перебудова через merge
+            inserted = int(other.mask.sum()) - int(self._overlap(other).sum())
+            replaced = int(other.mask.sum()) - inserted
+            self._adopt(self.merge(other))
+            return inserted, replaced
+        self._reserve(len(self.series) + len(new), min(self.day0, other.day0),
+                      max(self.day0 + self.n_days, other.day0 + other.n_days))
+        if new:
+            for s in new: self._index[s] = len(self.series); self.series.append(s)
+            self._bounds = None
+            self._reshape_views()
+        si = np.array([self._index[s] for s in other.series], dtype=np.int64)
+        if len(si) and np.array_equal(si, np.arange(si[0], si[0] + len(si))): si = slice(int(si[0]), int(si[0]) + len(si))
+        d = int((other.day0 - self.day0).astype(np.int64))
+        win_v, win_m = self.values[si, d:d + other.n_days], self.mask[si, d:d + other.n_days]
+        replaced = int((win_m & other.mask).sum())
+        np.copyto(win_v, other.values, where=other.mask)
+        win_m |= other.mask
+        if not isinstance(si, slice):
+            # Fancy index дав копії - записуємо вікно назад
+            self.values[si, d:d + other.n_days], self.mask[si, d:d + other.n_days] = win_v, win_m
+        # Агрегати - лише для вікна пакета
+        for level in self._roll:
+            for k, v in rollup_utils.aggregate(win_v, win_m, level).items():
+                self._roll_view(level)[k][si, d:d + other.n_days] = v
+        self.version = next(_versions)
+        return int(other.mask.sum()) - replaced, replaced
+
+    def _overlap(self, other):
+        """Маска other.mask, що вже має дані в self (для лічильників merge)."""
+        out = np.zeros(other.mask.shape, dtype=bool)
+        d = int((other.day0 - self.day0).astype(np.int64))
+        a, b = max(0, -d), min(other.n_days, self.n_days - d)
+        if a >= b: return out
+        for j, s in enumerate(other.series):
+            i = self._index.get(s)
+            if i is not None: out[j, a:b] = self.mask[i, d + a:d + b] & other.mask[j, a:b]
+        return out
+
+    def copy(self):
+        return SeriesCube(self.series, self.day0, self.values.copy(), self.mask.copy())
+
+    def freeze(self):
+        """
+        Робить масиви лише для читання - для куба, спільного між сесіями (st.cache_resource).
+        select() дає view (теж лише для читання); update() спершу копіює буфери.
+        """
+        for a in (self.values, self.mask, self._buf_v, self._buf_m): a.flags.writeable = False
+        for bufs in self._roll.values():
+            for a in bufs.values(): a.flags.writeable = False
+        for _, cube in self._derived.values(): cube.freeze()
+        self._frozen = True
+        return self
+
+    @property
+    def is_frozen(self):
+        return self._frozen
+
+    def thaw(self):
+        """Власний куб сесії над тими самими буферами; копіюються вони лише при першому update()."""
+        out = SeriesCube(self.series, self.day0, self.values, self.mask)
+        out._roll = {level: self._roll_view(level) for level in self._roll}
+        return out
+
+    def _adopt(self, other):
+        """Перейняти стан іншого куба (його масиви мають належати лише йому)."""
+        self.series, self.day0, self._index, self._bounds = other.series, other.day0, other._index, None
+        self.values, self.mask = other.values, other.mask
+        self._buf_v, self._buf_m, self._lo = other._buf_v, other._buf_m, other._lo
+        self._roll, self._parent, self._parts = other._roll, other._parent, other._parts
+        self.version = next(_versions)
+
+    def _reshape_views(self, n_days=None):
+        end = self._lo + (self.n_days if n_days is None else n_days)
+        self.values = self._buf_v[:len(self.series), self._lo:end]
+        self.mask = self._buf_m[:len(self.series), self._lo:end]
+
+    def _reserve(self, n_series, day_lo, day_hi):
+        """Гарантує місце під n_series серій і доби [day_lo, day_hi); при нестачі - буфер з запасом ×2."""
+        cap_s, cap_d = self._buf_v.shape[:2]
+        buf_day0 = self.day0 - self._lo
+        front = int((buf_day0 - day_lo).astype(np.int64))
+        back = int((day_hi - (buf_day0 + cap_d)).astype(np.int64))
+        # Чужі (view) або заморожені (спільні між сесіями) буфери - копіюємо: copy-on-write
+        bufs = [self._buf_v, self._buf_m] + [a for r in self._roll.values() for a in r.values()]
+        owned = all(b.flags.owndata and b.flags.writeable for b in bufs)
+        if owned and n_series <= cap_s and front <= 0 and back <= 0:
+            self._set_days(day_lo, day_hi)
+            return
+        # Запас: удвічі по осях, що ростуть; попереду - лише якщо росте й початок
+        new_s = n_series if n_series <= cap_s else max(n_series, 2 * cap_s)
+        pad_front = max(front, 0) + (cap_d // 4 if front > 0 else 0)
+        pad_back = max(back, 0) + (cap_d if back > 0 else 0)
+        new_d = cap_d + pad_front + pad_back
+        vals = np.full((new_s, new_d, SLOTS), np.nan, dtype=self._buf_v.dtype)
+        mask = np.zeros((new_s, new_d, SLOTS), dtype=bool)
+        n, lo = len(self.series), self._lo + pad_front
+        vals[:n, lo:lo + self.n_days] = self.values
+        mask[:n, lo:lo + self.n_days] = self.mask
+        for level in self._roll:
+            grown = rollup_utils.empty_arrays(level, (new_s, new_d))
+            for k, a in self._roll_view(level).items(): grown[k][:n, lo:lo + self.n_days] = a
+            self._roll[level] = grown
+        self._buf_v, self._buf_m, self._lo = vals, mask, lo
+        self._set_days(day_lo, day_hi)
+
+    def _set_days(self, day_lo, day_hi):
+        """Розширює видиму вісь днів до [day_lo, day_hi) у межах буфера."""
+        day_lo, day_hi = min(day_lo, self.day0), max(day_hi, self.day0 + self.n_days)
+        self._lo -= int((self.day0 - day_lo).astype(np.int64))
+        self.day0 = day_lo
+        self._reshape_views(int((day_hi - day_lo).astype(np.int64)))
+
+    def _source(self):
+        """(батько, серії, a, b), якщо куб узято select() і батько відтоді не змінювався; інакше None."""
+        if self._parent is None: return None
+        parent, rows, a, b, version = self._parent
+        return (parent, rows, a, b) if parent.version == version else None
+
+    def _stacked(self):
+        """(частини, порядок рядків), якщо куб зібрано stack() і частини відтоді не змінювалися; інакше None."""
+        if self._parts is None: return None
+        cubes, order, versions = self._parts
+        return (cubes, order) if all(c.version == v for c, v in zip(cubes, versions)) else None
+
+    def _roll_view(self, level):
+        """Масиви рівня над видимими серіями й добами (view буферів)."""
+        return {k: a[:len(self.series), self._lo:self._lo + self.n_days] for k, a in self._roll[level].items()}
+
+    def rollup(self, level):
+        """
+        Рівень піраміди агрегатів ("1h", "2h", "4h", "D", "M") - rollup_utils.Rollup видимих серій і діб.
+        Рахується при першому запиті, далі update() оновлює лише вікно пакета.
+        Під-куб бере зріз рівня батька - піраміда рахується раз на набір, а не на кожен фільтр.
+        """
+        if level == "M": return self.rollup("D").by_month()
+        src = self._source()
+        if src:
+            parent, rows, a, b = src
+            return parent.rollup(level).take(rows, a, b)
+        if level not in self._roll:
+            bufs = rollup_utils.empty_arrays(level, self._buf_v.shape[:2])
+            for k, v in rollup_utils.aggregate(self.values, self.mask, level).items():
+                bufs[k][:self.n_series, self._lo:self._lo + self.n_days] = v
+                if self._frozen: bufs[k].flags.writeable = False
+            self._roll[level] = bufs
+        return rollup_utils.Rollup(self.series, self.days(), rollup_utils.LEVELS[level], self._roll_view(level))
+
+    def baseline(self):
+        """
+        База сезонного детектора (anomaly_utils.Baseline) для серій куба - з усього набору:
+        під-куб бере базу батька, вікну сховища її задають ззовні (set_baseline) з усього архіву.
+        """
+        src, parts = self._source(), self._stacked()
+        if src: return src[0].baseline().select(self.series)
+        if parts and self._base is None: return anomaly_utils.Baseline.concat([c.baseline() for c in parts[0]]).select(self.series)
+        if self._base is None or self._base[0] != self.version:
+            self._base = (self.version, anomaly_utils.Baseline.from_cube(self))
+        return self._base[1]
+
+    def set_baseline(self, base):
+        """Зовнішня база замість порахованої з цього куба (діє до першої зміни даних)."""
+        self._base = (self.version, base.select(self.series))
+
+    def anomalies(self):
+        """Шар прапорців аномалій [серії, доби, 48]: рахується раз на стан набору; під-куб - зріз шару батька."""
+        src = self._source()
+        if src:
+            parent, rows, a, b = src
+            return parent.anomalies()[rows, a:b]
+        parts = self._stacked()
+        if parts and self._base is None: return np.concatenate([c.anomalies() for c in parts[0]])[parts[1]]
+        if self._flags is None or self._flags[0] != self.version:
+            self._flags = (self.version, self.baseline().flags(self))
+        return self._flags[1]
+
+    def anomaly_scores(self):
+        """Робастні z-оцінки видимого куба (на вимогу, не кешуються)."""
+        return self.baseline().scores(self)
+
+    def forecast_model(self):
+        """
+        Модель прогнозу (forecast_utils.Model) для серій куба з останніх тижнів усього набору:
+        під-куб бере модель батька, тож прогноз іде від кінця даних, а не від кінця вибраного періоду.
+        """
+        src, parts = self._source(), self._stacked()
+        if src: return src[0].forecast_model().select(self.series)
+        if parts: return forecast_utils.Model.concat([c.forecast_model() for c in parts[0]]).select(self.series)
+        if self._model is None or self._model[0] != self.version:
+            self._model = (self.version, forecast_utils.Model.fit(self))
+        return self._model[1]
+
+    # --- МЕТАДАНІ ---
+    @property
+    def n_series(self): return len(self.series)
+
+    @property
+    def n_days(self): return self.values.shape[1]
+
+    @property
+    def nbytes(self): return self.values.nbytes + self.mask.nbytes
+
+    def is_empty(self):
+        return self.n_series == 0 or self.n_days == 0 or not self.mask.any()
+
+    def days(self):
+        return self.day0 + np.arange(self.n_days)
+
+    def meters(self):
+        return sorted({m for m, _ in self.series})
+
+    def types(self):
+        """Мітки каналів за суфіксом: справжні, потім похідні, для яких є пара P/Q."""
+        sfx = self.suffixes()
+        return [TYPE_LABELS[s] for s in sorted(sfx | quality_utils.available(sfx))]
+
+    def suffixes(self):
+        return {s for _, s in self.series}
+
+    def label(self, i):
+        m, s = self.series[i]
+        return f"{m} {TYPE_LABELS[s]}"
+
+    def series_index(self, meter, suffix):
+        return self._index.get((meter, suffix))
+
+    def day_index(self, date):
+        i = int((np.datetime64(date, "D") - self.day0).astype(np.int64))
+        return i if 0 <= i < self.n_days else None
+
+    def date_range(self):
+        """(перша, остання) доба, за яку є хоч одне значення."""
+        if self.is_empty(): return None, None
+        has = np.flatnonzero(self.mask.any(axis=(0, 2)))
+        return (self.day0 + has[0]).astype(object), (self.day0 + has[-1]).astype(object)
+
+    def series_frame(self):
+        """По рядку на серію (MeterID, Type, Suffix) - для віджетів, яким потрібен лише склад серій."""
+        return pd.DataFrame({
+            "MeterID": [m for m, _ in self.series],
+            "Type": [TYPE_LABELS[s] for _, s in self.series],
+            "Suffix": [s for _, s in self.series],
+        })
+
+    # --- ВИБІРКИ ТА ПРЕДСТАВЛЕННЯ ---
+    def _meter_bounds(self):
+        """
+        Межі рядків лічильників: (відсортовані MeterID, початки, кінці).
+        Серії впорядковані за (MeterID, Suffix), тож рядки лічильника суцільні; рахується раз на куб.
+        """
+        if self._bounds is None:
+            meters = np.array([m for m, _ in self.series], dtype=object)
+            starts = np.flatnonzero(np.r_[True, meters[1:] != meters[:-1]]) if len(meters) else np.empty(0, np.int64)
+            self._bounds = (meters[starts].astype(str), starts, np.r_[starts[1:], len(meters)].astype(np.int64))
+        return self._bounds
+
+    def _day_slice(self, d_start=None, d_end=None):
+        a = 0 if d_start is None else int(np.clip((np.datetime64(d_start, "D") - self.day0).astype(np.int64), 0, self.n_days))
+        b = self.n_days if d_end is None else int(np.clip((np.datetime64(d_end, "D") - self.day0).astype(np.int64) + 1, a, self.n_days))
+        return a, b
+
+    def series_rows(self, meters=None, types=None):
+        """
+        Індекси серій вибірки у порядку осі: лічильники - бінарним пошуком по межах,
+        канали - перевіркою до 4 суфіксів усередині рядків лічильника (без проходу по всіх серіях).
+        """
+        keys, starts, ends = self._meter_bounds()
+        if meters is None:
+            runs = [(0, self.n_series)]
+        else:
+            want = np.unique(np.asarray([str(m) for m in meters], dtype=str))
+            pos = np.searchsorted(keys, want)
+            pos = pos[(pos < len(keys)) & (keys[np.minimum(pos, len(keys) - 1)] == want)] if len(keys) else pos[:0]
+            runs = list(zip(starts[pos].tolist(), ends[pos].tolist()))
+        if types is None:
+            return [i for a, b in runs for i in range(a, b)]
+        sfx = {LABEL_SUFFIX[t] for t in types if t in LABEL_SUFFIX}
+        return [i for a, b in runs for i in range(a, b) if self.series[i][1] in sfx]
+
+    def select(self, meters=None, types=None, d_start=None, d_end=None):
+        """
+        Під-куб за лічильниками, каналами (мітки Type) і періодом.
+        Вісь днів - завжди зріз (view); серії - зріз, якщо вибрано суцільний діапазон,
+        інакше копіюються лише вибрані рядки.
+        """
+        if self.n_series == 0: return self
+        idx = self.series_rows(meters, types)
+        a, b = self._day_slice(d_start, d_end)
+        if idx and idx[-1] - idx[0] + 1 == len(idx):
+            sl = slice(idx[0], idx[-1] + 1)
+        else:
+            sl = np.array(idx, dtype=np.int64)
+        sub = SeriesCube([self.series[i] for i in idx], self.day0 + a, self.values[sl, a:b], self.mask[sl, a:b])
+        sub._parent = (self, sl, a, b, self.version)
+        # Похідні канали - з їхніх кубів (та сама вісь днів), приєднуються до вибірки справжніх
+        derived = quality_utils.available(self.suffixes()) & {quality_utils.LABEL_SUFFIX[t] for t in types or () if quality_utils.is_derived(t)}
+        if derived: sub = SeriesCube.stack([sub] + [self.derived(sfx).select(meters, None, d_start, d_end) for sfx in sorted(derived)])
+        return sub
+
+    def derived(self, suffix):
+        """
+        Куб похідного каналу якості (quality_utils) над усіма лічильниками з парою P/Q: рахується при першому
+        запиті й тримається до зміни даних; під-куб бере вибірку каналу батька.
+        """
+        src = self._source()
+        if src:
+            parent, rows, a, b = src
+            return parent.derived(suffix).select(self.meters(), None, parent.day0 + a, parent.day0 + b - 1)
+        parts = self._stacked()
+        if parts: return SeriesCube.stack([c.derived(suffix) for c in parts[0]])
+        hit = self._derived.get(suffix)
+        if hit is None or hit[0] != self.version:
+            cube = quality_utils.derive(self, suffix)
+            hit = self._derived[suffix] = (self.version, cube.freeze() if self._frozen else cube)
+        return hit[1]
+
+    def series_matrix(self, i):
+        """Матриця доба × 48 однієї серії - view без копіювання (для теплової карти)."""
+        return self.values[i]
+
+    def daily_sums(self):
+        """
+        (серії, доби): сума за добу; NaN - доба без даних.
+        Похідні канали якості (cos φ, tg φ, S...) - відношення й потужності, а не енергія: для них середнє за добу,
+        як і в рівнях 1h/4h.
+        """
+        r = self.rollup("D")
+        derived = np.isin([s for _, s in self.series], list(quality_utils.CHANNELS))[:, None]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(r.count[:, :, 0] > 0, np.where(derived, r.sum[:, :, 0] / r.count[:, :, 0], r.sum[:, :, 0]), np.nan)
+
+    def daily_frame(self):
+        """Добові суми (для похідних каналів - середні) у формі довгої таблиці (Date, MeterID, Type, Value) лише для діб з даними."""
+        sums = self.daily_sums()
+        s_idx, d_idx = np.nonzero(~np.isnan(sums))
+        return pd.DataFrame({
+            "Date": (self.day0 + d_idx).astype(object),
+            "MeterID": [self.series[i][0] for i in s_idx],
+            "Type": [TYPE_LABELS[self.series[i][1]] for i in s_idx],
+            "Value": sums[s_idx, d_idx],
+        })
+
+    def hourly_matrix(self, i):
+        """Серія i: години (24) × доби, середнє двох півгодин."""
+        return self.rollup("1h").take([i], 0, self.n_days).mean()[0].T
+
+    def pair_rows(self, p_suffix=2, q_suffix=4):
+        """(лічильники, рядки P, рядки Q) для лічильників, що мають обидва канали - у порядку осі серій."""
+        meters = np.array([m for m, _ in self.series], dtype=object)
+        sfx = np.array([s for _, s in self.series], dtype=np.int64)
+        rp, rq = np.flatnonzero(sfx == p_suffix), np.flatnonzero(sfx == q_suffix)
+        _, a, b = np.intersect1d(meters[rp].astype(str), meters[rq].astype(str), return_indices=True)
+        return meters[rp[a]].tolist(), rp[a], rq[b]
+
+    def pq_pairs(self, p_suffix=2, q_suffix=4):
+        """[(meter, P, Q)] для лічильників, що мають обидва канали; P, Q - view доба × 48."""
+        return [(m, self.values[ip], self.values[iq]) for m, ip, iq in zip(*self.pair_rows(p_suffix, q_suffix))]
+
+    def _suffix_rows(self, suffix):
+        return [i for i, (_, s) in enumerate(self.series) if s == suffix]
+
+    def suffix_total(self, suffix):
+        rows = self._suffix_rows(suffix)
+        return float(self.rollup("D").sum[rows].sum()) if rows else 0.0
+
+    def suffix_max(self, suffix):
+        rows = self._suffix_rows(suffix)
+        if not rows or self.n_days == 0: return np.nan
+        peak = np.fmax.reduce(self.rollup("D").max[rows], axis=None)
+        return np.nan if np.isnan(peak) else float(peak)
+
+    def timestamps(self):
+        """Мітки часу осі (доба, слот) - datetime64[us] довжини n_days * 48."""
+        base = self.days().astype("datetime64[us]").astype(np.int64)
+        return (base[:, None] + schema_utils.SLOT_OFFSETS[None, :]).ravel().view("datetime64[us]")
+
+    def wide_frame(self):
+        """Зведена таблиця DateTime × серії прямо з куба (без pivot_table); рядки без даних відкинуто."""
+        flat = self.values.reshape(self.n_series, -1).T
+        has = self.mask.reshape(self.n_series, -1).any(axis=0)
+        cols = [f"{m} - {TYPE_LABELS[s].split('(')[0]}" for m, s in self.series]
+        return pd.DataFrame(flat[has], index=pd.Index(self.timestamps()[has], name="DateTime"), columns=cols)
+
+    def to_frame(self, compact=True, order="time", anomalies=False):
+        """
+        Довга таблиця.
+        order="time" - за DateTime (у межах моменту - за серіями);
+        order="series" - за (MeterID, Type, DateTime): порядок осей куба, тож рядки беруться
+        булевою вибіркою по масці без сортування, а коди серій - повторенням на кількість значень.
+        anomalies=True - також is_anomaly і anomaly_score з шару аномалій (anomalies()).
+        """
+        if self.is_empty():
+            return pd.DataFrame(columns=list(schema_utils.COMPACT_DTYPES) if compact else schema_utils.COLUMNS)
+        base = self.days().astype("datetime64[us]").astype(np.int64)
+        if order == "series":
+            grid = base[:, None] + schema_utils.SLOT_OFFSETS[None, :]
+            ts = np.broadcast_to(grid, self.mask.shape)[self.mask].view("datetime64[us]")
+            pick = lambda a: a[self.mask]
+            counts = self.mask.sum(axis=(1, 2))
+            per_row = lambda a: np.repeat(a, counts)
+            if not compact:
+                flat = np.broadcast_to(np.arange(self.n_days * SLOTS).reshape(self.n_days, SLOTS), self.mask.shape)[self.mask]
+                d, sl = np.divmod(flat, SLOTS)
+        else:
+            d, sl, s = np.nonzero(self.mask.transpose(1, 2, 0))
+            ts = (base[d] + schema_utils.SLOT_OFFSETS[sl]).view("datetime64[us]")
+            pick = lambda a: a.transpose(1, 2, 0)[d, sl, s]
+            per_row = lambda a: a[s]
+        values = pick(self.values)
+        extra = {"is_anomaly": pick(self.anomalies()), "anomaly_score": pick(self.anomaly_scores())} if anomalies else {}
+        cols = schema_utils.series_columns(self.series, per_row)
+        if compact:
+            return pd.DataFrame({"DateTime": ts, **cols, "Value": values.astype(np.float32), **extra})
+        return pd.DataFrame({
+            "DateTime": ts,
+            "Date": (self.day0 + d).astype(object),
+            "Time": schema_utils.SLOT_TIMES[sl],
+            "MeterID": np.asarray(cols["MeterID"], dtype=object),
+            "Type": np.asarray(cols["Type"], dtype=object),
+            "Suffix": cols["Suffix"].astype(np.int64),
+            "Value": values.astype(np.float64),
+            **extra,
+        }, columns=schema_utils.COLUMNS + list(extra))
@@ -8,8 +8,15 @@ import matplotlib.dates as mdates
 import numpy as np
 from docx import Document # Новая библиотека
 from docx.shared import Pt, RGBColor
+import schema_utils
+import rollup_utils
+import anomaly_utils
+import tariff_utils
+import peak_utils
+from cube_utils import SeriesCube
 
 FONT_NAME = "DejaVuSans.ttf"
+DAILY_BARS_MAX = 62  # діб у блоці добових сум, до яких малюються стовпчики (далі - сходинки)
 
 class PDFReport(FPDF):
     def __init__(self, title_text, file_info=None):
@@ -68,14 +75,17 @@ class PDFReport(FPDF):
 def render_mpl_chart(df, title):
     try:
         fig, ax = plt.subplots(figsize=(10, 4))
-        for (meter, typ), group in df.groupby(['MeterID', 'Type']):
-            ax.plot(group['DateTime'], group['Value'], label=f"{meter} {typ}", linewidth=1)
+        for (meter, typ), group in df.groupby(['MeterID', 'Type'], observed=True):
+            line, = ax.plot(group['DateTime'], group['Value'], label=f"{meter} {typ}", linewidth=1)
+            if 'is_anomaly' in group.columns:
+                anom = group[group['is_anomaly'].astype(bool)]
+                ax.scatter(anom['DateTime'], anom['Value'], s=12, color='red', edgecolors=line.get_color(), zorder=3)
         ax.set_title(title)
         ax.set_ylabel("кВт / кВАр")
         ax.grid(True, linestyle='--', alpha=0.5)
         ax.xaxis.set_major_formatter(mdates.DateFormatter('%d.%m %H:%M'))
         plt.setp(ax.get_xticklabels(), rotation=45, ha="right", fontsize=8)
-        if len(df.groupby(['MeterID', 'Type'])) < 10:
+        if len(df.groupby(['MeterID', 'Type'], observed=True)) < 10:
             ax.legend(loc='upper right', fontsize='x-small', framealpha=0.5)
         plt.tight_layout()
         tmp = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
@@ -86,18 +96,26 @@ def render_mpl_chart(df, title):
 
 def render_mpl_daily(df, title):
     try:
-        daily = df.groupby(["Date", "MeterID", "Type"])["Value"].sum().reset_index()
+        daily = df.groupby([schema_utils.get_dates(df), "MeterID", "Type"], observed=True)["Value"].sum().reset_index()
         daily = daily.sort_values("Date")
         fig, ax = plt.subplots(figsize=(10, 4))
-        for (meter, typ), group in daily.groupby(['MeterID', 'Type']):
-            ax.bar(group['Date'], group['Value'], label=f"{meter} {typ}", alpha=0.7)
+        # Довгий період: стовпчик на добу - тисячі окремих патчів matplotlib (секунди на блок);
+        # замість них - сходинки із заливкою, по одному об'єкту на серію. Підписи - автоматичним локатором
+        long_period = daily["Date"].nunique() > DAILY_BARS_MAX
+        for (meter, typ), group in daily.groupby(['MeterID', 'Type'], observed=True):
+            if long_period:
+                x = pd.to_datetime(group['Date']).to_numpy()
+                line, = ax.step(x, group['Value'], where='mid', label=f"{meter} {typ}", linewidth=0.8)
+                ax.fill_between(x, group['Value'], step='mid', alpha=0.3, color=line.get_color(), linewidth=0)
+            else:
+                ax.bar(group['Date'], group['Value'], label=f"{meter} {typ}", alpha=0.7)
         ax.set_title(title)
         ax.set_ylabel("кВт*ч")
         ax.grid(True, axis='y', linestyle='--', alpha=0.5)
         ax.xaxis.set_major_formatter(mdates.DateFormatter('%d.%m'))
-        ax.xaxis.set_major_locator(mdates.DayLocator(interval=1))
+        ax.xaxis.set_major_locator(mdates.AutoDateLocator() if long_period else mdates.DayLocator(interval=1))
         plt.setp(ax.get_xticklabels(), rotation=90, fontsize=8)
-        if len(daily.groupby(['MeterID', 'Type'])) < 10:
+        if len(daily.groupby(['MeterID', 'Type'], observed=True)) < 10:
             ax.legend(loc='upper right', fontsize='x-small')
         plt.tight_layout()
         tmp = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
@@ -106,15 +124,21 @@ def render_mpl_daily(df, title):
         return tmp.name
     except: return None
 
-def render_mpl_matrix(df, title):
+def render_mpl_matrix(df, title, cube=None):
     try:
-        if df.empty: return None
-        m_id = df.iloc[0]['MeterID']
-        t_id = df.iloc[0]['Type']
-        sub = df[(df['MeterID'] == m_id) & (df['Type'] == t_id)].copy()
-        sub['Hour'] = sub['DateTime'].dt.hour
-        sub['Day'] = sub['DateTime'].dt.date
-        piv = sub.pivot_table(index='Hour', columns='Day', values='Value', aggfunc='mean')
+        if cube is not None:
+            # Години × доби першої серії прямо з куба
+            if cube.is_empty(): return None
+            piv = pd.DataFrame(cube.hourly_matrix(0), index=range(24), columns=cube.days().astype(object))
+            piv = piv.loc[:, piv.notna().any()]
+        else:
+            if df.empty: return None
+            m_id = df.iloc[0]['MeterID']
+            t_id = df.iloc[0]['Type']
+            sub = df[(df['MeterID'] == m_id) & (df['Type'] == t_id)].copy()
+            sub['Hour'] = sub['DateTime'].dt.hour
+            sub['Day'] = sub['DateTime'].dt.date
+            piv = sub.pivot_table(index='Hour', columns='Day', values='Value', aggfunc='mean')
         fig, ax = plt.subplots(figsize=(10, 5))
         cax = ax.imshow(piv, aspect='auto', cmap='viridis', interpolation='nearest')
         fig.colorbar(cax, label='кВт')
@@ -141,11 +165,12 @@ def render_mpl_matrix(df, title):
         return tmp.name
     except: return None
 
-def export_custom_pdf(df_full, file_info, config) -> bytes:
+def export_custom_pdf(df_full, file_info, config, cube=None) -> bytes:
     pdf = PDFReport(config.get('title', 'Отчет'), file_info)
     pdf.add_page()
     d_start, d_end = config['dates']
-    df_period = df_full[(df_full['Date'] >= d_start) & (df_full['Date'] <= d_end)].copy()
+    # Блоки вибираються зрізами куба; довга таблиця потрібна лише графіку 30 хв
+    if cube is None: cube = SeriesCube.from_frame(df_full)
     font = 'DejaVu' if pdf.font_loaded else 'Arial'
     pdf.set_font(font, '', 9)
     pdf.cell(0, 5, pdf._txt(f"Период отчета: {d_start} - {d_end}"), ln=True)
@@ -160,27 +185,78 @@ def export_custom_pdf(df_full, file_info, config) -> bytes:
         meters = block.get('meters', [])
         types = block.get('types', [])
         if not meters or not types: continue
-        mask = df_period['MeterID'].isin(meters) & df_period['Type'].isin(types)
-        df_block = df_period[mask]
-        if df_block.empty: continue
+        sub = cube.select(meters, types, d_start, d_end)
+        if sub.is_empty(): continue
         
         pdf.add_section_header(f"{i+1}. {title}")
         img_path = None
         if b_type == 'stats':
             pdf.set_font(font, '', 10)
-            total = df_block['Value'].sum()
-            peak = df_block['Value'].max()
+            day = sub.rollup("D")
+            total = float(day.sum.sum())
+            peak = float(np.fmax.reduce(day.max, axis=None))
             pdf.cell(60, 6, pdf._txt("Сумма по выборке:"), border=1)
             pdf.cell(60, 6, f"{total:,.0f}".replace(",", " "), border=1, ln=True)
             pdf.cell(60, 6, pdf._txt("Максимум:"), border=1)
             pdf.cell(60, 6, f"{peak:,.0f}".replace(",", " "), border=1, ln=True)
+            pdf.cell(60, 6, pdf._txt("Аномалий (30 мин):"), border=1)
+            pdf.cell(60, 6, f"{int(sub.anomalies().sum()):,}".replace(",", " "), border=1, ln=True)
             pdf.ln(5)
         elif b_type == 'graph_30m':
-            img_path = render_mpl_chart(df_block, title)
+            # Довгий період - рівень піраміди з кроком, за якого графік ще читається (замість тисяч 30-хв точок);
+            # аномалії - із шару куба (кошик позначено, якщо в ньому є аномальна точка)
+            level = rollup_utils.level_for_span(sub.n_days)
+            if level is None: chart_df = sub.to_frame(order="series", anomalies=True)
+            else: chart_df = sub.rollup(level).to_frame(is_anomaly=anomaly_utils.bucket_flags(sub.anomalies(), rollup_utils.LEVELS[level]))
+            img_path = render_mpl_chart(chart_df, title)
         elif b_type == 'graph_daily':
-            img_path = render_mpl_daily(df_block, title)
+            img_path = render_mpl_daily(sub.daily_frame(), title)
         elif b_type == 'graph_matrix':
-            img_path = render_mpl_matrix(df_block, title)
+            img_path = render_mpl_matrix(None, title, cube=sub)
+        elif b_type == 'tariff':
+            # Енергія й вартість за зонами тарифу з дашборду (tariff_utils); ціни зон - у підписі
+            tariff = config.get('tariff') or tariff_utils.PRESETS["Тризонний"]
+            summ = tariff_utils.summary(tariff_utils.bill(sub, tariff))
+            if summ.empty: continue
+            cols = [f"{z}, кВт·год" for z in tariff['zones']] + ["Разом, кВт·год", "Разом, грн"]
+            vals = summ[cols].to_numpy(np.float64)
+            w = (190 - 62) / len(cols)
+            pdf.set_font(font, '', 8)
+            pdf.multi_cell(0, 5, pdf._txt("Тариф: " + ", ".join(f"{z} - {p:.2f} грн/кВт*ч" for z, p in tariff["zones"].items())), ln=True)
+            pdf.multi_cell(0, 5, pdf._txt(tariff_utils.describe(tariff)), ln=True)
+            pdf.cell(62, 6, pdf._txt("Счетчик / канал"), border=1)
+            for c in cols: pdf.cell(w, 6, pdf._txt(c.replace("кВт·год", "кВт*ч")), border=1, align='C')
+            pdf.ln()
+            names = [f"{m} {str(t).split('(')[0].strip()}" for m, t in zip(summ["MeterID"], summ["Type"])] + ["Итого"]
+            for name, row in zip(names, np.vstack([vals, vals.sum(axis=0)])):
+                pdf.cell(62, 6, pdf._txt(name[:40]), border=1)
+                for j, v in enumerate(row): pdf.cell(w, 6, (f"{v:,.2f}" if j == len(row) - 1 else f"{v:,.0f}").replace(",", " "), border=1, align='R')
+                pdf.ln()
+            pdf.ln(5)
+        elif b_type == 'peaks':
+            # Збіжні піки першого вибраного каналу (сума всіх лічильників блоку) і максимальна годинна потужність кожного лічильника
+            chan = sub.select(None, [types[0]])
+            coinc = peak_utils.coincident_peaks(chan, 10, top_meters=3)
+            md = peak_utils.max_demand(chan, 2)
+            if coinc.empty: continue
+            pdf.set_font(font, '', 8)
+            pdf.multi_cell(0, 5, pdf._txt(f"Канал: {types[0]}. Совмещенные пики (сумма по {chan.n_series} сч.):"), ln=True)
+            for w, c in zip((10, 32, 28, 120), ("№", "Дата/время", "Сумма", "Наибольшие вклады")): pdf.cell(w, 6, pdf._txt(c), border=1, align='C')
+            pdf.ln()
+            for r in coinc.itertuples(index=False):
+                pdf.cell(10, 6, str(r.Rank), border=1, align='C')
+                pdf.cell(32, 6, f"{pd.Timestamp(r.DateTime):%d.%m.%Y %H:%M}", border=1)
+                pdf.cell(28, 6, f"{r.Total:,.1f}".replace(",", " "), border=1, align='R')
+                pdf.cell(120, 6, pdf._txt(r.Contributors[:85]), border=1, ln=True)
+            pdf.ln(3)
+            pdf.multi_cell(0, 5, pdf._txt("Максимальная мощность за 1 ч (скользящее окно):"), ln=True)
+            for w, c in zip((62, 40, 40), ("Счетчик", "Начало окна", "Мощность")): pdf.cell(w, 6, pdf._txt(c), border=1, align='C')
+            pdf.ln()
+            for r in md.sort_values("Demand", ascending=False).itertuples(index=False):
+                pdf.cell(62, 6, pdf._txt(str(r.MeterID)[:40]), border=1)
+                pdf.cell(40, 6, f"{pd.Timestamp(r.DateTime):%d.%m.%Y %H:%M}", border=1)
+                pdf.cell(40, 6, f"{r.Demand:,.1f}".replace(",", " "), border=1, align='R', ln=True)
+            pdf.ln(5)
         if img_path:
             pdf.add_image_from_file(img_path)
             try: os.unlink(img_path)
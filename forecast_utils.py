@@ -0,0 +1,152 @@
+import numpy as np
+import pandas as pd
+from scipy import stats
+import schema_utils
+
+# Прогноз півгодинного навантаження на добу/тиждень уперед для всіх серій разом:
+#   значення = рівень + нахил · t + профіль[півгодина тижня],  t - доби від кінця даних,
+# тренд - зважена лінійна регресія, профіль - зважене середнє залишків за 7 × 48 = 336 слотами тижня.
+# Обидві частини уточнюються по черзі (backfitting) на останніх HISTORY_DAYS добах, свіжі тижні важать більше.
+# Групування за слотами - матричний добуток на one-hot (інтервали × 336), без циклу по серіях.
+SLOTS = schema_utils.SLOTS
+SLOTS_OF_WEEK = 7 * SLOTS
+HISTORY_DAYS = 56       # 8 повних тижнів
+HALF_LIFE_DAYS = 14     # вага доби спадає вдвічі кожні 2 тижні
+FIT_ROUNDS = 2
+SHRINK = 2.0            # розкид слота з кількома точками тягнеться до розкиду серії
+BAND = 0.8              # частка інтервалів, що мають потрапити в смугу прогнозу
+CHUNK = 256             # серій за прохід
+
+def slot_of_week(days):
+    """(доби, 48) - півгодина тижня кожного слота, понеділок 00:00 = 0."""
+    weekday = (np.asarray(days, dtype="datetime64[D]").astype(np.int64) + 3) % 7  # 1970-01-01 - четвер
+    return weekday[:, None] * SLOTS + np.arange(SLOTS)[None, :]
+
+def _trend(y, w, t):
+    """Зважена лінійна регресія y на t по осях (доби, 48) для кожної серії: (рівень при t = 0, нахил)."""
+    sw, swt, swy = w.sum(axis=(1, 2)), (w * t).sum(axis=(1, 2)), (w * y).sum(axis=(1, 2))
+    swtt, swty = (w * t * t).sum(axis=(1, 2)), (w * t * y).sum(axis=(1, 2))
+    det = sw * swtt - swt * swt
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slope = np.where(det > 1e-9 * np.maximum(sw * swtt, 1), (sw * swty - swt * swy) / det, 0.0)
+        level = np.where(sw > 0, (swy - slope * swt) / sw, np.nan)
+    return level, slope
+
+class Model:
+    """
+    Модель прогнозу для списку серій: start - перша доба прогнозу (наступна після даних),
+    level/slope (серія) - тренд, profile/spread [серія, 336] - сезонний профіль і σ залишків за слотом тижня.
+    """
+    def __init__(self, series, start, level, slope, profile, spread, floor):
+        self.series = list(series)
+        self.start = None if start is None else np.datetime64(start, "D")
+        self.level, self.slope = level, slope
+        self.profile, self.spread = profile, spread
+        self.floor = floor
+        self._index = {s: i for i, s in enumerate(self.series)}
+
+    @classmethod
+    def empty(cls, series=()):
+        n = len(series)
+        nan = lambda *shape: np.full(shape, np.nan, np.float64)
+        return cls(series, None, nan(n), nan(n), nan(n, SLOTS_OF_WEEK), nan(n, SLOTS_OF_WEEK), nan(n))
+
+    @classmethod
+    def fit(cls, cube):
+        """Модель з останніх HISTORY_DAYS діб куба (до останньої доби з даними), порціями по CHUNK серій."""
+        has = np.flatnonzero(cube.mask.any(axis=(0, 2))) if cube.n_series and cube.n_days else []
+        if not len(has): return cls.empty(cube.series)
+        b = int(has[-1]) + 1
+        a = max(b - HISTORY_DAYS, 0)
+        days = cube.day0 + np.arange(a, b)
+        age = np.arange(a - b, 0, dtype=np.float64)                                     # -n .. -1
+        t = age[:, None] + (np.arange(SLOTS) + 0.5)[None, :] / SLOTS                    # (доби, 48)
+        sow = slot_of_week(days)
+        onehot = (sow.reshape(-1, 1) == np.arange(SLOTS_OF_WEEK)[None, :]).astype(np.float64)
+        decay = np.exp2(age / HALF_LIFE_DAYS)[None, :, None]
+        n = cube.n_series
+        level, slope, floor = np.empty(n), np.empty(n), np.empty(n)
+        profile, spread = np.empty((n, SLOTS_OF_WEEK)), np.empty((n, SLOTS_OF_WEEK))
+        for c0 in range(0, n, CHUNK):
+            m = cube.mask[c0:c0 + CHUNK, a:b]
+            y = np.where(m, cube.values[c0:c0 + CHUNK, a:b], 0).astype(np.float64)
+            w = m * decay
+            k = len(y)
+            flat_w = w.reshape(k, -1)
+            den = flat_w @ onehot                                                       # вага кожного слота тижня
+            prof = np.zeros((k, SLOTS_OF_WEEK))
+            for _ in range(FIT_ROUNDS):
+                lv, sl = _trend(y - prof[:, sow], w, t)
+                r = y - (lv[:, None, None] + sl[:, None, None] * t[None])
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    prof = np.where(den > 0, ((w * r).reshape(k, -1) @ onehot) / den, 0)
+            e = r - prof[:, sow]
+            sq = (w * e * e).reshape(k, -1)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                var_all = sq.sum(axis=1) / flat_w.sum(axis=1)
+                var = (sq @ onehot + SHRINK * var_all[:, None]) / (den + SHRINK)
+            level[c0:c0 + k], slope[c0:c0 + k] = lv, sl
+            profile[c0:c0 + k], spread[c0:c0 + k] = prof, np.sqrt(var)
+            with np.errstate(invalid="ignore"):
+                floor[c0:c0 + k] = np.where(m.any(axis=(1, 2)), np.where(m, y, np.inf).min(axis=(1, 2)), np.nan)
+        return cls(cube.series, cube.day0 + b, level, slope, profile, spread, floor)
+
+    @classmethod
+    def concat(cls, parts):
+        """Моделі з різними серіями однієї осі днів -> одна; start - найпізніший з частин."""
+        if not parts: return cls.empty()
+        starts = [m.start for m in parts if m.start is not None]
+        cat = lambda name: np.concatenate([getattr(m, name) for m in parts])
+        return cls([s for m in parts for s in m.series], max(starts) if starts else None,
+                   cat("level"), cat("slope"), cat("profile"), cat("spread"), cat("floor"))
+
+    def select(self, series):
+        """Модель для списку серій у його порядку; серій без моделі - NaN (прогнозу не буде)."""
+        out = Model.empty(series)
+        out.start = self.start
+        pairs = [(j, self._index[s]) for j, s in enumerate(series) if s in self._index]
+        if pairs:
+            dst, src = map(list, zip(*pairs))
+            for name in ("level", "slope", "profile", "spread", "floor"): getattr(out, name)[dst] = getattr(self, name)[src]
+        return out
+
+    def predict(self, n_days):
+        """(середнє, нижня, верхня межа) [серії, n_days, 48] від start; межі - квантилі нормального розподілу залишків."""
+        shape = (len(self.series), n_days, SLOTS)
+        if self.start is None or not self.series: return tuple(np.full(shape, np.nan, np.float32) for _ in range(3))
+        sow = slot_of_week(self.start + np.arange(n_days))
+        t = np.arange(n_days, dtype=np.float64)[:, None] + (np.arange(SLOTS) + 0.5)[None, :] / SLOTS
+        mean = self.level[:, None, None] + self.slope[:, None, None] * t[None] + self.profile[:, sow]
+        half = stats.norm.ppf(0.5 + BAND / 2) * self.spread[:, sow]
+        floor = self.floor[:, None, None]
+        clip = lambda x: np.where(np.isnan(floor), x, np.maximum(x, floor)).astype(np.float32)
+        return clip(mean), clip(mean - half), clip(mean + half)
+
+    def frame(self, n_days, width=1):
+        """
+        Довга таблиця прогнозу (DateTime, MeterID, Type, Suffix, Value, lower, upper) на n_days діб;
+        width > 1 - середні кошиків по width півгодин (як рівні rollup_utils).
+        """
+        cols = ["DateTime", "MeterID", "Type", "Suffix", "Value", "lower", "upper"]
+        ok = [i for i in range(len(self.series)) if not np.isnan(self.level[i])]
+        if self.start is None or not ok: return pd.DataFrame(columns=cols)
+        parts = [a[ok].reshape(len(ok), n_days, SLOTS // width, width).mean(axis=3) for a in self.predict(n_days)]
+        base = (self.start + np.arange(n_days)).astype("datetime64[us]").astype(np.int64)
+        grid = base[:, None] + np.arange(SLOTS // width, dtype=np.int64)[None, :] * width * 30 * 60 * 1_000_000
+        per = n_days * (SLOTS // width)
+        return pd.DataFrame({
+            "DateTime": np.tile(grid.ravel(), len(ok)).view("datetime64[us]"),
+            **schema_utils.series_columns([self.series[i] for i in ok], lambda a: np.repeat(a, per)),
+            "Value": parts[0].ravel(), "lower": parts[1].ravel(), "upper": parts[2].ravel(),
+        }, columns=cols)
+
+    def summary(self, n_days, labels):
+        """Рядок на серію: енергія прогнозу за горизонт, максимум прогнозу і верхньої межі - для звірки з договірною потужністю."""
+        mean, _, upper = self.predict(n_days)
+        with np.errstate(invalid="ignore"):
+            return pd.DataFrame({
+                "Серія": labels,
+                "Прогноз, сума": np.where(np.isnan(self.level), np.nan, np.nansum(mean, axis=(1, 2))),
+                "Прогноз, макс.": np.nanmax(mean.reshape(len(labels), -1), axis=1, initial=-np.inf),
+                "Верхня межа, макс.": np.nanmax(upper.reshape(len(labels), -1), axis=1, initial=-np.inf),
+            }).replace(-np.inf, np.nan)
@@ -2,6 +2,11 @@ import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
 import math
+import warnings
+import numpy as np
+import schema_utils
+import cube_utils
+import quality_utils
 
 PALETTES = {
     "Default": ["#636EFA", "#EF553B", "#00CC96", "#AB63FA", "#FFA15A", "#19D3F3", "#FF6692", "#B6E880"],
@@ -20,6 +25,16 @@ LINE_STYLES_BW = [
     dict(dash="dot", marker="diamond"), dict(dash="dashdot", marker="cross")
 ]
 BAR_PATTERNS_BW = ["/", "\\", "x", "-", "|", "+"]
+# Графік 30 хв: від стількох точок лінії малюються через WebGL (Scattergl) замість SVG
+GL_POINTS = 20_000
+# Серія передається як x0 + dx, якщо рівномірна сітка з пропусками не більш ніж удвічі довша за її точки
+GRID_FILL = 2
+# Розподіл (скрипки): квантилів на групу замість сирих значень; підписи днів тижня
+VIOLIN_QUANTILES = 201
+DAY_LABELS = {0: '01. Пн', 1: '02. Вт', 2: '03. Ср', 3: '04. Чт', 4: '05. Пт', 5: '06. Сб', 6: '07. Нд'}
+# Сітка теплових карт: карт у ряд і висота ряду, пікс.
+HEAT_GRID_COLS = 4
+HEAT_GRID_ROW_PX = 180
 
 def get_color(i, palette_name, bw_mode, custom_colors=None):
     if bw_mode: return "black"
@@ -48,29 +63,64 @@ def get_axis_style(bw_mode):
     gc = "#bbb" if bw_mode else "#ddd"
     return dict(showline=True, linewidth=2, linecolor=c, mirror=True, showgrid=True, gridcolor=gc)
 
-def plot_30min_graph(df, height, line_width, show_pts, show_anomalies, chart_type, legend_pos, bw_mode, labels, template, palette_name="Default", custom_colors=None):
+def _series_rows(df):
+    """Один прохід groupby: {(MeterID, Type): позиції рядків серії за зростанням часу} і час рядків у мс."""
+    if df is None or df.empty: return {}, None
+    t = df["DateTime"].to_numpy("datetime64[ms]").astype(np.int64)
+    rows = {}
+    for key, idx in df.groupby(["MeterID", "Type"], observed=True, sort=False).indices.items():
+        rows[key] = idx if np.all(t[idx][1:] >= t[idx][:-1]) else idx[np.argsort(t[idx], kind="stable")]
+    return rows, t
+
+def _grid(t, *cols):
+    """
+    Осі трасування для точок серії (t - мс за зростанням): рівномірний крок -> x0 + dx і стовпці float32 з NaN
+    у пропусках (замість масиву дат рядками), інакше (проріджена серія) - явний x у мс (float64, вісь type="date").
+    Стовпці plotly віддає base64-масивами.
+    """
+    if len(t) > 1:
+        step = int(np.diff(t).min())
+        span = (t[-1] - t[0]) // step + 1 if step > 0 else 0
+        if step > 0 and span <= GRID_FILL * len(t) and not np.any((t - t[0]) % step):
+            pos = (t - t[0]) // step
+            dense = []
+            for c in cols:
+                a = np.full((span,) + np.shape(c)[1:], np.nan, np.float32)
+                a[pos] = c
+                dense.append(a)
+            return dict(x0=str(np.datetime64(int(t[0]), "ms")), dx=step), dense
+    return dict(x=np.asarray(t, np.float64)), [np.asarray(c, np.float32) for c in cols]
+
+def plot_30min_graph(df, height, line_width, show_pts, show_anomalies, chart_type, legend_pos, bw_mode, labels, template, palette_name="Default", custom_colors=None, overlays=None, forecast=None):
     fig = go.Figure()
     has_range = 'min_val' in df.columns and 'max_val' in df.columns
-    series_keys = sorted(df.groupby(["MeterID", "Type"]).groups.keys())
+    rows, t = _series_rows(df)
+    series_keys = sorted(rows)
+    # Багато точок (разом з порівнянням і прогнозом) - WebGL для всіх ліній і маркерів (сплайн у Scattergl не підтримується, лишається SVG)
+    n_pts = len(df) + sum(len(o) for _, o in overlays or []) + (len(forecast) if forecast is not None else 0)
+    Line = go.Scattergl if n_pts > GL_POINTS and chart_type != "Spline" else go.Scatter
+    value = df["Value"].to_numpy(np.float32) if len(df) else None
+    lo, hi = (df["min_val"].to_numpy(np.float32), df["max_val"].to_numpy(np.float32)) if has_range else (None, None)
+    anomaly = df["is_anomaly"].to_numpy(bool) if show_anomalies and "is_anomaly" in df.columns else None
+    line_shape = {"Step": "hv", "Spline": "spline"}.get(chart_type, "linear")
     
     for i, (meter, typ) in enumerate(series_keys):
-        sub = df[(df["MeterID"] == meter) & (df["Type"] == typ)]
-        if sub.empty: continue
-        
+        idx = rows[(meter, typ)]
         color, dash_style, marker_sym = get_style_settings(i, bw_mode, palette_name, custom_colors)
         name = f"{meter} {typ}"
         mode = "lines"
-        text_labels = None
-        if show_pts and chart_type != "Bar": 
+        text = {}
+        if show_pts and chart_type != "Bar":
             mode = "lines+markers+text"
-            text_labels = [t.strftime("%H:%M") for t in sub["DateTime"]]
+            text = dict(texttemplate="%{x|%H:%M}", textposition="top center")
         if chart_type == "Scatter": mode = "markers"
         
         ht = "<b>%{y:,.2f}</b><br>%{x|%d.%m %H:%M}<extra>" + name + "</extra>"
-        common = dict(x=sub["DateTime"], y=sub["Value"], name=name, hovertemplate=ht)
-        line_shape = 'linear'
-        if chart_type == "Step": line_shape = 'hv'
-        elif chart_type == "Spline": line_shape = 'spline'
+        band = has_range and not bw_mode and chart_type in ["Line", "Spline", "Step", "Area"]
+        alert = anomaly is not None and anomaly[idx].any()
+        # Аномальні точки - на тій самій сітці x0 + dx, що й лінія: значення лише там, де позначка
+        xs, cols = _grid(t[idx], value[idx], *((lo[idx], hi[idx]) if band else ()), *((np.where(anomaly[idx], value[idx], np.nan),) if alert else ()))
+        common = dict(**xs, y=cols[0], name=name, hovertemplate=ht)
 
         if chart_type == "Bar":
             ms = dict(color=color)
@@ -78,24 +128,56 @@ def plot_30min_graph(df, height, line_width, show_pts, show_anomalies, chart_typ
                 pat = BAR_PATTERNS_BW[i % len(BAR_PATTERNS_BW)]
                 ms = dict(color="white", line=dict(color="black", width=1), pattern=dict(shape=pat, fgcolor="black"))
             fig.add_trace(go.Bar(**common, marker=ms))
-        elif chart_type == "Area":
-            fig.add_trace(go.Scatter(**common, mode=mode, fill='tozeroy', line=dict(width=line_width, color=color, dash=dash_style, shape=line_shape), marker=dict(symbol=marker_sym, size=6), text=text_labels))
         else:
-            fig.add_trace(go.Scatter(**common, mode=mode, line=dict(width=line_width, color=color, dash=dash_style, shape=line_shape), marker=dict(symbol=marker_sym, size=6), text=text_labels))
+            fill = dict(fill='tozeroy') if chart_type == "Area" else {}
+            fig.add_trace(Line(**common, **fill, **text, mode=mode, line=dict(width=line_width, color=color, dash=dash_style, shape=line_shape), marker=dict(symbol=marker_sym, size=6)))
         
-        if has_range and not bw_mode and chart_type in ["Line", "Spline", "Step", "Area"]:
-             fig.add_trace(go.Scatter(x=pd.concat([sub["DateTime"], sub["DateTime"][::-1]]), y=pd.concat([sub["max_val"], sub["min_val"][::-1]]), fill='toself', fillcolor=color, opacity=0.2, line=dict(width=0), hoverinfo="skip", showlegend=False))
+        if band:
+            # Смуга min-max кошика: нижня межа без лінії, верхня заливає до неї
+            fig.add_trace(Line(**xs, y=cols[1], mode="lines", line=dict(width=0, color=color), hoverinfo="skip", showlegend=False))
+            fig.add_trace(Line(**xs, y=cols[2], mode="lines", line=dict(width=0, color=color), fill='tonexty', fillcolor=color, opacity=0.2, hoverinfo="skip", showlegend=False))
+
+        if alert:
+            ac = "black" if bw_mode else "red"
+            fig.add_trace(Line(**xs, y=cols[-1], mode="markers", marker=dict(color=ac, size=10, symbol="x"), name=f"{name} (Alert)", showlegend=False, hovertemplate=ht))
+
+    # Періоди порівняння (compare_utils) - на осі часу базового періоду, пунктиром кольору своєї серії.
+    # Зсув періоду сталий (цілі тижні), тож справжній час - у підказці як «x − N діб», а точки - на сітці x0 + dx
+    for j, (label, odf) in enumerate(overlays or []):
+        if odf is None or odf.empty: continue
+        o_rows, o_t = _series_rows(odf)
+        o_value = odf["Value"].to_numpy(np.float32)
+        shift = int((o_t[0] - odf["SourceTime"].iloc[:1].to_numpy("datetime64[ms]").astype(np.int64)[0]) // 86_400_000)
+        for i, key in enumerate(series_keys):
+            if key not in o_rows: continue
+            idx = o_rows[key]
+            color = get_style_settings(i, bw_mode, palette_name, custom_colors)[0]
+            name = f"{key[0]} {key[1]} · {label}"
+            xs, (o_y,) = _grid(o_t[idx], o_value[idx])
+            fig.add_trace(Line(**xs, y=o_y, name=name, mode="lines", opacity=0.6,
+                               line=dict(width=max(1, line_width - 1), color=color, dash=["dash", "dot", "dashdot", "longdash"][j % 4]),
+                               hovertemplate="<b>%{y:,.2f}</b><br>%{x|%d.%m %H:%M} − " + f"{shift} діб<extra>" + name + "</extra>"))
 
-        if show_anomalies and "is_anomaly" in sub.columns:
-            anom = sub[sub["is_anomaly"]==True]
-            if not anom.empty:
-                ac = "black" if bw_mode else "red"
-                fig.add_trace(go.Scatter(x=anom["DateTime"], y=anom["Value"], mode="markers", marker=dict(color=ac, size=10, symbol="x"), name=f"{name} (Alert)", showlegend=False))
+    # Прогноз (forecast_utils) - смуга нижня/верхня межа і пунктир середнього після кінця даних
+    if forecast is not None and not forecast.empty:
+        f_rows, f_t = _series_rows(forecast)
+        f_cols = [forecast[c].to_numpy(np.float32) for c in ("Value", "lower", "upper")]
+        for i, key in enumerate(series_keys):
+            if key not in f_rows: continue
+            idx = f_rows[key]
+            color = get_style_settings(i, bw_mode, palette_name, custom_colors)[0]
+            name = f"{key[0]} {key[1]} · прогноз"
+            xs, (mean, lower, upper) = _grid(f_t[idx], *(c[idx] for c in f_cols))
+            fig.add_trace(Line(**xs, y=lower, mode="lines", line=dict(width=0, color=color), hoverinfo="skip", showlegend=False))
+            fig.add_trace(Line(**xs, y=upper, mode="lines", line=dict(width=0, color=color), fill="tonexty", fillcolor=color, opacity=0.15, hoverinfo="skip", showlegend=False))
+            fig.add_trace(Line(**xs, y=mean, name=name, mode="lines", customdata=np.stack([lower, upper], axis=1),
+                               line=dict(width=max(1, line_width - 1), color=color, dash="dot"),
+                               hovertemplate="<b>%{y:,.2f}</b> (%{customdata[0]:,.2f} - %{customdata[1]:,.2f})<br>%{x|%d.%m %H:%M}<extra>" + name + "</extra>"))
 
     axis = get_axis_style(bw_mode)
     x_ax = axis.copy()
     x_ax.update(dict(
-        title=labels.get("x", ""),
+        type="date", title=labels.get("x", ""),
         tickformatstops=[dict(dtickrange=[None, 86400000], value="%H:%M\n%d.%m"), dict(dtickrange=[86400000, None], value="%d.%m")],
         rangeslider=dict(visible=True, thickness=0.08),
         showgrid=True, gridcolor="rgba(128,128,128,0.2)", nticks=30,
@@ -109,11 +191,12 @@ def plot_30min_graph(df, height, line_width, show_pts, show_anomalies, chart_typ
     configure_legend(fig, legend_pos)
     return fig
 
-def plot_daily_bar(df, height, l_pos, labels, template, palette_name="Default", custom_colors=None, show_vals=False):
-    daily = df.groupby(["Date", "Type", "MeterID"])["Value"].sum().reset_index()
+def plot_daily_bar(df, height, l_pos, labels, template, palette_name="Default", custom_colors=None, show_vals=False, cube=None, overlays=None):
+    if cube is not None: daily = cube.daily_frame()
+    else: daily = df.groupby([schema_utils.get_dates(df), "Type", "MeterID"], observed=True)["Value"].sum().reset_index()
     fig = go.Figure()
     bw_mode = labels.get("bw", False)
-    groups = sorted(daily.groupby(["MeterID", "Type"]).groups.keys())
+    groups = sorted(daily.groupby(["MeterID", "Type"], observed=True).groups.keys())
     
     for i, key in enumerate(groups):
         meter, typ = key
@@ -131,6 +214,17 @@ def plot_daily_bar(df, height, l_pos, labels, template, palette_name="Default",
         ht = "<b>%{y:,.2f}</b><br>%{x|%d.%m.%Y}<extra>" + f"{meter} {typ}" + "</extra>"
         fig.add_trace(go.Bar(x=sub["Date"], y=sub["Value"], name=f"{meter} {typ}", marker=ms, hovertemplate=ht, texttemplate=text_template, textposition=text_pos))
 
+    # Періоди порівняння (compare_utils): добові суми на осі діб базового періоду, поруч зі своєю серією
+    for j, (label, odaily) in enumerate(overlays or []):
+        for i, (meter, typ) in enumerate(groups):
+            sub = odaily[(odaily["MeterID"]==meter) & (odaily["Type"]==typ)]
+            if sub.empty: continue
+            color = "black" if bw_mode else get_color(i, palette_name, False, custom_colors)
+            ms = dict(color="white" if bw_mode else color, opacity=0.45, line=dict(color=color, width=1), pattern=dict(shape=BAR_PATTERNS_BW[j % len(BAR_PATTERNS_BW)], fgcolor=color))
+            name = f"{meter} {typ} · {label}"
+            ht = "<b>%{y:,.2f}</b><br>%{x|%d.%m.%Y}<extra>" + name + "</extra>"
+            fig.add_trace(go.Bar(x=sub["Date"], y=sub["Value"], name=name, marker=ms, hovertemplate=ht))
+
     axis_x = get_axis_style(bw_mode).copy()
     axis_x.update(dict(title=labels.get("x", ""), tickformat="%d.%m", tickmode="linear", dtick=86400000.0, showgrid=True, gridcolor="rgba(128,128,128,0.2)", gridwidth=1))
 
@@ -138,27 +232,113 @@ def plot_daily_bar(df, height, l_pos, labels, template, palette_name="Default",
     configure_legend(fig, l_pos)
     return fig
 
-def plot_heatmap(df, height, show_text, labels, template, palette_name="Default"):
-    if df.empty: return go.Figure()
-    m, t = df.iloc[0]["MeterID"], df.iloc[0]["Type"]
-    sub = df[(df["MeterID"] == m) & (df["Type"] == t)].copy()
-    sub["TimeStr"] = sub["Time"].apply(lambda x: x.strftime("%H:%M"))
-    piv = sub.pivot_table(index="TimeStr", columns="Date", values="Value", aggfunc="sum")
-    piv.index = pd.to_datetime(piv.index, format="%H:%M").time
-    piv = piv.sort_index(); piv.index = [tm.strftime("%H:%M") for tm in piv.index]
-    new_cols = [d.strftime("%d.%m") for d in piv.columns]
-    piv.columns = new_cols
-    scale = PALETTE_TO_HEATMAP.get(palette_name, "RdYlGn_r")
-    txt = ".1f" if show_text else False
-    fig = px.imshow(piv, aspect="auto", color_continuous_scale=scale, text_auto=txt)
-    fig.update_layout(height=height, title=f"{m} {t}", template=template, margin=dict(t=40, b=20, l=40, r=40))
+def _heat_trace(cube, i, **kw):
+    """Теплова карта серії i: масив доба × 48 куба транспонований (півгодини - вертикаль), осі - доби й мітки слотів."""
+    m, s = cube.series[i]
+    return go.Heatmap(z=cube.series_matrix(i).T, x=cube.days(), y=schema_utils.SLOT_LABELS,
+                      hovertemplate="%{x|%d.%m.%Y} %{y}<br><b>%{z:,.2f}</b><extra>" + f"{m} {cube_utils.TYPE_LABELS[s]}" + "</extra>", **kw)
+
+def plot_heatmap(df, height, show_text, labels, template, palette_name="Default", cube=None):
+    # Матриця доба × 48 - view куба без pivot_table і рядкових міток; таблиця спершу перетворюється на куб
+    if cube is None:
+        if df.empty: return go.Figure()
+        first = df.iloc[0]
+        cube = cube_utils.SeriesCube.from_frame(df[(df["MeterID"] == first["MeterID"]) & (df["Type"] == first["Type"])])
+    if cube.is_empty(): return go.Figure()
+    m, s = cube.series[0]
+    text = dict(texttemplate="%{z:.1f}") if show_text else {}
+    fig = go.Figure(_heat_trace(cube, 0, colorscale=PALETTE_TO_HEATMAP.get(palette_name, "RdYlGn_r"), **text))
+    fig.update_layout(height=height, title=f"{m} {cube_utils.TYPE_LABELS[s]}", template=template, margin=dict(t=40, b=20, l=40, r=40),
+                      xaxis=dict(tickformat="%d.%m"), yaxis=dict(autorange="reversed"))
     return fig
 
-def plot_pq_scatter(df, height, show_cos, l_pos, bw_mode, labels, template, palette_name="Default", custom_colors=None, show_labels=False):
-    df_c = df[df["Suffix"].isin([2, 4])]
-    if df_c.empty: return go.Figure()
-    piv = df_c.pivot_table(index=["DateTime", "MeterID"], columns="Suffix", values="Value").reset_index()
-    if 2 not in piv.columns or 4 not in piv.columns: return go.Figure()
+def plot_heatmap_grid(height, template, palette_name="Default", cube=None):
+    """
+    Малі теплові карти всіх серій куба поруч (HEAT_GRID_COLS у ряд) зі спільною шкалою кольору - з тих самих масивів доба × 48.
+    Осі розкладаються одним словником layout: make_subplots + update_*axes на десятках осей у рази повільніші.
+    """
+    if cube is None or cube.is_empty(): return go.Figure()
+    n = cube.n_series
+    cols = min(n, HEAT_GRID_COLS)
+    rows = -(-n // cols)
+    gap_x, gap_y = 0.02, min(0.08, 0.3 / rows)
+    w, hgt = (1 - gap_x * (cols - 1)) / cols, (1 - gap_y * (rows - 1)) / rows
+    layout, titles, traces = {}, [], []
+    for i, (m, s) in enumerate(cube.series):
+        r, c = divmod(i, cols)
+        k = str(i + 1) if i else ""
+        x0, y1 = c * (w + gap_x), 1 - r * (hgt + gap_y)
+        # Спільний масштаб: осі всіх карт зв'язані з першою, підписи - лише знизу й зліва
+        layout[f"xaxis{k}"] = dict(domain=[x0, min(x0 + w, 1)], anchor=f"y{k}", tickformat="%d.%m", nticks=6, showticklabels=i + cols >= n, **({"matches": "x"} if i else {}))
+        layout[f"yaxis{k}"] = dict(domain=[max(y1 - hgt, 0), y1], anchor=f"x{k}", showticklabels=c == 0, tickvals=schema_utils.SLOT_LABELS[::12],
+                                   **({"matches": "y"} if i else {"autorange": "reversed"}))
+        titles.append(dict(text=f"{m} {cube_utils.TYPE_LABELS[s].split('(')[0].strip()}", x=x0 + w / 2, y=y1, xref="paper", yref="paper",
+                           xanchor="center", yanchor="bottom", showarrow=False, font=dict(size=11)))
+        traces.append(_heat_trace(cube, i, coloraxis="coloraxis", xaxis=f"x{k}", yaxis=f"y{k}"))
+    return go.Figure(traces, dict(**layout, annotations=titles, height=max(height, rows * HEAT_GRID_ROW_PX), template=template,
+                                  margin=dict(t=40, b=20, l=40, r=40), coloraxis=dict(colorscale=PALETTE_TO_HEATMAP.get(palette_name, "RdYlGn_r"))))
+
+def plot_coverage_heatmap(cov, height, template):
+    """Теплова карта пропусків: серії × доби, колір - частка наявних півгодин (coverage_utils.Coverage)."""
+    if cov.n_series == 0 or cov.n_days == 0: return go.Figure()
+    labels, days, pct = cov.gap_matrix()
+    fig = go.Figure(go.Heatmap(
+        z=pct, x=pd.to_datetime(days), y=labels, zmin=0, zmax=100,
+        colorscale=[[0, "#d62728"], [0.5, "#ffdd57"], [1, "#2ca02c"]],
+        colorbar=dict(title="%"), xgap=1, ygap=1,
+        hovertemplate="%{y}<br>%{x|%d.%m.%Y}<br>Повнота: %{z:.0f}%<extra></extra>",
+    ))
+    fig.update_layout(height=max(height, 18 * len(labels) + 80), template=template, margin=dict(t=30, b=20, l=40, r=40),
+                      xaxis=dict(tickformat="%d.%m"), yaxis=dict(autorange="reversed"))
+    return fig
+
+def plot_tariff_costs(bill_df, height, template, palette_name="Default", bw_mode=False):
+    """Вартість за зонами тарифу: стовпчик на серію (лічильник + канал), сегменти - зони (tariff_utils.bill)."""
+    if bill_df.empty: return go.Figure()
+    names = bill_df["MeterID"].astype(str) + " " + bill_df["Type"].astype(str).str.split("(").str[0].str.strip()
+    fig = go.Figure()
+    for i, zone in enumerate(dict.fromkeys(bill_df["Zone"])):
+        sel = (bill_df["Zone"] == zone).to_numpy()
+        d = bill_df[sel]
+        fig.add_trace(go.Bar(x=names[sel], y=d["Cost"], name=zone, marker_color=get_color(i, palette_name, bw_mode),
+                             customdata=d["Energy"], hovertemplate="%{x}<br>" + zone + ": %{y:,.2f} грн<br>%{customdata:,.1f} кВт·год<extra></extra>"))
+    fig.update_layout(barmode="stack", height=height, template=template, margin=dict(t=30, b=20, l=40, r=40), yaxis_title="грн")
+    return fig
+
+def plot_coincident_peaks(contrib, height, template, palette_name="Default", bw_mode=False):
+    """Збіжні піки (peak_utils.contributions): стовпчик на пік, сегменти - внески найбільших серій і «Інші»."""
+    if contrib.empty: return go.Figure()
+    x = contrib["Rank"].astype(str) + ". " + pd.to_datetime(contrib["DateTime"]).dt.strftime("%d.%m.%Y %H:%M")
+    fig = go.Figure()
+    for i, name in enumerate(dict.fromkeys(contrib["Series"])):
+        sel = (contrib["Series"] == name).to_numpy()
+        color = "#999999" if name == "Інші" else get_color(i, palette_name, bw_mode)
+        fig.add_trace(go.Bar(x=x[sel], y=contrib["Value"][sel], name=name, marker_color=color,
+                             hovertemplate="%{x}<br>%{y:,.2f}<extra>" + name + "</extra>"))
+    fig.update_layout(barmode="stack", height=height, template=template, margin=dict(t=30, b=20, l=40, r=40), xaxis=dict(type="category"))
+    return fig
+
+def _pq_frame_from_cube(cube):
+    """Пари P/Q з куба: view серій 2 і 4 кожного лічильника, без pivot_table."""
+    pairs = cube.pq_pairs(2, 4)
+    if not pairs: return pd.DataFrame()
+    ts = cube.timestamps()
+    parts = []
+    for m, p, q in pairs:
+        p, q = p.ravel(), q.ravel()
+        ok = ~(np.isnan(p) & np.isnan(q))
+        parts.append(pd.DataFrame({"DateTime": ts[ok], "MeterID": m, 2: p[ok], 4: q[ok]}))
+    return pd.concat(parts, ignore_index=True)
+
+def plot_pq_scatter(df, height, show_cos, l_pos, bw_mode, labels, template, palette_name="Default", custom_colors=None, show_labels=False, cube=None):
+    if cube is not None:
+        piv = _pq_frame_from_cube(cube)
+        if piv.empty: return go.Figure()
+    else:
+        df_c = df[df["Suffix"].isin([2, 4])]
+        if df_c.empty: return go.Figure()
+        piv = df_c.pivot_table(index=["DateTime", "MeterID"], columns="Suffix", values="Value", observed=True).reset_index()
+        if 2 not in piv.columns or 4 not in piv.columns: return go.Figure()
     piv["TimeStr"] = piv["DateTime"].dt.strftime("%d.%m %H:%M")
     fig = go.Figure()
     meters = sorted(piv["MeterID"].unique())
@@ -173,13 +353,53 @@ def plot_pq_scatter(df, height, show_cos, l_pos, bw_mode, labels, template, pale
     fig.update_layout(xaxis=dict(**axis, title=labels.get("p", "P")), yaxis=dict(**axis, title=labels.get("q", "Q")), height=height, template=template, margin=dict(t=30, b=20, l=40, r=40))
     if show_cos:
         mx = piv[2].max() if not piv.empty else 100
-        slope = math.tan(math.acos(0.96))
-        fig.add_trace(go.Scatter(x=[0, mx], y=[0, mx*slope], mode="lines", line=dict(color="black" if bw_mode else "green", dash="dash"), name="Cos φ 0.96"))
+        slope = quality_utils.TAN_PHI_LIMIT
+        fig.add_trace(go.Scatter(x=[0, mx], y=[0, mx*slope], mode="lines", line=dict(color="black" if bw_mode else "green", dash="dash"), name=f"Cos φ {quality_utils.COS_PHI_LIMIT}"))
     configure_legend(fig, l_pos)
     return fig
 
 # --- НОВА ФУНКЦІЯ (СКРИПКОВИЙ ГРАФІК) ---
-def plot_violin_distribution(df, height, group_by, template, palette_name="Default", custom_colors=None, labels=None):
+def _violin_quantiles(cube, group_by):
+    """
+    Підписи кошиків і {мітка Type: [кошик, VIOLIN_QUANTILES]} прямо з куба: замість усіх сирих значень у браузер іде
+    рівномірна сітка квантилів кожної групи (тип × година / день тижня) - той самий розподіл, межі й квартилі.
+    """
+    q = np.linspace(0, 1, VIOLIN_QUANTILES)
+    out = {}
+    for sfx in dict.fromkeys(s for _, s in cube.series):
+        v = cube.values[[i for i, (_, s) in enumerate(cube.series) if s == sfx]]
+        if group_by == 'Hour':
+            groups = np.moveaxis(v.reshape(len(v), cube.n_days, 24, 2), 2, 0).reshape(24, -1)
+        else:
+            wd = (cube.days().astype("datetime64[D]").astype(np.int64) + 3) % 7   # 1970-01-01 - четвер
+            groups = [v[:, wd == d].ravel() for d in range(7)]
+        with np.errstate(invalid="ignore"), warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)   # кошик без даних - NaN, просто не малюється
+            out[cube_utils.TYPE_LABELS[sfx]] = np.stack([np.nanquantile(g, q) if len(g) else np.full(len(q), np.nan) for g in groups])
+    ticks = list(range(24)) if group_by == 'Hour' else list(DAY_LABELS.values())
+    return ticks, out
+
+def plot_violin_distribution(df, height, group_by, template, palette_name="Default", custom_colors=None, labels=None, cube=None):
+    if palette_name == "Custom" and custom_colors:
+        scale = custom_colors
+    else:
+        scale = PALETTES.get(palette_name, PALETTES["Default"])
+    y_title = labels.get("y", "Значення") if labels else "Значення"
+    layout = dict(height=height, template=template, yaxis_title=y_title, violinmode='group',
+                  margin=dict(t=30, b=20, l=40, r=40), legend=dict(orientation="h", y=1.1, x=0))
+
+    if cube is not None:
+        # Розподіл з куба: квантилі кожної групи замість сирих рядків
+        if cube.is_empty(): return go.Figure()
+        ticks, groups = _violin_quantiles(cube, group_by)
+        fig = go.Figure()
+        for i, (typ, qs) in enumerate(groups.items()):
+            x = np.repeat(np.asarray(ticks, dtype=object), qs.shape[1])
+            fig.add_trace(go.Violin(x=x, y=qs.ravel().astype(np.float32), name=typ, legendgroup=typ, scalegroup=typ, box_visible=True,
+                                    points=False, spanmode='hard', line_color=scale[i % len(scale)], hoverinfo="y"))
+        fig.update_layout(**layout, xaxis=dict(title="Година доби" if group_by == 'Hour' else "День тижня", type="category", categoryorder="array", categoryarray=ticks))
+        return fig
+
     if df.empty: return go.Figure()
     df = df.copy()
     
@@ -188,18 +408,11 @@ def plot_violin_distribution(df, height, group_by, template, palette_name="Defau
         x_label = "Година доби"
         category_orders = {'X_Axis': list(range(24))}
     else: 
-        days_map = {0: '01. Пн', 1: '02. Вт', 2: '03. Ср', 3: '04. Чт', 4: '05. Пт', 5: '06. Сб', 6: '07. Нд'}
+        days_map = DAY_LABELS
         df['X_Axis'] = df['DateTime'].dt.dayofweek.map(days_map)
         x_label = "День тижня"
         category_orders = {'X_Axis': sorted(list(days_map.values()))}
 
-    if palette_name == "Custom" and custom_colors:
-        scale = custom_colors
-    else:
-        scale = PALETTES.get(palette_name, PALETTES["Default"])
-
-    y_title = labels.get("y", "Значення") if labels else "Значення"
-
     fig = px.violin(
         df, x='X_Axis', y='Value', color='Type', box=True, points=False,
         hover_data=['DateTime'], color_discrete_sequence=scale, category_orders=category_orders
@@ -208,11 +421,5 @@ def plot_violin_distribution(df, height, group_by, template, palette_name="Defau
     # --- ВИПРАВЛЕННЯ: Додано spanmode='hard' для обрізки "хвостів" ---
     fig.update_traces(spanmode='hard')
 
-    fig.update_layout(
-        height=height, template=template, 
-        xaxis_title=x_label, yaxis_title=y_title, 
-        violinmode='group', 
-        margin=dict(t=30, b=20, l=40, r=40), 
-        legend=dict(orientation="h", y=1.1, x=0)
-    )
+    fig.update_layout(**layout, xaxis_title=x_label)
     return fig
\ No newline at end of file
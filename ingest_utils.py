@@ -0,0 +1,52 @@
+import io
+import os
+import zipfile
+from collections import namedtuple
+from datetime import datetime
+
+# Джерело одного файлу 30917: відкривається на вимогу, вміст цілком у пам'ять не читається.
+# open() щоразу повертає новий бінарний потік (його можна прочитати двічі: хеш + розбір)
+Source = namedtuple("Source", ["name", "size", "context_date", "open"])
+
+def _is_zip(name):
+    return name.lower().endswith(".zip")
+
+def _is_data_file(name):
+    return name.lower().endswith(".txt")
+
+def iter_zip(fileobj, context_date=None):
+    """Файли .txt з ZIP-архіву по одному, без розпакування на диск."""
+    ctx = context_date or datetime.now()
+    with zipfile.ZipFile(fileobj) as zf:
+        for info in zf.infolist():
+            if info.is_dir() or not _is_data_file(info.filename): continue
+            yield Source(os.path.basename(info.filename), info.file_size, ctx, lambda info=info: zf.open(info))
+
+def iter_uploads(uploads, context_date=None):
+    """Джерела з st.file_uploader: звичайні .txt та вміст .zip-архівів."""
+    ctx = context_date or datetime.now()
+    for f in uploads:
+        if _is_zip(f.name):
+            f.seek(0)
+            yield from iter_zip(f, ctx)
+        else:
+            # UploadedFile закривати не можна - кожне відкриття дає окремий потік над його буфером
+            yield Source(f.name, f.size, ctx, lambda f=f: io.BytesIO(f.getbuffer()))
+
+def iter_paths(paths, context_date=None):
+    """Джерела з локальних шляхів (файли або .zip), напр. для архівних вивантажень."""
+    ctx = context_date or datetime.now()
+    for p in paths:
+        if _is_zip(p):
+            with open(p, "rb") as fh:
+                yield from iter_zip(fh, ctx)
+        else:
+            yield Source(os.path.basename(p), os.path.getsize(p), ctx, lambda p=p: open(p, "rb"))
+
+def iter_bytes(files_data, context_date=None):
+    """Джерела з кортежів (name, bytes[, context_date]) - формат mail_utils і parse_askue_files."""
+    for item in files_data:
+        name, b = item[0], item[1]
+        ctx = item[2] if len(item) == 3 else (context_date or datetime.now())
+        if _is_zip(name): yield from iter_zip(io.BytesIO(b), ctx)
+        else: yield Source(name, len(b), ctx, lambda b=b: io.BytesIO(b))
@@ -1,115 +1,344 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime, timedelta
+import numpy as np
+import os
+import io
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+import cache_utils
+import schema_utils
+from cube_utils import SeriesCube
 
-@st.cache_data(show_spinner=False)
-def parse_askue_files(files_data):
+logger = logging.getLogger(__name__)
+SLOTS = schema_utils.SLOTS
+TYPE_LABELS = schema_utils.TYPE_LABELS
+COLUMNS = schema_utils.COLUMNS
+
+# Паралельний розбір: з меншою кількістю файлів старт пулу дорожчий за виграш
+PARALLEL_MIN_FILES = 24
+# Потоковий розбір: розмір порції рядків, що скидається в набір даних
+STREAM_CHUNK_ROWS = 500_000
+
+SLOT_OFFSETS = schema_utils.SLOT_OFFSETS
+SLOT_TIMES = schema_utils.SLOT_TIMES
+
+def _decode(b):
+    try: return b.decode("utf-8")
+    except UnicodeDecodeError: return b.decode("cp1251", errors="ignore")
+
+def _parse_header_date(header, context_date):
+    """Дата файлу з заголовка '30917:YYMMDD' або '30917:MMDD' (рік з контексту)."""
+    if "30917" not in header: return None
+    parts = header.split(":")
+    if len(parts) < 2: return None
+    date_part = parts[1].strip()
+    try:
+        # ВАРІАНТ А: 6 цифр (YYMMDD) - Рік є
+        if len(date_part) == 6 and date_part.isdigit():
+            day = int(date_part[4:6])
+            month = int(date_part[2:4])
+            year = 2000 + int(date_part[0:2])
+            return datetime(year, month, day).date()
+
+        # ВАРІАНТ Б: 4 цифри (MMDD) - Рік з контексту
+        if len(date_part) == 4 and date_part.isdigit():
+            month = int(date_part[:2])
+            day = int(date_part[2:])
+
+            # Базовий рік - рік отримання файлу
+            year = context_date.year
+
+            # Корекція на стику років
+            # Якщо файл за Грудень (12), а зараз Січень (1) -> це минулий рік
+            if month == 12 and context_date.month == 1:
+                year -= 1
+            # Якщо файл за Січень (1), а зараз Грудень (12) -> це майбутній рік (рідко)
+            elif month == 1 and context_date.month == 12:
+                year += 1
+
+            return datetime(year, month, day).date()
+    except: pass
+    return None
+
+def _parse_value_row(fields):
+    """Повільний шлях для одного рядка: порожні поля -> NaN (немає даних), помилка -> None."""
+    try: return [float(v.strip()) if v.strip() else np.nan for v in fields]
+    except ValueError: return None
+
+def _parse_data_lines(lines):
     """
-    Парсить файли. 
-    files_data - список кортежів: (name, bytes, context_date)
+    Розбирає рядки '(MMMMMs):...:v1:...:v48' в блок:
+    (meters, suffixes, values[n, 48]). Кожен рядок ділиться лише один раз.
+    """
+    meters, suffixes, flat = [], [], []
+    for line in lines:
+        if not line.startswith("(") or "):" not in line: continue
+        head, _, rest = line.partition(":")
+        code_raw = head.replace("(", "").replace(")", "")
+        if len(code_raw) < 5: continue
+        try: suf = int(code_raw[-1])
+        except: continue
+        if suf not in TYPE_LABELS: continue
+
+        fields = rest.replace(",", ".").split(":")[1:1 + SLOTS]
+        if len(fields) < SLOTS: fields += [""] * (SLOTS - len(fields))
+        meters.append(code_raw[:5]); suffixes.append(suf); flat.extend(fields)
+
+    n = len(meters)
+    if not n: return [], np.empty(0, dtype=np.int64), np.empty((0, SLOTS))
+
+    # Порожнє або відсутнє поле - інтервал без даних (NaN), а не нуль
+    raw = np.array(flat, dtype=object)
+    raw[raw == ""] = "nan"
+    try:
+        values = raw.astype(np.float64).reshape(n, SLOTS)
+    except ValueError:
+        # Є зіпсовані поля: розбираємо по рядках і відкидаємо невалідні
+        rows = [_parse_value_row(flat[i * SLOTS:(i + 1) * SLOTS]) for i in range(n)]
+        keep = [i for i, r in enumerate(rows) if r is not None]
+        meters = [meters[i] for i in keep]; suffixes = [suffixes[i] for i in keep]
+        values = np.array([rows[i] for i in keep], dtype=np.float64).reshape(len(keep), SLOTS)
+    return meters, np.array(suffixes, dtype=np.int64), values
+
+def _file_info(name, b):
+    return {"name": name, "size": f"{len(b) / 1024:.1f} KB"}
+
+def _parse_file(name, b, context_date):
+    """
+    Парсить один файл.
+    Повертає (file_info, error, block); block - dict з датою та 48-колонковим масивом значень.
+    """
+    try:
+        text = _decode(b)
+        file_info = _file_info(name, b)
+    except Exception as e:
+        return None, f"{name}: Помилка читання ({str(e)})", None
+
+    lines = text.splitlines()
+    file_date = _parse_header_date(lines[0], context_date) if lines else None
+    if not file_date:
+        return file_info, f"{name}: Дата не знайдена в заголовку", None
+
+    meters, suffixes, values = _parse_data_lines(lines)
+    return file_info, None, {"date": file_date, "meters": meters, "suffixes": suffixes, "values": values}
+
+def blocks_to_frame(blocks, compact=False):
+    """
+    Збирає довгу таблицю з блоків: np.repeat/np.tile замість словника на кожне значення.
+    compact=True - схема schema_utils.COMPACT_DTYPES (без Date/Time, категорії, int8/float32).
+    """
+    blocks = [b for b in blocks if len(b["meters"])]
+    if not blocks: return pd.DataFrame()
+
+    line_dates = np.concatenate([np.full(len(b["meters"]), b["date"], dtype=object) for b in blocks])
+    meters = np.concatenate([np.asarray(b["meters"], dtype=object) for b in blocks])
+    suffixes = np.concatenate([b["suffixes"] for b in blocks])
+    values = np.concatenate([b["values"] for b in blocks])
+
+    # Останній рядок з тим самим (дата, лічильник, канал) перемагає: дублікати на рівні рядків
+    # еквівалентні дублікатам на рівні (DateTime, MeterID, Type), бо рядок - це повна доба
+    key = pd.MultiIndex.from_arrays([line_dates, meters, suffixes])
+    keep = ~key.duplicated(keep="last")
+
+    lines_idx = np.flatnonzero(keep)
+    day_us = line_dates[lines_idx].astype("datetime64[D]").astype("datetime64[us]").astype(np.int64)
+    ts = (np.repeat(day_us, SLOTS) + np.tile(SLOT_OFFSETS, len(lines_idx))).view("datetime64[us]")
+
+    # Сортування за часом: ті ж ключі й той самий алгоритм, що й у sort_values("DateTime"),
+    # але колонки одразу збираються у відсортованому порядку (одним take з рядків файлу)
+    order = np.argsort(ts, kind="quicksort")
+    # Інтервали без даних у довгу таблицю не потрапляють (як і в SeriesCube.to_frame)
+    order = order[~np.isnan(values[lines_idx].reshape(-1)[order])]
+    row_line, row_slot = order // SLOTS, order % SLOTS
+    src_line = lines_idx[row_line]
+
+    if compact:
+        m_cats, m_codes = np.unique(meters[lines_idx].astype(str), return_inverse=True)
+        s_cats, s_codes = np.unique(suffixes[lines_idx], return_inverse=True)
+        return pd.DataFrame({
+            "DateTime": ts[order],
+            "MeterID": pd.Categorical.from_codes(m_codes[row_line], categories=m_cats),
+            "Type": pd.Categorical.from_codes(s_codes[row_line], categories=[TYPE_LABELS[s] for s in s_cats]),
+            "Suffix": suffixes[src_line].astype(np.int8),
+            "Value": values[src_line, row_slot].astype(np.float32),
+        }, index=src_line * SLOTS + row_slot)
+
+    labels = pd.Index([TYPE_LABELS[s] for s in suffixes[lines_idx]])
+    return pd.DataFrame({
+        "DateTime": ts[order],
+        "Date": line_dates[src_line],
+        "Time": SLOT_TIMES[row_slot],
+        "MeterID": pd.Index(meters[lines_idx]).take(row_line),
+        "Type": labels.take(row_line),
+        "Suffix": suffixes[src_line],
+        "Value": values[src_line, row_slot],
+    }, index=src_line * SLOTS + row_slot, columns=COLUMNS)
+
+def _unpack_item(item):
+    # Розпаковка: якщо передано 2 елементи, дату ставимо поточну
+    if len(item) == 3: return item
+    name, b = item
+    return name, b, datetime.now()
+
+def _parse_item(item):
+    return _parse_file(*item)
+
+def _resolve_workers(workers, n_files):
+    if workers is not None: return max(1, int(workers))
+    if n_files < PARALLEL_MIN_FILES: return 1
+    return min(os.cpu_count() or 1, n_files)
+
+def _parse_items(items, workers):
+    """
+    Розбирає файли послідовно або в пулі процесів.
+    Результати завжди повертаються в порядку items - злиття детерміноване.
+    """
+    if workers <= 1: return [_parse_item(it) for it in items]
+    try:
+        chunk = max(1, len(items) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            return list(ex.map(_parse_item, items, chunksize=chunk))
+    except (OSError, PermissionError, BrokenProcessPool) as e:
+        # Пул не стартував (обмеження середовища, процес не запустився) - послідовно.
+        # Помилки окремих файлів сюди не доходять: вони вже в error_files (_parse_file)
+        logger.warning("Пул процесів недоступний (%s: %s) - розбір послідовно", type(e).__name__, e)
+        return [_parse_item(it) for it in items]
+
+def _parse_items_cached(items, workers):
+    """
+    Як _parse_items, але спершу шукає кожен файл у дисковому кеші (cache_utils).
+    Розбираються лише файли, вміст яких ще не зустрічався.
     """
-    all_rows = []
+    keys = [cache_utils.file_key(b, ctx) for _, b, ctx in items]
+    results = [None] * len(items)
+    for i, ((name, b, _), key) in enumerate(zip(items, keys)):
+        block = cache_utils.load_block(key)
+        if block: results[i] = (_file_info(name, b), None, block)
+
+    missing = [i for i, r in enumerate(results) if r is None]
+    parsed = _parse_items([items[i] for i in missing], _resolve_workers(workers, len(missing)))
+    for i, res in zip(missing, parsed):
+        results[i] = res
+        if res[2]: cache_utils.save_block(keys[i], res[2])
+    if missing: cache_utils.evict()
+    # Ключ вмісту - і в file_info: за ним сесії впізнають однаковий набір файлів без хешування куба
+    for (info, _, _), key in zip(results, keys):
+        if info: info["key"] = key
+    return results
+
+def _collect_blocks(files_data, workers, use_cache):
+    blocks = []
     file_info_list = []
     error_files = []
 
-    for item in files_data:
-        # Розпаковка: якщо передано 2 елементи, дату ставимо поточну
-        if len(item) == 3:
-            name, b, context_date = item
-        else:
-            name, b = item
-            context_date = datetime.now()
+    items = [_unpack_item(item) for item in files_data]
+    if use_cache and cache_utils.is_enabled():
+        results = _parse_items_cached(items, workers)
+    else:
+        results = _parse_items(items, _resolve_workers(workers, len(items)))
+
+    for info, err, block in results:
+        if info: file_info_list.append(info)
+        if err: error_files.append(err)
+        if block: blocks.append(block)
+    return blocks, file_info_list, error_files
+
+@st.cache_data(show_spinner=False)
+def parse_askue_files(files_data, compact=False, workers=None, use_cache=True):
+    """
+    Парсить файли.
+    files_data - список кортежів: (name, bytes, context_date)
+    compact - повернути таблицю в компактній схемі (див. schema_utils)
+    workers - кількість процесів; None = усі ядра для великих пакетів, 1 = послідовно
+    use_cache - брати вже розібрані файли з дискового кешу (переживає перезапуск)
+    """
+    blocks, file_info_list, error_files = _collect_blocks(files_data, workers, use_cache)
+    # Блоки йдуть у порядку файлів, тож "останній перемагає" працює як і раніше
+    df = blocks_to_frame(blocks, compact=compact)
+    return df, file_info_list, error_files
 
+@st.cache_data(show_spinner=False)
+def parse_askue_cube(files_data, workers=None, use_cache=True):
+    """
+    Те саме, що parse_askue_files, але результат - куб cube_utils.SeriesCube,
+    заповнений прямо з блоків (довга таблиця не будується).
+    """
+    blocks, file_info_list, error_files = _collect_blocks(files_data, workers, use_cache)
+    return SeriesCube.from_blocks(blocks), file_info_list, error_files
+
+# --- ПОТОКОВИЙ РОЗБІР (великі завантаження та ZIP-архіви) ---
+def _parse_stream(name, size, open_fn, context_date):
+    """
+    Розбирає один файл рядок за рядком прямо з потоку (див. ingest_utils.Source).
+    Текст файлу і список рядків цілком у пам'яті не тримаються.
+    """
+    file_info = {"name": name, "size": f"{size / 1024:.1f} KB"}
+    for encoding, errors in (("utf-8", "strict"), ("cp1251", "ignore")):
         try:
-            size_kb = len(b) / 1024
-            try: text = b.decode("utf-8")
-            except UnicodeDecodeError: text = b.decode("cp1251", errors="ignore")
-            file_info_list.append({"name": name, "size": f"{size_kb:.1f} KB"})
-        except Exception as e:
-            error_files.append(f"{name}: Помилка читання ({str(e)})")
+            with open_fn() as raw:
+                text = io.TextIOWrapper(raw, encoding=encoding, errors=errors)
+                lines = (line.rstrip("\r\n") for line in text)
+                header = next(lines, None)
+                file_date = _parse_header_date(header, context_date) if header is not None else None
+                if not file_date:
+                    return file_info, f"{name}: Дата не знайдена в заголовку", None
+                meters, suffixes, values = _parse_data_lines(lines)
+            return file_info, None, {"date": file_date, "meters": meters, "suffixes": suffixes, "values": values}
+        except UnicodeDecodeError:
             continue
+        except Exception as e:
+            return None, f"{name}: Помилка читання ({str(e)})", None
+    return None, f"{name}: Помилка читання (кодування)", None
 
-        lines = text.splitlines()
-        file_date = None
-        
-        # 1. Пошук дати в заголовку
-        if lines:
-            header = lines[0]
-            if "30917" in header:
-                parts = header.split(":")
-                if len(parts) >= 2:
-                    date_part = parts[1].strip()
-                    try:
-                        # ВАРІАНТ А: 6 цифр (YYMMDD) - Рік є
-                        if len(date_part) == 6 and date_part.isdigit():
-                            day = int(date_part[4:6])
-                            month = int(date_part[2:4])
-                            year = 2000 + int(date_part[0:2])
-                            file_date = datetime(year, month, day).date()
-                            
-                        # ВАРІАНТ Б: 4 цифри (MMDD) - Рік з контексту
-                        elif len(date_part) == 4 and date_part.isdigit():
-                            month = int(date_part[:2])
-                            day = int(date_part[2:])
-                            
-                            # Базовий рік - рік отримання файлу
-                            year = context_date.year
-                            
-                            # Корекція на стику років
-                            # Якщо файл за Грудень (12), а зараз Січень (1) -> це минулий рік
-                            if month == 12 and context_date.month == 1:
-                                year -= 1
-                            # Якщо файл за Січень (1), а зараз Грудень (12) -> це майбутній рік (рідко)
-                            elif month == 1 and context_date.month == 12:
-                                year += 1
-                                
-                            file_date = datetime(year, month, day).date()
-                    except:
-                        pass
-        
-        if not file_date:
-            error_files.append(f"{name}: Дата не знайдена в заголовку")
-            continue
+def _parse_source(src, use_cache):
+    if not (use_cache and cache_utils.is_enabled()):
+        return _parse_stream(src.name, src.size, src.open, src.context_date), False
+    try:
+        with src.open() as raw: key = cache_utils.stream_key(raw, src.context_date)
+    except Exception as e:
+        return (None, f"{src.name}: Помилка читання ({str(e)})", None), False
+    block = cache_utils.load_block(key)
+    if block: return ({"name": src.name, "size": f"{src.size / 1024:.1f} KB", "key": key}, None, block), False
+    res = _parse_stream(src.name, src.size, src.open, src.context_date)
+    if res[0]: res[0]["key"] = key
+    if res[2]: cache_utils.save_block(key, res[2])
+    return res, True
+
+def _iter_block_chunks(sources, chunk_rows, use_cache):
+    pending, infos, errs, rows, parsed_any = [], [], [], 0, False
+    for src in sources:
+        (info, err, block), parsed = _parse_source(src, use_cache)
+        parsed_any |= parsed
+        if info: infos.append(info)
+        if err: errs.append(err)
+        if block:
+            pending.append(block)
+            rows += len(block["meters"]) * SLOTS
+        if rows >= chunk_rows:
+            yield pending, infos, errs
+            pending, infos, errs, rows = [], [], [], 0
+    if pending or infos or errs:
+        yield pending, infos, errs
+    if parsed_any: cache_utils.evict()
 
-        # 2. Парсинг рядків
-        for line in lines:
-            if line.startswith("(") and "):" in line:
-                try:
-                    parts = line.split(":")
-                    code_raw = parts[0].replace("(", "").replace(")", "")
-                    if len(code_raw) < 5: continue
-                    
-                    mid = code_raw[:5]
-                    try: suf = int(code_raw[-1])
-                    except: continue
-                    if suf not in [1, 2, 3, 4]: continue
-
-                    t_lbl = {
-                        1: "Активная генерация(1) (кВт)",
-                        2: "Активное потребление(2) (кВт)",
-                        3: "Реактивная генерация(3) (кВАр)",
-                        4: "Реактивное потребление(4) (кВАр)"
-                    }.get(suf, "Unknown")
-
-                    for i in range(48):
-                        data_index = i + 2 
-                        val = 0.0
-                        if data_index < len(parts):
-                            raw_val = parts[data_index].replace(",", ".").strip()
-                            if raw_val: val = float(raw_val)
-                        
-                        ts = datetime.combine(file_date, datetime.min.time()) + timedelta(minutes=i*30)
-                        
-                        all_rows.append({
-                            "DateTime": ts, "Date": file_date, "Time": ts.time(),
-                            "MeterID": mid, "Type": t_lbl, "Suffix": suf, "Value": val
-                        })
-
-                except Exception: pass
-    
-    df = pd.DataFrame(all_rows)
-    if not df.empty:
-        df = df.drop_duplicates(subset=["DateTime", "MeterID", "Type"], keep="last")
-        df = df.sort_values("DateTime")
-
-    return df, file_info_list, error_files
\ No newline at end of file
+def iter_askue_chunks(sources, compact=True, chunk_rows=STREAM_CHUNK_ROWS, use_cache=True):
+    """
+    Потоковий розбір: sources - ітератор ingest_utils.Source.
+    Віддає (df, file_info, errors) порціями приблизно по chunk_rows рядків,
+    тож у пам'яті одночасно лише одна нескомпонована порція блоків.
+    """
+    for blocks, infos, errs in _iter_block_chunks(sources, chunk_rows, use_cache):
+        yield blocks_to_frame(blocks, compact=compact), infos, errs
+
+def parse_askue_stream_cube(sources, chunk_rows=STREAM_CHUNK_ROWS, use_cache=True):
+    """
+    Потоковий розбір одразу в куб: кожна порція вливається в SeriesCube і звільняється.
+    Довга таблиця, якщо потрібна, - cube.to_frame() один раз, без накопичення порцій-таблиць.
+    """
+    cube, file_info_list, error_files = SeriesCube.empty(), [], []
+    for blocks, infos, errs in _iter_block_chunks(sources, chunk_rows, use_cache):
+        cube.update(SeriesCube.from_blocks(blocks))
+        file_info_list += infos; error_files += errs
+    return cube, file_info_list, error_files
@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+import schema_utils
+
+# Аналітика піків над усім кубом: найбільші півгодини серій (за весь період і помісячно), збіжні піки
+# (сума вибраного каналу всіх лічильників в одному інтервалі) і максимальна потужність за ковзне вікно з N інтервалів.
+# Відбір - частковим сортуванням (argpartition) по рядку серії, вікна - різницею кумулятивних сум, усе для всіх серій разом.
+SLOTS = schema_utils.SLOTS
+US_PER_SLOT = 30 * 60 * 1_000_000
+WINDOWS = {1: "30 хв", 2: "1 год", 4: "2 год", 6: "3 год"}
+CHUNK = 256  # серій за прохід ковзних вікон - обмежує пам'ять на кумулятивні суми
+
+def _times(cube, flat_idx):
+    """Індекси по осі (доби × 48) -> початки інтервалів datetime64[us]."""
+    base = np.datetime64(cube.day0, "us").astype(np.int64)
+    return (base + np.asarray(flat_idx, dtype=np.int64) * US_PER_SLOT).view("datetime64[us]")
+
+def _top(x, n):
+    """Індекси n найбільших значень кожного рядка x (NaN - не кандидат), за спаданням; -1 - значень менше n."""
+    k = min(n, x.shape[1])
+    if k == 0: return np.empty((len(x), 0), np.int64)
+    key = np.where(np.isnan(x), -np.inf, x)
+    part = np.argpartition(-key, k - 1, axis=1)[:, :k] if k < x.shape[1] else np.broadcast_to(np.arange(k), (len(x), k)).copy()
+    order = np.argsort(-np.take_along_axis(key, part, axis=1), axis=1, kind="stable")
+    idx = np.take_along_axis(part, order, axis=1)
+    return np.where(np.isneginf(np.take_along_axis(key, idx, axis=1)), -1, idx)
+
+def _months(cube):
+    """(місяці, початкова доба кожного) осі днів куба."""
+    months = (cube.day0 + np.arange(cube.n_days)).astype("datetime64[M]")
+    cut = np.flatnonzero(np.r_[True, months[1:] != months[:-1]])
+    return months[cut], np.r_[cut, cube.n_days]
+
+def top_peaks(cube, n=10, by_month=False):
+    """Найбільші n півгодин кожної серії (за весь період або в кожному місяці): MeterID, Type, [Month,] Rank, DateTime, Value."""
+    cols = ["MeterID", "Type", "Suffix"] + (["Month"] if by_month else []) + ["Rank", "DateTime", "Value"]
+    if cube.is_empty(): return pd.DataFrame(columns=cols)
+    flat = cube.values.reshape(cube.n_series, -1)
+    months, bounds = _months(cube)
+    spans = list(zip(months, bounds[:-1], bounds[1:])) if by_month else [(None, 0, cube.n_days)]
+    parts = []
+    for month, a, b in spans:
+        idx = _top(flat[:, a * SLOTS:b * SLOTS], n)
+        rows, rank = np.nonzero(idx >= 0)
+        pos = idx[rows, rank] + a * SLOTS
+        part = {**schema_utils.series_columns(cube.series, lambda v: np.asarray(v)[rows])}
+        if by_month: part["Month"] = pd.Timestamp(month).strftime("%m.%Y")
+        part.update({"Rank": rank + 1, "DateTime": _times(cube, pos), "Value": flat[rows, pos]})
+        parts.append(pd.DataFrame(part, columns=cols))
+    return pd.concat(parts, ignore_index=True)
+
+def fleet_total(cube):
+    """(сума всіх серій куба за інтервал, скільки серій мали дані) по осі (доби × 48); інтервал без даних - NaN."""
+    flat = cube.values.reshape(cube.n_series, -1)
+    count = cube.mask.reshape(cube.n_series, -1).sum(axis=0)
+    total = np.where(count > 0, np.nansum(flat, axis=0, dtype=np.float64), np.nan)
+    return total, count
+
+def coincident_peaks(cube, n=10, top_meters=5):
+    """
+    n інтервалів з найбільшою сумою всіх серій куба (збіжні піки): Rank, DateTime, Total, Meters (серій з даними)
+    і Contributors - найбільші внески серій у цей інтервал.
+    """
+    cols = ["Rank", "DateTime", "Total", "Meters", "Contributors"]
+    if cube.is_empty(): return pd.DataFrame(columns=cols)
+    total, count = fleet_total(cube)
+    idx = _top(total[None, :], n)[0]
+    idx = idx[idx >= 0]
+    flat = cube.values.reshape(cube.n_series, -1)
+    share = flat[:, idx]                                       # (серії, піки)
+    best = _top(share.T, top_meters)
+    labels = [cube.label(i) for i in range(cube.n_series)]
+    contrib = ["; ".join(f"{labels[s]}: {share[s, j]:,.1f}" for s in best[j] if s >= 0) for j in range(len(idx))]
+    return pd.DataFrame({"Rank": np.arange(1, len(idx) + 1), "DateTime": _times(cube, idx), "Total": total[idx],
+                         "Meters": count[idx], "Contributors": contrib}, columns=cols)
+
+def contributions(cube, peaks, top_meters=8):
+    """Довга таблиця внесків серій у збіжні піки (для складеного графіка): Rank, DateTime, Series, Value; решта - «Інші»."""
+    if peaks.empty: return pd.DataFrame(columns=["Rank", "DateTime", "Series", "Value"])
+    flat = cube.values.reshape(cube.n_series, -1)
+    pos = ((peaks["DateTime"].to_numpy("datetime64[us]").astype(np.int64) - np.datetime64(cube.day0, "us").astype(np.int64)) // US_PER_SLOT)
+    share = np.nan_to_num(flat[:, pos])
+    keep = np.argsort(-share.sum(axis=1), kind="stable")[:top_meters]
+    names = [cube.label(i) for i in keep]
+    rest = share.sum(axis=0) - share[keep].sum(axis=0)
+    vals = np.vstack([share[keep], rest[None, :]]) if cube.n_series > len(keep) else share[keep]
+    names += ["Інші"] if cube.n_series > len(keep) else []
+    return pd.DataFrame({
+        "Rank": np.tile(peaks["Rank"].to_numpy(), len(names)), "DateTime": np.tile(peaks["DateTime"].to_numpy(), len(names)),
+        "Series": np.repeat(names, len(pos)), "Value": vals.ravel(),
+    })
+
+def rolling_demand(values, mask, window):
+    """
+    Середня потужність за ковзне вікно з window інтервалів для рядків (серії, доби, 48) -> (серії, доби·48 - window + 1):
+    різниця кумулятивних сум; вікно з пропуском - NaN.
+    """
+    n = len(values)
+    flat = np.where(mask, values, 0).reshape(n, -1)
+    c = np.zeros((n, flat.shape[1] + 1))
+    np.cumsum(flat, axis=1, dtype=np.float64, out=c[:, 1:])
+    k = np.zeros((n, flat.shape[1] + 1), np.int32)
+    np.cumsum(mask.reshape(n, -1), axis=1, dtype=np.int32, out=k[:, 1:])
+    with np.errstate(invalid="ignore"):
+        return np.where(k[:, window:] - k[:, :-window] == window, (c[:, window:] - c[:, :-window]) / window, np.nan)
+
+def max_demand(cube, window=2, by_month=False):
+    """Максимальна потужність за ковзне вікно кожної серії (за весь період або в кожному місяці): MeterID, Type, [Month,] DateTime, Demand."""
+    cols = ["MeterID", "Type", "Suffix"] + (["Month"] if by_month else []) + ["DateTime", "Demand"]
+    if cube.is_empty() or cube.n_days * SLOTS < window: return pd.DataFrame(columns=cols)
+    width = cube.n_days * SLOTS - window + 1
+    months, bounds = _months(cube)
+    # Вікно належить місяцю свого початку
+    spans = [(m, a * SLOTS, min(b * SLOTS, width)) for m, a, b in zip(months, bounds[:-1], bounds[1:])] if by_month else [(None, 0, width)]
+    spans = [sp for sp in spans if sp[1] < sp[2]]
+    best = np.full((len(spans), cube.n_series), -1, np.int64)
+    peak = np.full((len(spans), cube.n_series), np.nan)
+    for c0 in range(0, cube.n_series, CHUNK):
+        demand = rolling_demand(cube.values[c0:c0 + CHUNK], cube.mask[c0:c0 + CHUNK], window)
+        for j, (_, a, b) in enumerate(spans):
+            idx = _top(demand[:, a:b], 1)[:, 0]
+            ok = idx >= 0
+            best[j, c0:c0 + len(idx)] = np.where(ok, idx + a, -1)
+            peak[j, c0:c0 + len(idx)][ok] = demand[np.flatnonzero(ok), idx[ok] + a]
+    parts = []
+    for j, (month, _, _) in enumerate(spans):
+        rows = np.flatnonzero(best[j] >= 0)
+        part = {**schema_utils.series_columns(cube.series, lambda v: np.asarray(v)[rows])}
+        if by_month: part["Month"] = pd.Timestamp(month).strftime("%m.%Y")
+        part.update({"DateTime": _times(cube, best[j, rows]), "Demand": peak[j, rows]})
+        parts.append(pd.DataFrame(part, columns=cols))
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=cols)
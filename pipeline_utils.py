@@ -0,0 +1,139 @@
+import math
+import threading
+import datetime
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import anomaly_utils
+import rollup_utils
+
+# Конвеєр дашборду: вибірка -> довга таблиця -> аномалії -> KPI -> агрегати кроку (rollup_utils) -> фігура.
+# Результат кожного етапу запам'ятовується за сигнатурою своїх входів (версія даних, фільтри, налаштування),
+# тож перезапуск Streamlit, що не змінив нічого суттєвого (тема, чат, інший віджет), бере все з пам'яті.
+# Пам'ять спільна для сесій процесу (як st.cache_resource), у кожного етапу свій ліміт записів, витіснення - LRU.
+# Результати спільні - їх не змінюють на місці (нові колонки - через assign).
+STAGE_LIMITS = {"view": 8, "frame": 4, "anomaly": 2, "kpi": 32, "plot_frame": 8, "figure": 8, "range_index": 4, "tariff": 8, "compare": 4, "forecast": 8, "peaks": 8, "virtual": 4}
+
+class Memo:
+    """LRU-пам'ять одного етапу: ключ - сигнатура (кортеж), значення - результат обчислення."""
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, compute):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+            self.misses += 1
+        # Обчислення - поза блокуванням: інші етапи й сесії не чекають
+        value = compute()
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries: self._items.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock: self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+# Графік 30 хв: точок на серію, що йдуть у браузер (довша серія проріджується кошиками min/max)
+CHART_POINTS = 2000
+SLOT_MS = 30 * 60 * 1000  # найдрібніший крок таблиці графіка
+
+_memos = {name: Memo(n) for name, n in STAGE_LIMITS.items()}
+
+def signature(*parts):
+    """Хешований ключ з аргументів віджетів: списки/словники -> кортежі, дати -> ISO, float - як є."""
+    def freeze(x):
+        if isinstance(x, dict): return tuple(sorted((k, freeze(v)) for k, v in x.items()))
+        if isinstance(x, (list, tuple, set, frozenset)):
+            items = [freeze(v) for v in x]
+            return tuple(sorted(items, key=repr)) if isinstance(x, (set, frozenset)) else tuple(items)
+        if isinstance(x, (datetime.date, pd.Timestamp, np.datetime64)): return str(x)
+        return x
+    return freeze(parts)
+
+def run(stage, key, compute):
+    """Результат етапу stage для сигнатури key; compute() викликається лише при промаху."""
+    return _memos[stage].get(key, compute)
+
+def clear():
+    """Скидає пам'ять усіх етапів (після очищення даних)."""
+    for m in _memos.values(): m.clear()
+
+def stats():
+    """{етап: (записів, влучань, промахів)} - для бенчмарку й діагностики."""
+    return {name: (len(m), m.hits, m.misses) for name, m in _memos.items()}
+
+# --- ЕТАПИ ---
+def anomaly_frame(df, cube):
+    """
+    Колонки anomaly_score/is_anomaly з шару аномалій куба (anomaly_utils) до df = cube.to_frame(order="series"):
+    рядки таблиці йдуть у порядку маски куба, тож шар береться тією ж вибіркою. Вхідна таблиця не змінюється.
+    """
+    if df.empty: return df.assign(anomaly_score=np.nan, is_anomaly=False)
+    return df.assign(anomaly_score=cube.anomaly_scores()[cube.mask], is_anomaly=cube.anomalies()[cube.mask])
+
+def kpis(cube):
+    """Шість показників шапки дашборду прямо з куба (суми/максимум за суфіксами)."""
+    cons_act, cons_react = cube.suffix_total(2), cube.suffix_total(4)
+    peak = cube.suffix_max(2)
+    return {
+        "cons_act": cons_act, "cons_react": cons_react,
+        "gen_act": cube.suffix_total(1), "gen_react": cube.suffix_total(3),
+        "peak": 0 if pd.isna(peak) else peak,
+        "cos_phi": cons_act / math.sqrt(cons_act**2 + cons_react**2) if cons_act > 0 else 0,
+    }
+
+def rollup_frame(cube, res):
+    """
+    Таблиця для графіка з кроком res ("1h"/"2h"/"4h") з піраміди куба - без сирих 30-хв рядків:
+    Value - середнє кошика, min_val/max_val - смуга, is_anomaly - чи є в кошику аномальна 30-хв точка.
+    """
+    flags = anomaly_utils.bucket_flags(cube.anomalies(), rollup_utils.LEVELS[res])
+    return cube.rollup(res).to_frame(is_anomaly=flags)
+
+def window_frame(df, start, end):
+    """Рядки таблиці графіка з DateTime у [start, end] - видиме вікно після «Наблизити до виділення»."""
+    if df is None or df.empty: return df
+    t = df["DateTime"]
+    return df[(t >= pd.Timestamp(start)) & (t <= pd.Timestamp(end))]
+
+def downsample(df, max_points=CHART_POINTS):
+    """
+    Проріджування таблиці графіка для браузера: серія з понад max_points точками ділиться на max_points/2 рівних
+    за часом кошиків, у кожному лишаються точка мінімуму й точка максимуму (за min_val/max_val, якщо є смуга),
+    тож піки не губляться; аномальні точки лишаються всі. Порядок рядків зберігається, коротші серії - без змін.
+    """
+    if df is None or len(df) <= max_points: return df
+    t = df["DateTime"].to_numpy("datetime64[ms]").astype(np.int64)
+    # Точки серії - на сітці не дрібніше 30 хв: якщо весь період вміщує max_points слотів, проріджувати нічого (без groupby)
+    if (t.max() - t.min()) // SLOT_MS + 1 <= max_points: return df
+    codes = df.groupby(["MeterID", "Type"], observed=True, sort=False).ngroup().to_numpy()
+    counts = np.bincount(codes)
+    if counts.max() <= max_points: return df
+    first, last = pd.Series(t).groupby(codes).agg(["min", "max"]).to_numpy().T
+    n_b = max_points // 2
+    key = codes * n_b + (t - first[codes]) * n_b // (last - first + 1)[codes]
+    key = np.where(counts[codes] > max_points, key, -1 - np.arange(len(df)))   # коротка серія - кожен рядок окремо
+    lo = df["min_val" if "min_val" in df.columns else "Value"].to_numpy(np.float64)
+    hi = df["max_val" if "max_val" in df.columns else "Value"].to_numpy(np.float64)
+    # Кошики мають іти суцільними відрізками: таблиця за часом - стабільне сортування за ключем
+    order = None if np.all(key[1:] >= key[:-1]) else np.argsort(key, kind="stable")
+    if order is not None: key, lo, hi = key[order], lo[order], hi[order]
+    new = np.r_[True, key[1:] != key[:-1]]
+    starts, seg = np.flatnonzero(new), np.cumsum(new) - 1
+    keep = np.zeros(len(df), bool)
+    for x, reduce in ((np.where(np.isnan(lo), np.inf, lo), np.minimum), (np.where(np.isnan(hi), -np.inf, hi), np.maximum)):
+        pos = np.flatnonzero(x == reduce.reduceat(x, starts)[seg])
+        pos = pos[np.r_[True, seg[pos][1:] != seg[pos][:-1]]]                    # перша точка екстремуму кошика
+        keep[pos if order is None else order[pos]] = True
+    if "is_anomaly" in df.columns: keep |= df["is_anomaly"].to_numpy(bool)
+    return df[keep]
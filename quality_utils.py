@@ -0,0 +1,43 @@
+import math
+import numpy as np
+import schema_utils
+
+# Похідні канали якості потужності з пари P/Q одного лічильника (споживання 2/4, генерація 1/3):
+# повна потужність S, cos φ, tg φ і реактивна понад договірний tg φ. Кожен канал - окремий куб
+# з тією ж віссю днів, що й вихідний; рахується векторно по всіх лічильниках одразу і лише на запит.
+COS_PHI_LIMIT = 0.96
+TAN_PHI_LIMIT = math.tan(math.acos(COS_PHI_LIMIT))  # договірний tg φ
+# суфікс похідного каналу -> (суфікс P, суфікс Q, величина)
+CHANNELS = {
+    5: (2, 4, "s"), 6: (2, 4, "cos"), 7: (2, 4, "tan"), 8: (2, 4, "excess"),
+    9: (1, 3, "s"), 10: (1, 3, "cos"), 11: (1, 3, "tan"), 12: (1, 3, "excess"),
+}
+LABEL_SUFFIX = {schema_utils.DERIVED_LABELS[s]: s for s in CHANNELS}
+
+def is_derived(label):
+    return label in LABEL_SUFFIX
+
+def real(types):
+    """Лише справжні канали зі списку міток."""
+    return [t for t in types if t not in LABEL_SUFFIX]
+
+def available(suffixes):
+    """Похідні суфікси, для яких у наборі є обидва вихідні канали."""
+    return {s for s, (p, q, _) in CHANNELS.items() if p in suffixes and q in suffixes}
+
+def compute(kind, p, q, tan_limit=TAN_PHI_LIMIT):
+    """Величина з масивів P і Q однакової форми; NaN - немає даних або не визначено (0/0)."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if kind == "s": return np.hypot(p, q)
+        if kind == "cos": return p / np.hypot(p, q)
+        if kind == "tan": return q / p
+        return np.maximum(q - np.float32(tan_limit) * p, 0)
+
+def derive(cube, suffix):
+    """Куб похідного каналу suffix для всіх лічильників cube, що мають обидва вихідні канали."""
+    p_sfx, q_sfx, kind = CHANNELS[suffix]
+    meters, rp, rq = cube.pair_rows(p_sfx, q_sfx)
+    values = compute(kind, cube.values[rp], cube.values[rq]).astype(np.float32, copy=False)
+    mask = cube.mask[rp] & cube.mask[rq] & np.isfinite(values)
+    values[~mask] = np.nan
+    return type(cube)([(m, suffix) for m in meters], cube.day0, values, mask)
@@ -0,0 +1,161 @@
+import numpy as np
+import pandas as pd
+import schema_utils
+
+# Піраміда агрегатів куба: для кожного рівня - sum/min/max/count на (серія, доба, кошик).
+# Рівні всередині доби - кошики по width півгодин; "D" - доба цілком (+ сума квадратів для σ серії);
+# "M" - місяці, виводяться з "D". Графіки й звіти з кроком від 1 год читають рівень, а не сирі 30-хв рядки.
+SLOTS = schema_utils.SLOTS
+US_PER_SLOT = 30 * 60 * 1_000_000
+LEVELS = {"1h": 2, "2h": 4, "4h": 8, "D": SLOTS}
+MAX_POINTS = 1500  # точок на серію, з якими статичний графік (PDF) ще читається
+
+def level_for_span(n_days, max_points=MAX_POINTS):
+    """Найдрібніший рівень, за якого серія з n_days діб дає не більше max_points точок; None - сирі 30 хв."""
+    if n_days * SLOTS <= max_points: return None
+    for level, width in LEVELS.items():
+        if n_days * SLOTS // width <= max_points: return level
+    return "D"
+
+def empty_arrays(level, shape, buckets=None):
+    """Порожні масиви рівня під форму (серії, доби): sum=0, min/max=NaN, count=0."""
+    b = buckets or SLOTS // LEVELS[level]
+    out = {
+        "sum": np.zeros(shape + (b,), np.float64 if level == "D" else np.float32),
+        "min": np.full(shape + (b,), np.nan, np.float32),
+        "max": np.full(shape + (b,), np.nan, np.float32),
+        "count": np.zeros(shape + (b,), np.uint8),
+    }
+    if level == "D": out["sq"] = np.zeros(shape + (b,), np.float64)
+    return out
+
+def _scan(values, mask, width, level):
+    """Кошики по width слотів за width проходів: редукція вздовж короткої внутрішньої осі в numpy значно повільніша."""
+    s, d = values.shape[:2]
+    v = values.reshape(s, d, SLOTS // width, width)
+    m = mask.reshape(s, d, SLOTS // width, width)
+    out = empty_arrays(level, (s, d), SLOTS // width)
+    for j in range(width):
+        x, mj = v[..., j], m[..., j]
+        z = np.where(mj, x, 0).astype(out["sum"].dtype, copy=False)
+        out["sum"] += z
+        # fmin/fmax пропускають NaN, тож порожній кошик лишається NaN
+        np.fmin(out["min"], x, out=out["min"])
+        np.fmax(out["max"], x, out=out["max"])
+        out["count"] += mj
+        if "sq" in out: out["sq"] += z * z
+    return out
+
+def _combine(arrays, factor):
+    """Зливає кожні factor сусідніх кошиків: суми додаються, min/max - по групі."""
+    s, d, b = arrays["count"].shape
+    parts = {k: a.reshape(s, d, b // factor, factor) for k, a in arrays.items()}
+    out = {k: p[..., 0].copy() for k, p in parts.items()}
+    for j in range(1, factor):
+        for k, p in parts.items():
+            if k == "min": np.fmin(out[k], p[..., j], out=out[k])
+            elif k == "max": np.fmax(out[k], p[..., j], out=out[k])
+            else: out[k] += p[..., j]
+    return out
+
+def aggregate(values, mask, level):
+    """(серії, доби, 48) -> масиви рівня (серії, доби, 48 // width); NaN у values - немає даних."""
+    width = LEVELS[level]
+    if width <= 8: return _scan(values, mask, width, level)
+    # Доба: спершу кошики по 4 год, потім 6 із них в одну
+    return _combine(_scan(values, mask, 8, level), width // 8)
+
+class Rollup:
+    """
+    Один рівень піраміди для списку серій: arrays[поле][серія, рядок осі, кошик].
+    starts - початок кожного рядка осі (доба або перша доба місяця), width - півгодин у кошику.
+    """
+    def __init__(self, series, starts, width, arrays):
+        self.series = list(series)
+        self.starts = np.asarray(starts, dtype="datetime64[D]")
+        self.width = width
+        self.arrays = arrays
+
+    @property
+    def sum(self): return self.arrays["sum"]
+
+    @property
+    def min(self): return self.arrays["min"]
+
+    @property
+    def max(self): return self.arrays["max"]
+
+    @property
+    def count(self): return self.arrays["count"]
+
+    @property
+    def sq(self): return self.arrays["sq"]
+
+    @property
+    def n_series(self): return len(self.series)
+
+    def mean(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.count > 0, self.sum / self.count, np.nan)
+
+    def take(self, rows, a, b):
+        """Під-рівень: серії rows (зріз або індекси), рядки осі [a, b) - як SeriesCube.select."""
+        idx = range(self.n_series)[rows] if isinstance(rows, slice) else rows
+        return Rollup([self.series[i] for i in idx], self.starts[a:b], self.width,
+                      {k: v[rows, a:b] for k, v in self.arrays.items()})
+
+    def series_stats(self):
+        """(n, mean, std з ddof=1) кожної серії за весь період - з добового рівня, без сирих значень."""
+        n = self.count.sum(axis=(1, 2), dtype=np.int64)
+        total = self.sum.sum(axis=(1, 2), dtype=np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = total / n
+            var = (self.sq.sum(axis=(1, 2)) - total * mean) / (n - 1)
+        return n, mean, np.sqrt(np.clip(var, 0, None))
+
+    def by_month(self):
+        """Рівень "M" з добового: суми/лічильники додаються, min/max - по місяцю."""
+        if self.width != SLOTS: raise ValueError("Місячний рівень виводиться лише з добового")
+        if not len(self.starts): return Rollup(self.series, self.starts, SLOTS, self.arrays)
+        months = self.starts.astype("datetime64[M]")
+        cut = np.flatnonzero(np.r_[True, months[1:] != months[:-1]])
+        out = {
+            "sum": np.add.reduceat(self.sum, cut, axis=1),
+            "min": np.fmin.reduceat(self.min, cut, axis=1),
+            "max": np.fmax.reduceat(self.max, cut, axis=1),
+            "count": np.add.reduceat(self.count.astype(np.int32), cut, axis=1),
+            "sq": np.add.reduceat(self.sq, cut, axis=1),
+        }
+        return Rollup(self.series, months[cut].astype("datetime64[D]"), SLOTS, out)
+
+    def times(self):
+        """Початки кошиків (рядок осі × кошик) - datetime64[us]."""
+        base = self.starts.astype("datetime64[us]").astype(np.int64)
+        offs = np.arange(self.sum.shape[2], dtype=np.int64) * self.width * US_PER_SLOT
+        return (base[:, None] + offs[None, :]).view("datetime64[us]")
+
+    def to_frame(self, **extra):
+        """
+        Довга таблиця за (MeterID, Type, DateTime): Value - середнє кошика, min_val/max_val, Sum, Count
+        (+ колонки extra - масиви тієї ж форми, що й поля рівня).
+        Як і groupby().resample(), кожна серія займає кошики від першого до останнього з даними;
+        порожні кошики всередині - NaN (розрив лінії на графіку).
+        """
+        if self.n_series == 0 or not len(self.starts):
+            return pd.DataFrame(columns=["DateTime", "MeterID", "Type", "Suffix", "Value", "min_val", "max_val", "Sum", "Count", *extra])
+        s = self.n_series
+        has = (self.count > 0).reshape(s, -1)
+        keep = np.maximum.accumulate(has, axis=1) & np.maximum.accumulate(has[:, ::-1], axis=1)[:, ::-1]
+        counts = keep.sum(axis=1)
+        flat = lambda a: a.reshape(s, -1)[keep]
+        ts = np.broadcast_to(self.times().reshape(-1), keep.shape)[keep]
+        return pd.DataFrame({
+            "DateTime": ts,
+            **schema_utils.series_columns(self.series, lambda a: np.repeat(a, counts)),
+            "Value": flat(self.mean()).astype(np.float32),
+            "min_val": flat(self.min),
+            "max_val": flat(self.max),
+            "Sum": flat(self.sum),
+            "Count": flat(self.count),
+            **{k: flat(np.asarray(v)) for k, v in extra.items()},
+        })
@@ -0,0 +1,56 @@
+import pandas as pd
+import numpy as np
+from datetime import time
+
+SLOTS = 48  # півгодинних інтервалів у добі
+TYPE_LABELS = {
+    1: "Активная генерация(1) (кВт)",
+    2: "Активное потребление(2) (кВт)",
+    3: "Реактивная генерация(3) (кВАр)",
+    4: "Реактивное потребление(4) (кВАр)"
+}
+# Похідні канали якості (quality_utils): рахуються з пар P/Q, у фільтрах - поряд зі справжніми
+DERIVED_LABELS = {
+    5: "S потребление(2,4) (кВА)",
+    6: "cos φ потребление(2,4)",
+    7: "tg φ потребление(2,4)",
+    8: "Реактивное потребление сверх tg φ(2,4) (кВАр)",
+    9: "S генерация(1,3) (кВА)",
+    10: "cos φ генерация(1,3)",
+    11: "tg φ генерация(1,3)",
+    12: "Реактивная генерация сверх tg φ(1,3) (кВАр)",
+}
+CHANNEL_LABELS = {**TYPE_LABELS, **DERIVED_LABELS}
+COLUMNS = ["DateTime", "Date", "Time", "MeterID", "Type", "Suffix", "Value"]
+
+# Сітка півгодинних інтервалів доби: рахуємо один раз на модуль
+SLOT_OFFSETS = np.arange(SLOTS, dtype=np.int64) * 30 * 60 * 1_000_000  # мкс
+SLOT_TIMES = np.array([time(i // 2, (i % 2) * 30) for i in range(SLOTS)], dtype=object)
+SLOT_LABELS = [f"{i // 2:02d}:{(i % 2) * 30:02d}" for i in range(SLOTS)]
+
+# Компактна схема: категорії замість рядків, вузькі числа, без Date/Time
+# (Date і Time виводяться з DateTime на вимогу)
+COMPACT_DTYPES = {"MeterID": "category", "Type": "category", "Suffix": "int8", "Value": "float32"}
+
+def get_dates(df: pd.DataFrame) -> pd.Series:
+    """Колонка Date (datetime.date) - збережена або виведена з DateTime."""
+    if "Date" in df.columns: return df["Date"]
+    return df["DateTime"].dt.date.rename("Date")
+
+def series_columns(series, per_row):
+    """
+    Колонки MeterID/Type (категорії) і Suffix довгої таблиці для списку серій (MeterID, Suffix).
+    per_row(a) розгортає масив "по одному на серію" у рядки таблиці (повторення або вибірка за індексом).
+    """
+    meter_cats = sorted({m for m, _ in series})
+    meter_pos = {m: i for i, m in enumerate(meter_cats)}
+    type_cats = [CHANNEL_LABELS[k] for k in sorted({s for _, s in series})]
+    type_pos = {t: i for i, t in enumerate(type_cats)}
+    meter_code = np.array([meter_pos[m] for m, _ in series], dtype=np.int32)
+    type_code = np.array([type_pos[CHANNEL_LABELS[s]] for _, s in series], dtype=np.int32)
+    suffix_of = np.array([s for _, s in series], dtype=np.int8)
+    return {
+        "MeterID": pd.Categorical.from_codes(per_row(meter_code), categories=meter_cats),
+        "Type": pd.Categorical.from_codes(per_row(type_code), categories=type_cats),
+        "Suffix": per_row(suffix_of),
+    }
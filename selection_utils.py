@@ -1,28 +1,111 @@
+import numpy as np
 import pandas as pd
 
-def compute_detailed_selection_stats(df: pd.DataFrame, selected_xrange):
+# Статистика виділення на графіку через індекс діапазонних запитів, побудований раз на таблицю графіка:
+# префіксні суми й лічильники дають sum/avg, розріджена таблиця над блоками по BLOCK рядків - min/max.
+# Виділений інтервал - два бінарні пошуки на серію (усі серії одним searchsorted), без фільтра й groupby по рядках.
+BLOCK = 64
+
+class RangeIndex:
+    """
+    Індекс таблиці графіка з рядками, згрупованими за серіями (MeterID, Type) і впорядкованими за часом в серії.
+    Рядки піраміди (колонки Sum/Count/min_val/max_val, rollup_utils) враховуються кошиками, сирі - значеннями Value.
+    """
+    def __init__(self, names, starts, times, sums, counts, mins, maxs):
+        self.names = names
+        self.starts = starts                       # початок кожної серії + кінець останньої
+        n = len(times)
+        t0 = times.min() if n else 0
+        self.t0, self.step = t0, (times.max() - t0 + 1) if n else 1
+        # Час, зсунутий на номер серії: серії йдуть одна за одною, тож ключ зростає на всій таблиці
+        sid = np.repeat(np.arange(len(names), dtype=np.int64), np.diff(starts))
+        self.times = times
+        self.key = times - t0 + sid * self.step
+        self.prefix_sum = np.r_[0.0, np.cumsum(sums, dtype=np.float64)]
+        self.prefix_count = np.r_[0, np.cumsum(counts, dtype=np.int64)]
+        self.mins, self.maxs = mins, maxs
+        self.table_min, self.table_max = _sparse_table(mins, np.fmin), _sparse_table(maxs, np.fmax)
+
+    @classmethod
+    def from_frame(cls, df):
+        if df.empty:
+            return cls([], np.zeros(1, np.int64), np.empty(0, np.int64), np.empty(0), np.empty(0, np.int64),
+                       np.empty(0, np.float32), np.empty(0, np.float32))
+        m_codes, t_codes = pd.factorize(df["MeterID"])[0], pd.factorize(df["Type"])[0]
+        times = df["DateTime"].to_numpy("datetime64[us]").astype(np.int64)
+        cut = (m_codes[1:] != m_codes[:-1]) | (t_codes[1:] != t_codes[:-1])
+        # Таблиця не за серіями (напр. хронологічна) - спершу впорядкувати
+        if (np.count_nonzero(cut) + 1 != len(set(zip(m_codes[np.r_[True, cut]], t_codes[np.r_[True, cut]])))
+                or (np.diff(times)[~cut] < 0).any()):
+            return cls.from_frame(df.sort_values(["MeterID", "Type", "DateTime"], kind="stable"))
+        starts = np.r_[0, np.flatnonzero(cut) + 1, len(df)]
+        first = df.iloc[starts[:-1]]
+        names = [f"{m} {t}" for m, t in zip(first["MeterID"], first["Type"])]
+        if "Count" in df.columns:
+            sums, counts = df["Sum"].to_numpy(np.float64), df["Count"].to_numpy(np.int64)
+            mins, maxs = df["min_val"].to_numpy(np.float32), df["max_val"].to_numpy(np.float32)
+        else:
+            v = df["Value"].to_numpy(np.float64)
+            has = ~np.isnan(v)
+            sums, counts = np.where(has, v, 0), has.astype(np.int64)
+            mins = maxs = df["Value"].to_numpy(np.float32)
+        return cls(names, starts, times, sums, counts, mins, maxs)
+
+    def query(self, xmin, xmax):
+        """Як compute_detailed_selection_stats: (статистика серій з рядками в [xmin, xmax], фактичний діапазон)."""
+        if not self.names: return None, None
+        lo_t, hi_t = (pd.Timestamp(x).to_datetime64().astype("datetime64[us]").astype(np.int64) - self.t0 for x in (xmin, xmax))
+        base = np.arange(len(self.names), dtype=np.int64) * self.step
+        first, end = self.starts[:-1], self.starts[1:]
+        lo = np.clip(np.searchsorted(self.key, base + max(lo_t, -1), "left"), first, end)
+        hi = np.clip(np.searchsorted(self.key, base + min(hi_t, self.step - 1), "right"), first, end)
+        hit = np.flatnonzero(hi > lo)
+        if not len(hit): return None, None
+        lo, hi = lo[hit], hi[hit]
+        total = self.prefix_sum[hi] - self.prefix_sum[lo]
+        n = self.prefix_count[hi] - self.prefix_count[lo]
+        mn, mx = _range_reduce(self.mins, self.table_min, lo, hi, np.fmin), _range_reduce(self.maxs, self.table_max, lo, hi, np.fmax)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            avg = np.where(n > 0, total / n, np.nan)
+        stats_list = [{"name": self.names[i], "sum": total[j], "avg": avg[j], "min": mn[j], "max": mx[j]} for j, i in enumerate(hit)]
+        stats_list.sort(key=lambda x: x["name"])
+        actual_range = [pd.Timestamp(self.times[lo].min(), unit="us"), pd.Timestamp(self.times[hi - 1].max(), unit="us")]
+        return stats_list, actual_range
+
+def _sparse_table(values, op):
+    """Рівні k: op над 2^k сусідніми блоками по BLOCK значень (NaN - немає даних)."""
+    nb = -(-len(values) // BLOCK)
+    padded = np.full(nb * BLOCK, np.nan, np.float32)
+    padded[:len(values)] = values
+    blocks = padded.reshape(nb, BLOCK)
+    level = blocks[:, 0].copy()
+    for j in range(1, BLOCK): op(level, blocks[:, j], out=level)
+    table = [level]
+    while 2 ** len(table) <= nb:
+        half = 2 ** (len(table) - 1)
+        table.append(op(table[-1][:-half], table[-1][half:]))
+    return table
+
+def _range_reduce(values, table, lo, hi, op):
+    """op по рядках [lo, hi) кожної серії: повні блоки - два звернення до таблиці, краї (до 2·BLOCK рядків) - напряму."""
+    bl, br = -(-lo // BLOCK), hi // BLOCK
+    full = bl < br
+    head_end = np.where(full, np.minimum(hi, bl * BLOCK), hi)
+    tail_start = np.where(full, br * BLOCK, hi)
+    out = np.full(len(lo), np.nan, np.float32)
+    for a, b in ((lo, head_end), (tail_start, hi)):
+        idx = a[:, None] + np.arange(2 * BLOCK)[None, :]
+        edge = np.where(idx < b[:, None], values[np.minimum(idx, len(values) - 1)], np.nan)
+        out = op(out, op.reduce(edge, axis=1))
+    j = np.flatnonzero(full)
+    k = np.log2(br[j] - bl[j]).astype(np.int64)
+    for lvl in np.unique(k):
+        s, t = j[k == lvl], table[lvl]
+        out[s] = op(out[s], op(t[bl[s]], t[br[s] - 2 ** lvl]))
+    return out
+
+def compute_detailed_selection_stats(df: pd.DataFrame, selected_xrange, index=None):
     if not selected_xrange or len(selected_xrange) != 2:
         return None, None
-    
-    xmin, xmax = selected_xrange
-    mask = (df["DateTime"] >= xmin) & (df["DateTime"] <= xmax)
-    sel = df.loc[mask]
-    
-    if sel.empty: return None, None
-
-    stats_list = []
-    grouped = sel.groupby(["MeterID", "Type"])
-    
-    for (meter, typ), group in grouped:
-        val = group["Value"]
-        stats_list.append({
-            "name": f"{meter} {typ}",
-            "sum": val.sum(),
-            "avg": val.mean(),
-            "min": val.min(),
-            "max": val.max()
-        })
-    
-    stats_list.sort(key=lambda x: x["name"])
-    actual_range = [sel["DateTime"].min(), sel["DateTime"].max()]
-    return stats_list, actual_range
\ No newline at end of file
+    if index is None: index = RangeIndex.from_frame(df)
+    return index.query(*selected_xrange)
@@ -0,0 +1,112 @@
+import os
+import numpy as np
+from datetime import date, datetime, timedelta
+
+# Генератор синтетичних файлів 30917 для бенчмарків і ручної перевірки.
+# Профілі правдоподібні: добова крива навантаження, вихідні, сезон, сонячна генерація, tg φ.
+SLOTS = 48
+SUFFIXES = (1, 2, 3, 4)
+HEADER_FORMATS = ("yymmdd", "mmdd", "mixed")
+
+# Таблиці рядків для швидкого форматування "123,456" без f-string на кожне значення
+_FRAC = np.array([f",{i:03d}" for i in range(1000)])
+_INT_CACHE = {}
+
+def _int_table(n):
+    if n not in _INT_CACHE: _INT_CACHE[n] = np.array([str(i) for i in range(n)])
+    return _INT_CACHE[n]
+
+def meter_ids(n_meters, base=10000):
+    """П'ятизначні коди лічильників."""
+    if base + n_meters > 100000: raise ValueError("Забагато лічильників для 5-значного коду")
+    return [f"{base + i:05d}" for i in range(n_meters)]
+
+def _day_profile(day, rng, n):
+    """(n, 48) коефіцієнти споживання: дві вершини (ранок/вечір), нижче у вихідні, вище взимку."""
+    t = np.arange(SLOTS) / 2.0
+    shape = 0.45 + 0.35 * np.exp(-((t - 9.0) / 2.5) ** 2) + 0.5 * np.exp(-((t - 19.0) / 2.5) ** 2)
+    week = 0.75 if day.weekday() >= 5 else 1.0
+    season = 1.0 + 0.25 * np.cos(2 * np.pi * (day.timetuple().tm_yday - 15) / 365.25)
+    noise = rng.normal(1.0, 0.08, (n, SLOTS)).clip(0.5, 1.5)
+    return shape[None, :] * week * season * noise
+
+def _solar_profile(day):
+    """(48,) коефіцієнти сонячної генерації; довжина світлового дня залежить від сезону."""
+    t = np.arange(SLOTS) / 2.0
+    half = 4.0 + 2.5 * np.sin(2 * np.pi * (day.timetuple().tm_yday - 80) / 365.25)
+    return np.clip(1.0 - ((t - 13.0) / half) ** 2, 0.0, None)
+
+def day_values(day, n_meters, suffixes=SUFFIXES, seed=0):
+    """
+    Значення однієї доби: масив (n_meters, len(suffixes), 48) у кВт/кВАр.
+    Детерміновано для (seed, day); масштаб лічильника стабільний від доби до доби.
+    """
+    scale = np.random.default_rng(seed).lognormal(4.5, 1.0, n_meters)[:, None]
+    has_gen = np.random.default_rng(seed + 1).random(n_meters)[:, None] < 0.3
+    tg = np.random.default_rng(seed + 2).uniform(0.2, 0.6, n_meters)[:, None]
+    rng = np.random.default_rng([seed, day.toordinal()])
+    cons = scale * _day_profile(day, rng, n_meters)
+    gen = np.where(has_gen, scale * 0.6 * _solar_profile(day)[None, :] * rng.uniform(0.3, 1.0, (n_meters, 1)), 0.0)
+    channels = {
+        1: gen,
+        2: cons,
+        3: gen * 0.05,
+        4: cons * tg * rng.normal(1.0, 0.1, (n_meters, SLOTS)).clip(0.5, 1.5),
+    }
+    return np.stack([channels[s] for s in suffixes], axis=1)
+
+def _format_values(values):
+    """(rows, 48) float -> (rows, 48) рядків з комою як десятковим роздільником."""
+    milli = np.rint(np.clip(values, 0, None) * 1000).astype(np.int64)
+    ip, fp = np.divmod(milli, 1000)
+    ints = _int_table(int(ip.max()) + 1 if ip.size else 1)
+    return np.char.add(ints[ip], _FRAC[fp])
+
+def render_file(day, meters, values, suffixes=SUFFIXES, header="yymmdd", gap_rate=0.0, rng=None, encoding="cp1251"):
+    """
+    Байти одного файлу 30917.
+    values - (len(meters), len(suffixes), 48); gap_rate - частка порожніх полів (пропуски в даних).
+    """
+    hdr = day.strftime("%y%m%d") if header == "yymmdd" else day.strftime("%m%d")
+    text = _format_values(values.reshape(-1, SLOTS))
+    if gap_rate > 0:
+        rng = rng or np.random.default_rng(day.toordinal())
+        text[rng.random(text.shape) < gap_rate] = ""
+    codes = [f"({m}{s}):1:" for m in meters for s in suffixes]
+    lines = [f"30917:{hdr}:1"]
+    lines.extend(c + ":".join(row) for c, row in zip(codes, text.tolist()))
+    return ("\r\n".join(lines) + "\r\n").encode(encoding)
+
+def iter_files(n_meters=10, n_days=30, suffixes=SUFFIXES, header="yymmdd", start=date(2025, 1, 1),
+               meters_per_file=None, gap_rate=0.0, seed=0, meter_base=10000):
+    """
+    Генерує кортежі (name, bytes, context_date) - формат parser.parse_askue_files.
+    Один файл на добу на групу з meters_per_file лічильників (за замовчуванням - усі в одному).
+    header: 'yymmdd', 'mmdd' або 'mixed' (чергування); context_date - наступна доба, як при отриманні поштою.
+    """
+    if header not in HEADER_FORMATS: raise ValueError(f"Невідомий формат заголовка: {header}")
+    meters = meter_ids(n_meters, meter_base)
+    step = meters_per_file or n_meters
+    rng = np.random.default_rng(seed)
+    for d in range(n_days):
+        day = start + timedelta(days=d)
+        ctx = datetime.combine(day + timedelta(days=1), datetime.min.time())
+        values = day_values(day, n_meters, suffixes, seed)
+        for g in range(0, n_meters, step):
+            fmt = header if header != "mixed" else HEADER_FORMATS[(d + g // step) % 2]
+            b = render_file(day, meters[g:g + step], values[g:g + step], suffixes, fmt, gap_rate, rng)
+            yield f"{meters[g]}_{day:%Y%m%d}.txt", b, ctx
+
+def generate_files(*args, **kwargs):
+    """Те саме, що iter_files, але списком."""
+    return list(iter_files(*args, **kwargs))
+
+def write_files(out_dir, *args, **kwargs):
+    """Записує згенеровані файли в каталог; повертає список шляхів (для ingest_utils.iter_paths)."""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for name, b, _ in iter_files(*args, **kwargs):
+        p = os.path.join(out_dir, name)
+        with open(p, "wb") as f: f.write(b)
+        paths.append(p)
+    return paths
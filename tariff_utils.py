@@ -0,0 +1,119 @@
+import json
+import functools
+import numpy as np
+import pandas as pd
+import schema_utils
+
+# Тарифи за зонами доби: зону кожної години дає календар (сезон - місяці, тип дня - будні/вихідні), ціна - за зоною.
+# Календар зон рахується раз на (тариф, вісь днів) і спільний для всіх лічильників; енергія зон - з погодинного
+# рівня піраміди куба (rollup_utils) одним матричним добутком на маски зон, без циклів по серіях.
+BASE_PRICE = 4.32  # грн/кВт·год
+HOURS = 24
+ALL_MONTHS = list(range(1, 13))
+DAY_TYPES = {"all": [0, 1, 2, 3, 4, 5, 6], "weekday": [0, 1, 2, 3, 4], "weekend": [5, 6]}
+# Канали, за якими рахується плата: енергія (1-4) і реактивна понад договірний tg φ (quality_utils)
+BILLABLE = {1, 2, 3, 4, 8, 12}
+
+def hours(*ranges):
+    """Години діапазонів (з, до): "до" не включно, через північ - (23, 7)."""
+    return [h % HOURS for a, b in ranges for h in range(a, b if b > a else b + HOURS)]
+
+# Тариф: zones - ціна кожної зони (грн/кВт·год); rules - перше правило, що підходить дню (місяць і тип дня),
+# задає години зон; решта годин і дні без правила - зона default
+PRESETS = {
+    "Однозонний": {"zones": {"Цілодобово": BASE_PRICE}, "rules": [], "default": "Цілодобово"},
+    "Двозонний": {
+        "zones": {"Ніч": round(BASE_PRICE * 0.5, 2), "День": BASE_PRICE},
+        "rules": [{"months": ALL_MONTHS, "days": "all", "hours": {"Ніч": hours((23, 7))}}],
+        "default": "День",
+    },
+    "Тризонний": {
+        "zones": {"Ніч": round(BASE_PRICE * 0.4, 2), "Напівпік": round(BASE_PRICE * 1.02, 2), "Пік": round(BASE_PRICE * 1.68, 2)},
+        "rules": [{"months": ALL_MONTHS, "days": "all", "hours": {"Ніч": hours((23, 7)), "Пік": hours((8, 11), (20, 22))}}],
+        "default": "Напівпік",
+    },
+    "Тризонний сезонний": {
+        "zones": {"Ніч": round(BASE_PRICE * 0.4, 2), "Напівпік": round(BASE_PRICE * 1.02, 2), "Пік": round(BASE_PRICE * 1.68, 2)},
+        "rules": [
+            {"months": ALL_MONTHS, "days": "weekend", "hours": {"Ніч": hours((23, 7))}},
+            {"months": [4, 5, 6, 7, 8, 9], "days": "weekday", "hours": {"Ніч": hours((23, 7)), "Пік": hours((8, 11), (20, 23))}},
+            {"months": [1, 2, 3, 10, 11, 12], "days": "weekday", "hours": {"Ніч": hours((23, 7)), "Пік": hours((8, 11), (17, 21))}},
+        ],
+        "default": "Напівпік",
+    },
+}
+
+def with_prices(preset, prices):
+    """Тариф пресету з іншими цінами зон."""
+    tariff = json.loads(json.dumps(PRESETS[preset]))
+    tariff["zones"] = {z: float(prices.get(z, p)) for z, p in tariff["zones"].items()}
+    return tariff
+
+@functools.lru_cache(maxsize=16)
+def _calendar(key, day0, n_days):
+    tariff = json.loads(key)
+    zones = list(tariff["zones"])
+    days = np.datetime64(day0, "D") + np.arange(n_days)
+    month = days.astype("datetime64[M]").astype(np.int64) % 12 + 1
+    weekday = (days.astype(np.int64) + 3) % 7  # 1970-01-01 - четвер
+    default = zones.index(tariff["default"])
+    codes = np.full((n_days, HOURS), default, np.int8)
+    free = np.ones(n_days, bool)
+    for rule in tariff["rules"]:
+        hit = free & np.isin(month, rule["months"]) & np.isin(weekday, DAY_TYPES[rule.get("days", "all")])
+        profile = np.full(HOURS, default, np.int8)
+        for zone, hrs in rule["hours"].items(): profile[hrs] = zones.index(zone)
+        codes[hit] = profile
+        free &= ~hit
+    codes.flags.writeable = False
+    return zones, codes
+
+def zone_calendar(tariff, day0, n_days):
+    """(назви зон, коди зон [доба, година]) - спільні для всіх лічильників; кешуються за тарифом і віссю днів."""
+    return _calendar(json.dumps(tariff, ensure_ascii=False), str(day0), n_days)
+
+def bill(cube, tariff):
+    """Енергія й вартість за зонами для кожної серії куба: довга таблиця (MeterID, Type, Suffix, Zone, Energy, Price, Cost)."""
+    rows = [i for i, (_, s) in enumerate(cube.series) if s in BILLABLE]
+    if not rows or cube.n_days == 0:
+        return pd.DataFrame(columns=["MeterID", "Type", "Suffix", "Zone", "Energy", "Price", "Cost"])
+    zones, codes = zone_calendar(tariff, cube.day0, cube.n_days)
+    hourly = cube.rollup("1h").take(rows, 0, cube.n_days).sum.reshape(len(rows), -1).astype(np.float64)
+    masks = (codes.reshape(-1, 1) == np.arange(len(zones))[None, :]).astype(np.float64)  # (доби·24, зони)
+    energy = hourly @ masks
+    price = np.array([tariff["zones"][z] for z in zones], dtype=np.float64)
+    n_zones = len(zones)
+    return pd.DataFrame({
+        **schema_utils.series_columns([cube.series[i] for i in rows], lambda a: np.repeat(a, n_zones)),
+        "Zone": np.tile(zones, len(rows)),
+        "Energy": energy.ravel(),
+        "Price": np.tile(price, len(rows)),
+        "Cost": (energy * price).ravel(),
+    })
+
+def summary(bill_df):
+    """Рядок на серію: енергія й вартість кожної зони та разом (для таблиці дашборду й PDF)."""
+    if bill_df.empty: return pd.DataFrame()
+    zones = list(dict.fromkeys(bill_df["Zone"]))
+    wide = bill_df.pivot_table(index=["MeterID", "Type"], columns="Zone", values=["Energy", "Cost"], aggfunc="sum", observed=True)
+    out = pd.DataFrame(index=wide.index)
+    for z in zones: out[f"{z}, кВт·год"] = wide[("Energy", z)]
+    out["Разом, кВт·год"] = wide["Energy"].sum(axis=1)
+    for z in zones: out[f"{z}, грн"] = wide[("Cost", z)]
+    out["Разом, грн"] = wide["Cost"].sum(axis=1)
+    return out.reset_index()
+
+def describe(tariff):
+    """Години зон у правилах тарифу - підпис для дашборду."""
+    def spans(hrs):
+        hrs, out = sorted(hrs), []
+        for h in hrs:
+            if out and out[-1][1] == h: out[-1][1] = h + 1
+            else: out.append([h, h + 1])
+        return ", ".join(f"{a:02d}-{b % 24:02d}" for a, b in out)
+    parts = []
+    for rule in tariff["rules"]:
+        head = {"all": "усі дні", "weekday": "будні", "weekend": "вихідні"}[rule.get("days", "all")]
+        if sorted(rule["months"]) != ALL_MONTHS: head += f", місяці {', '.join(map(str, rule['months']))}"
+        parts.append(f"{head}: " + "; ".join(f"{z} {spans(h)}" for z, h in rule["hours"].items()))
+    return " | ".join(parts + [f"решта - {tariff['default']}"])
@@ -0,0 +1,16 @@
+import os
+import sys
+import pytest
+
+# Модулі застосунку лежать у корені репозиторію (плоска структура *_utils.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import parser
+import synth_utils
+
+@pytest.fixture
+def cube():
+    """2 лічильники × 60 діб з усіма чотирма каналами; у вікні 10.02 - сплеск, який детектор має позначити."""
+    c, _, _ = parser.parse_askue_cube.__wrapped__(synth_utils.generate_files(2, 60), use_cache=False)
+    c.values[1, 40, 10:20] *= 6
+    return c
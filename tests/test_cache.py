@@ -0,0 +1,49 @@
+import hashlib
+import io
+from datetime import datetime
+import numpy as np
+import pytest
+import cache_utils
+import parser
+import synth_utils
+
+pytestmark = pytest.mark.skipif(not cache_utils.is_enabled(), reason="pyarrow не встановлено")
+parse_cube = getattr(parser.parse_askue_cube, "__wrapped__", parser.parse_askue_cube)
+
+def test_key_is_content_month_and_format():
+    b = b"header\n1;2;3"
+    key = cache_utils.file_key(b, datetime(2025, 3, 17))
+    assert key == f"{hashlib.sha256(b).hexdigest()}_202503_v{cache_utils.CACHE_FORMAT}"
+    # Контекст потрібен лише для року в заголовку без дати: в межах місяця ключ той самий, інший місяць - інший
+    assert cache_utils.file_key(b, datetime(2025, 3, 1)) == key
+    assert cache_utils.file_key(b, datetime(2025, 4, 1)) != key
+    assert cache_utils.file_key(b + b" ", datetime(2025, 3, 17)) != key
+    assert cache_utils.stream_key(io.BytesIO(b), datetime(2025, 3, 17), chunk_size=4) == key
+
+def test_block_round_trip_keeps_missing_values(tmp_path):
+    values = np.arange(96, dtype=np.float64).reshape(2, 48)
+    values[1, 5:9] = np.nan
+    block = {"date": datetime(2025, 3, 1).date(), "meters": ["1", "2"], "suffixes": np.array([1, 4]), "values": values}
+    cache_utils.save_block("ab_test", block, cache_dir=tmp_path)
+    got = cache_utils.load_block("ab_test", cache_dir=tmp_path)
+    assert got["date"] == block["date"] and got["meters"] == block["meters"]
+    assert got["suffixes"].tolist() == [1, 4]
+    np.testing.assert_array_equal(got["values"], values)
+
+def test_corrupt_entry_is_dropped(tmp_path):
+    path = tmp_path / "ab" / "ab_bad.arrow"
+    path.parent.mkdir()
+    path.write_bytes(b"not arrow")
+    assert cache_utils.load_block("ab_bad", cache_dir=tmp_path) is None
+    assert not path.exists()
+
+def test_cached_parse_matches_fresh(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)   # CACHE_DIR відносний - кеш теста в tmp_path
+    files = synth_utils.generate_files(2, 5)
+    fresh, _, _ = parse_cube(files, use_cache=False)
+    first, info1, _ = parse_cube(files, workers=1)
+    second, info2, _ = parse_cube(files, workers=1)
+    assert [i["key"] for i in info1] == [i["key"] for i in info2] == [cache_utils.file_key(b, ctx) for _, b, ctx in files]
+    for c in (first, second):
+        assert c.series == fresh.series
+        np.testing.assert_array_equal(c.values, fresh.values)
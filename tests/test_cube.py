@@ -0,0 +1,46 @@
+from datetime import date
+import numpy as np
+import quality_utils
+import schema_utils
+from cube_utils import SeriesCube
+
+KW = schema_utils.TYPE_LABELS[2]
+COS = schema_utils.DERIVED_LABELS[min(s for s, (_, _, kind) in quality_utils.CHANNELS.items() if kind == "cos")]
+WINDOW = (date(2025, 2, 5), date(2025, 2, 15))
+
+def test_select_takes_layers_from_parent(cube):
+    full = cube.anomalies()
+    sub = cube.select(None, [KW], *WINDOW)
+    a = cube.day_index(WINDOW[0])
+    rows = [cube.series.index(s) for s in sub.series]
+    assert full[rows, a:a + sub.n_days].sum() > 0
+    assert np.array_equal(sub.anomalies(), full[rows, a:a + sub.n_days])
+
+def test_derived_channel_keeps_flags_of_real_series(cube):
+    m = cube.meters()[0]
+    plain = cube.select([m], [KW], *WINDOW)
+    mixed = cube.select([m], [KW, COS], *WINDOW)
+    i = mixed.series_index(m, 2)
+    assert mixed.n_series == 2 and plain.anomalies().sum() > 0
+    assert np.array_equal(mixed.anomalies()[i], plain.anomalies()[0])
+    assert np.array_equal(mixed.baseline().select(plain.series).center, plain.baseline().center, equal_nan=True)
+    assert np.array_equal(mixed.forecast_model().select(plain.series).profile, plain.forecast_model().profile, equal_nan=True)
+
+def test_stack_layers_follow_parts_and_reset_on_update(cube):
+    m0, m1 = cube.meters()
+    a, b = cube.select([m1], [KW], *WINDOW), cube.select([m0], [KW], *WINDOW)
+    st = SeriesCube.stack([a, b])
+    assert st.series == sorted(a.series + b.series)
+    assert np.array_equal(st.anomalies(), np.concatenate([b.anomalies(), a.anomalies()]))
+    st.update(st.copy())
+    assert st._stacked() is None
+
+def test_daily_frame_sums_energy_and_averages_derived_channels(cube):
+    m = cube.meters()[0]
+    sub = cube.select([m], [KW, COS], *WINDOW)
+    daily = sub.daily_frame()
+    kw, cos = daily[daily["Type"] == KW], daily[daily["Type"] == COS]
+    i = cube.series_index(m, 2)
+    a = cube.day_index(WINDOW[0])
+    assert np.allclose(kw["Value"].to_numpy(), np.nansum(cube.values[i, a:a + sub.n_days], axis=1), rtol=1e-4)
+    assert len(cos) == sub.n_days and cos["Value"].between(0, 1).all()
@@ -0,0 +1,19 @@
+import pandas as pd
+import graph_utils
+import pipeline_utils
+
+def test_30min_traces_share_grid_and_keep_gaps(cube):
+    df = pipeline_utils.anomaly_frame(cube.to_frame(order="series"), cube)
+    ov = df.assign(SourceTime=df["DateTime"] - pd.Timedelta(days=7))
+    fig = graph_utils.plot_30min_graph(df, 500, 2, False, True, "Line", "top", False, {}, "plotly", overlays=[("Тиждень", ov)])
+    alerts = [tr for tr in fig.data if "(Alert)" in (tr.name or "")]
+    assert alerts and all(tr.x is None and tr.x0 is not None for tr in fig.data)
+    assert {tr.type for tr in fig.data} == {"scattergl"}
+    assert all(tr.connectgaps is None for tr in fig.data)
+
+def test_rollup_gaps_stay_nan_on_grid(cube):
+    sub = cube.select(cube.meters()[:1])
+    sub = sub.thaw() if sub.is_frozen else sub.copy()
+    sub.values[:, 20:25] = float("nan"); sub.mask[:, 20:25] = False
+    fig = graph_utils.plot_30min_graph(pipeline_utils.rollup_frame(sub, "4h"), 500, 2, False, False, "Line", "top", False, {}, "plotly")
+    assert pd.isna(fig.data[0].y).sum() >= 5 * 6
@@ -0,0 +1,15 @@
+import numpy as np
+import graph_utils
+import schema_utils
+
+def test_violin_from_cube_matches_raw_distribution(cube):
+    view = cube.select(None, [schema_utils.TYPE_LABELS[2], schema_utils.TYPE_LABELS[4]])
+    df = view.to_frame(order="series")
+    for group_by, key in (("Hour", df["DateTime"].dt.hour), ("DayOfWeek", df["DateTime"].dt.dayofweek)):
+        fig = graph_utils.plot_violin_distribution(None, 500, group_by, "plotly", cube=view)
+        assert [tr.name for tr in fig.data] == [schema_utils.TYPE_LABELS[2], schema_utils.TYPE_LABELS[4]]
+        for tr in fig.data:
+            raw = df[df["Type"] == tr.name].groupby(key[df["Type"] == tr.name])["Value"]
+            y = np.asarray(tr.y, np.float64).reshape(len(raw), graph_utils.VIOLIN_QUANTILES)
+            assert np.allclose(y[:, graph_utils.VIOLIN_QUANTILES // 2], raw.median().to_numpy(), rtol=1e-4)
+            assert np.allclose(y[:, 0], raw.min().to_numpy()) and np.allclose(y[:, -1], raw.max().to_numpy())
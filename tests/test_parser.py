@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+import parser
+import synth_utils
+
+parse_cube = getattr(parser.parse_askue_cube, "__wrapped__", parser.parse_askue_cube)
+
+def test_pool_startup_failure_falls_back(monkeypatch):
+    files = synth_utils.generate_files(2, 5)
+    fresh, _, _ = parse_cube(files, use_cache=False, workers=1)
+    def refuse(*a, **k): raise PermissionError("sem_open")
+    monkeypatch.setattr(parser, "ProcessPoolExecutor", refuse)
+    c, _, errors = parse_cube(files, use_cache=False, workers=2)
+    assert not errors and c.series == fresh.series
+    np.testing.assert_array_equal(c.values, fresh.values)
+    # Інші помилки не ховаються за послідовним розбором
+    def broken(*a, **k): raise ValueError("bug")
+    monkeypatch.setattr(parser, "ProcessPoolExecutor", broken)
+    with pytest.raises(ValueError): parse_cube(files, use_cache=False, workers=2)
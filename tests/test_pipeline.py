@@ -0,0 +1,20 @@
+import numpy as np
+import pipeline_utils
+import schema_utils
+
+def _frame(cube):
+    view = cube.select(None, [schema_utils.TYPE_LABELS[2]])
+    return pipeline_utils.anomaly_frame(view.to_frame(order="series"), view)
+
+def test_downsample_skips_short_series(cube):
+    df = _frame(cube)                               # 60 діб = 2880 точок на серію
+    assert pipeline_utils.downsample(df, max_points=3000) is df
+
+def test_downsample_keeps_extremes_and_anomalies(cube):
+    df = _frame(cube)
+    out = pipeline_utils.downsample(df, max_points=500)
+    per_series = out.groupby("MeterID", observed=True).size()
+    assert (per_series <= 500 + df["is_anomaly"].sum()).all()
+    g, og = df.groupby("MeterID", observed=True)["Value"], out.groupby("MeterID", observed=True)["Value"]
+    assert np.allclose(g.max(), og.max()) and np.allclose(g.min(), og.min())
+    assert out["is_anomaly"].sum() == df["is_anomaly"].sum()
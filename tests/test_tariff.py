@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+import quality_utils
+import schema_utils
+import tariff_utils
+
+KW = schema_utils.TYPE_LABELS[2]
+
+def test_hours_wrap_past_midnight():
+    assert tariff_utils.hours((23, 7)) == [23, 0, 1, 2, 3, 4, 5, 6]
+    assert tariff_utils.hours((8, 11), (20, 22)) == [8, 9, 10, 20, 21]
+
+def test_zone_energy_splits_hourly_totals(cube):
+    view = cube.select(cube.meters()[:1], [KW])
+    bill = tariff_utils.bill(view, tariff_utils.PRESETS["Двозонний"])
+    e = bill.set_index("Zone")["Energy"]
+    v = view.values[0].reshape(view.n_days, 24, 2)
+    night = np.nansum(v[:, tariff_utils.hours((23, 7))])
+    assert e["Ніч"] == pytest.approx(night, rel=1e-6)
+    assert e.sum() == pytest.approx(np.nansum(v), rel=1e-6)
+    assert bill["Cost"].sum() == pytest.approx((e * bill.set_index("Zone")["Price"]).sum())
+
+def test_seasonal_rules_pick_first_match_by_month_and_day_type():
+    zones, codes = tariff_utils.zone_calendar(tariff_utils.PRESETS["Тризонний сезонний"], "2025-01-04", 3)  # Сб, Нд, Пн
+    peak, half = zones.index("Пік"), zones.index("Напівпік")
+    assert codes[0, 9] == half and codes[1, 18] == half          # вихідні: піку немає
+    assert codes[2, 9] == peak and codes[2, 18] == peak          # будні зими: пік 08-11 і 17-21
+    _, summer = tariff_utils.zone_calendar(tariff_utils.PRESETS["Тризонний сезонний"], "2025-07-07", 1)
+    assert summer[0, 18] == half and summer[0, 21] == peak      # будні літа: пік 20-23
+
+def test_only_billable_channels_are_billed(cube):
+    cos = min(s for s, (_, _, kind) in quality_utils.CHANNELS.items() if kind == "cos")
+    view = cube.select(cube.meters()[:1], [KW, schema_utils.DERIVED_LABELS[cos]])
+    assert set(tariff_utils.bill(view, tariff_utils.PRESETS["Однозонний"])["Suffix"]) == {2}
@@ -0,0 +1,42 @@
+from datetime import date
+import numpy as np
+import schema_utils
+import virtual_utils
+from cube_utils import SeriesCube
+
+KW = schema_utils.TYPE_LABELS[2]
+WINDOW = (date(2025, 2, 5), date(2025, 2, 15))
+
+def test_virtual_meter_in_view_keeps_flags_of_real_series(cube):
+    # Як app.load_view: віртуальні рахуються з усього куба, вибірка - select() з них
+    m0, m1 = cube.meters()
+    defs = [{"name": "Сума", "formula": f"{m0} + {m1}"}]
+    view = cube.select([m0], [KW], *WINDOW)
+    virt = virtual_utils.evaluate(cube, defs).select(None, [KW], *WINDOW)
+    both = SeriesCube.stack([view, virt])
+    i = both.series_index(m0, 2)
+    assert view.anomalies().sum() > 0
+    assert np.array_equal(both.anomalies()[i], view.anomalies()[0])
+    assert np.array_equal(both.anomalies()[both.series_index("Сума", 2)], virt.anomalies()[0])
+    assert virt.day0 == view.day0 and virt.n_days == view.n_days
+
+def test_validate_rejects_mixed_implicit_and_explicit_channels(cube):
+    m0, m1 = cube.meters()
+    assert virtual_utils.validate("F", f"{m0} + {m1}:4", cube.meters()) is not None
+    assert virtual_utils.validate("F", f"{m0} + {m1}", cube.meters()) is None
+    assert virtual_utils.validate("F", f"{m0}:1 - {m1}:4", cube.meters()) is None
+
+def test_explicit_channels_give_one_output_from_named_channels(cube):
+    m0, m1 = cube.meters()
+    v = virtual_utils.evaluate(cube, [{"name": "Нетто", "formula": f"{m0}:1 - {m1}:2"}])
+    assert v.series == [("Нетто", 1)]
+    ref = cube.values[cube.series_index(m0, 1)] - cube.values[cube.series_index(m1, 2)]
+    assert np.allclose(v.values[0], ref, equal_nan=True)
+
+def test_implicit_terms_fan_out_per_channel(cube):
+    m0, m1 = cube.meters()
+    v = virtual_utils.evaluate(cube, [{"name": "Сума", "formula": f"{m0} + 0.5*{m1}"}])
+    assert [s for _, s in v.series] == [1, 2, 3, 4]
+    for i, (_, s) in enumerate(v.series):
+        ref = cube.values[cube.series_index(m0, s)] + np.float32(0.5) * cube.values[cube.series_index(m1, s)]
+        assert np.allclose(v.values[i], ref, equal_nan=True)
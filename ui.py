@@ -1,6 +1,7 @@
 import streamlit as st
 import streamlit.components.v1 as components
 import pandas as pd
+import compare_utils
 
 DEFAULT_HEX = ["#FF0000", "#00FF00", "#0000FF", "#FFFF00", "#00FFFF", "#FF00FF", "#800000", "#808000", "#008080", "#000080"]
 
@@ -20,6 +21,9 @@ TRANS = {
     "tab_pq": "P vs Q", 
     "tab_dist": "Розподіл", 
     "tab_table": "Таблиця", 
+    "tab_coverage": "Покриття", 
+    "tab_tariff": "Тарифи", 
+    "tab_peaks": "Піки", 
     "tab_report": "📄 Майстер Звітів",
     
     # Фільтри
@@ -67,6 +71,8 @@ TRANS = {
     *   🟥/🟨 Яскраві плями — години пікового навантаження.
     *   🟩 Темні зони — мінімальне споживання.
     *   Вертикальні смуги — характерний режим дня.
+    
+    **Сітка лічильників:** малі карти вибраних лічильників поруч зі спільною шкалою — видно, у кого піки в ті самі години.
     """,
     
     "desc_pq": """
@@ -91,13 +97,41 @@ TRANS = {
     *   **kde:** Показник "густини". Чим вище число, тим стабільніше навантаження в цій точці.
     """,
     
+    "desc_coverage": """
+    ### ℹ️ Покриття даних
+    **Що показує:** Які півгодинні інтервали для кожного лічильника та каналу є в даних, а яких немає.  
+    **Як читати:** 🟩 — доба повна (48 з 48), 🟨 — частина інтервалів відсутня, 🟥 — даних за добу немає. Справжні нулі вважаються даними; пропуски не враховуються в сумах і середніх.
+    """,
+    
+    "desc_tariff": """
+    ### ℹ️ Тарифи за зонами доби
+    **Що показує:** Енергію та вартість кожного лічильника й каналу за зонами тарифу (ніч / напівпік / пік) за вибраний період.  
+    **Як рахується:** Зона кожної години визначається місяцем, типом дня (будні / вихідні) та годиною; ціни зон можна змінити. Для реактивних каналів та реактивної понад tg φ діє та сама ціна зони.
+    """,
+    
+    "desc_peaks": """
+    ### ℹ️ Піки навантаження
+    **Що показує:** Збіжні піки — півгодини з найбільшою сумарною потужністю всіх вибраних лічильників (з внеском кожного), найбільші піки кожного лічильника та максимальну потужність за ковзне вікно (30 хв – 3 год).  
+    **Навіщо:** Звірка з договірною (приєднаною) потужністю та вибір інтервалів для оплати потужності. Помісячний режим рахує все окремо для кожного місяця.
+    """,
+    
     "desc_table": "### ℹ️ Таблиця даних\nВихідний масив для детального перегляду значень, фільтрації та експорту в Excel.",
     
+    # Порівняння періодів
+    "compare_lbl": "Порівняти з",
+    "compare_hdr": "Порівняння періодів",
+    "forecast_lbl": "Прогноз",
+    "forecast_horizon": "Горизонт прогнозу",
+    "forecast_hdr": "Прогноз навантаження (від кінця даних)",
+    "heat_grid_lbl": "Сітка лічильників",
+    
     # Майстер звітів
     "rep_add_stats": "➕ Статистика", 
     "rep_add_30m": "➕ Графік 30хв",
     "rep_add_daily": "➕ Графік Доба", 
     "rep_add_matrix": "➕ Матриця",
+    "rep_add_tariff": "➕ Тариф",
+    "rep_add_peaks": "➕ Піки",
     "rep_gen": "🚀 Сформувати PDF", 
     "rep_download": "💾 СКАЧАТИ ЗВІТ",
     
@@ -231,7 +265,7 @@ def render_sidebar(df_context=None, file_info=None):
             
             if st.session_state["palette_name"] == "Custom" and df_context is not None and not df_context.empty:
                 st.markdown(f"**{t('custom_cols_lbl')}**")
-                active_series = sorted(df_context.groupby(["MeterID", "Type"]).groups.keys())
+                active_series = sorted(df_context.groupby(["MeterID", "Type"], observed=True).groups.keys())
                 custom_colors = []
                 for i, (meter, typ) in enumerate(active_series):
                     pk_key = f"clr_{meter}_{typ}_{i}"
@@ -247,17 +281,23 @@ def render_sidebar(df_context=None, file_info=None):
                 res_opts = {"30T": "30 хв", "1h": "1 год", "2h": "2 год", "4h": "4 год"}
                 rv = st.selectbox("Детализация", list(res_opts.keys()), format_func=lambda x: res_opts[x])
                 st.session_state["resample_val"] = rv
+                st.session_state["compare_with"] = st.multiselect(t("compare_lbl"), list(compare_utils.SHIFTS))
+                st.session_state["show_forecast"] = st.checkbox(t("forecast_lbl"))
+                if st.session_state["show_forecast"]:
+                    st.session_state["forecast_days"] = st.selectbox(t("forecast_horizon"), [1, 7], format_func=lambda d: {1: "1 доба", 7: "7 діб"}[d])
                 st.session_state["show_anom"] = st.checkbox("Аномалии")
                 st.session_state["show_pts"] = st.checkbox("Точки")
                 st.session_state["line_w"] = st.slider("Толщина", 1, 5, 2)
             
             if nav == "tab_daily":
                 st.session_state["show_vals"] = st.checkbox("Значения (Цифры)", value=False)
+                st.session_state["compare_with"] = st.multiselect(t("compare_lbl"), list(compare_utils.SHIFTS))
             
             if nav == "tab_matrix":
                 heat_opts = ["Default", "Vivid", "Neon", "Pastel", "Tableau"]
                 st.session_state["heatmap_palette_name"] = st.selectbox("Palette Matrix", heat_opts)
-                st.session_state["show_vals"] = st.checkbox("Значения", value=False)
+                st.session_state["heatmap_grid"] = st.checkbox(t("heat_grid_lbl"), value=False)
+                if not st.session_state["heatmap_grid"]: st.session_state["show_vals"] = st.checkbox("Значения", value=False)
             
             if nav == "tab_pq":
                 st.session_state["show_pq_labels"] = st.checkbox("Метки точек (Labels)", value=False)
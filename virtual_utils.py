@@ -0,0 +1,74 @@
+import re
+import numpy as np
+from cube_utils import SeriesCube
+
+# Віртуальні лічильники - канали, задані формулою над справжніми лічильниками:
+#   Фідер 1 = 12345 + 12346 - 12350     - для кожного каналу (суфікса), що є в доданків
+#   Нетто   = 12345:1 - 12345:2         - явний канал доданка; результат - канал першого доданка
+#   Частка  = 0.5*12345                 - з коефіцієнтом
+# Доданки з каналом і без нього в одній формулі не змішуються (validate): інакше явний канал потрапив би в усі канали результату.
+# Рахуються над віссю днів куба-джерела: один векторний прохід на доданок, без циклів по інтервалах.
+# Інтервал має значення, лише якщо його мають усі наявні серії доданків; серія, якої в лічильника немає, - нуль.
+_TERM = re.compile(r"\s*([+-])\s*(?:(\d+(?:[.,]\d+)?)\s*\*\s*)?([^\s+\-*:]+)\s*(?::\s*([1-4]))?\s*")
+
+def parse(formula):
+    """'a + 2*b:4 - c' -> [(коефіцієнт, MeterID, суфікс або None)]; ValueError, якщо формула не розбирається."""
+    text = (formula or "").strip()
+    if not text: raise ValueError("Порожня формула")
+    if text[0] not in "+-": text = "+" + text
+    terms, pos = [], 0
+    while pos < len(text):
+        m = _TERM.match(text, pos)
+        if not m: raise ValueError(f"Не вдалося розібрати формулу біля «{text[pos:pos + 12].strip()}»")
+        sign, coef, meter, sfx = m.groups()
+        k = float(coef.replace(",", ".")) if coef else 1.0
+        terms.append((-k if sign == "-" else k, meter, int(sfx) if sfx else None))
+        pos = m.end()
+    return terms
+
+def validate(name, formula, meters, taken=()):
+    """Текст помилки для нового визначення або None."""
+    name = (name or "").strip()
+    if not name: return "Вкажіть назву"
+    if name in set(map(str, meters)) | set(taken): return f"Назва «{name}» вже зайнята"
+    try: terms = parse(formula)
+    except ValueError as e: return str(e)
+    unknown = sorted({m for _, m, _ in terms} - set(map(str, meters)))
+    if unknown: return "Немає лічильників: " + ", ".join(unknown)
+    if len({s is None for _, _, s in terms}) > 1: return "Вкажіть канал (:1-4) або для всіх доданків, або для жодного"
+    return None
+
+def names(defs):
+    return [d["name"] for d in defs]
+
+def sources(defs):
+    """Справжні лічильники, з яких рахуються defs - лише їх треба читати."""
+    return sorted({m for d in defs for _, m, _ in parse(d["formula"])})
+
+def evaluate(cube, defs, d_start=None, d_end=None):
+    """
+    Куб віртуальних лічильників defs ([{"name", "formula"}]) на осі днів cube.select(..., d_start, d_end) -
+    тій самій, що й у вибірки справжніх лічильників, тож результати можна поєднати (SeriesCube.stack).
+    """
+    parsed = [(d["name"], parse(d["formula"])) for d in defs]
+    src = cube.select(sources(defs), None, d_start, d_end)
+    have = {}
+    for m, s in src.series: have.setdefault(m, set()).add(s)
+    series, values = [], []
+    for name, terms in parsed:
+        implicit = [m for _, m, s in terms if s is None]
+        outputs = sorted(set().union(*(have.get(m, set()) for m in implicit))) if implicit else [terms[0][2]]
+        for out in outputs:
+            acc = None
+            for k, m, s in terms:
+                i = src.series_index(m, out if s is None else s)
+                if i is None: continue
+                v = src.values[i]
+                if acc is None: acc = v * np.float32(k)
+                elif k == 1: acc += v
+                elif k == -1: acc -= v
+                else: acc += v * np.float32(k)
+            if acc is not None: series.append((name, out)); values.append(acc)
+    order = sorted(range(len(series)), key=series.__getitem__)
+    vals = np.stack([values[i] for i in order]) if values else np.empty((0,) + src.values.shape[1:], np.float32)
+    return SeriesCube([series[i] for i in order], src.day0, vals, ~np.isnan(vals))
@@ -0,0 +1,361 @@
+import os
+import json
+import shutil
+import threading
+from datetime import date
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.dataset as pads
+    import pyarrow.ipc
+except ImportError:  # без pyarrow сховище вимкнене, дані живуть лише в сесії
+    pa = pq = pads = None
+
+import schema_utils
+import quality_utils
+from cube_utils import SeriesCube
+from coverage_utils import Coverage, BYTES_PER_DAY
+from anomaly_utils import Baseline, HOURS_OF_WEEK
+
+# Локальне сховище на диску: Parquet, розбитий за місяцем і лічильником
+#   <root>/month=YYYY-MM/meter=XXXXX.parquet  - рядок = (MeterID, Suffix, Date, 48 значень; NaN - немає даних)
+#   <root>/catalog.json                        - склад партицій, список файлів, версія
+#   <root>/coverage/month=YYYY-MM.arrow        - бітова карта покриття місяця (coverage_utils)
+#   <root>/baseline.arrow                      - база детектора аномалій (anomaly_utils) за останні BASELINE_MONTHS з версією каталогу
+# Відкриття застосунку читає лише каталог; дані вантажаться вікном (лічильники × період)
+# Сховище спільне для всіх сесій процесу, тож застосунок вмикає його лише явно: ASKUE_WAREHOUSE=1 (і pyarrow)
+WAREHOUSE_DIR = os.environ.get("ASKUE_WAREHOUSE_DIR", ".askue_warehouse")
+ENABLED = os.environ.get("ASKUE_WAREHOUSE", "0") == "1"
+ADMIN = os.environ.get("ASKUE_WAREHOUSE_ADMIN", "0") == "1"  # кнопка повного видалення сховища в інтерфейсі
+SLOTS = schema_utils.SLOTS
+TYPE_LABELS = schema_utils.TYPE_LABELS
+CATALOG_FILE = "catalog.json"
+BASELINE_FILE = "baseline.arrow"
+BASELINE_BATCH = 200  # лічильників за прохід при перерахунку бази
+BASELINE_MONTHS = 12  # глибина історії для бази: вартість оновлення не росте з довжиною архіву
+
+_write_lock = threading.Lock()
+_catalog_cache = {}
+
+def is_available() -> bool:
+    return pq is not None
+
+def is_enabled() -> bool:
+    """Чи працює застосунок через сховище (а не з даними лише в сесії)."""
+    return ENABLED and is_available()
+
+def _month(d):
+    return f"{d:%Y-%m}"
+
+def _part_path(root, month, meter):
+    return os.path.join(root, f"month={month}", f"meter={meter}.parquet")
+
+class Catalog:
+    """
+    Метадані сховища без самих даних: лічильники, канали, період, файли.
+    Інтерфейс метаданих той самий, що в SeriesCube (meters/types/date_range/...), тож фільтри працюють з обома.
+    """
+    def __init__(self, raw=None):
+        raw = raw or {}
+        self.version = raw.get("version", 0)
+        self.partitions = raw.get("partitions", {})
+        self.file_info = raw.get("files", [])
+        self._series = sorted({(p["meter"], s) for p in self.partitions.values() for s in p["suffixes"]})
+        self._d_min = min((p["d_min"] for p in self.partitions.values()), default=None)
+        self._d_max = max((p["d_max"] for p in self.partitions.values()), default=None)
+
+    def to_dict(self):
+        return {"version": self.version, "partitions": self.partitions, "files": self.file_info}
+
+    def is_empty(self):
+        return not self.partitions
+
+    def meters(self):
+        return sorted({m for m, _ in self._series})
+
+    def types(self):
+        sfx = self.suffixes()
+        return [schema_utils.CHANNEL_LABELS[s] for s in sorted(sfx | quality_utils.available(sfx))]
+
+    def suffixes(self):
+        return {s for _, s in self._series}
+
+    def date_range(self):
+        if self.is_empty(): return None, None
+        return date.fromisoformat(self._d_min), date.fromisoformat(self._d_max)
+
+    def series_frame(self):
+        return pd.DataFrame({
+            "MeterID": [m for m, _ in self._series],
+            "Type": [TYPE_LABELS[s] for _, s in self._series],
+            "Suffix": [s for _, s in self._series],
+        })
+
+    def partition_paths(self, root, meters=None, d_start=None, d_end=None):
+        """Файли партицій, що перетинають вибірку (за каталогом, без звернення до диска)."""
+        meters = None if meters is None else set(map(str, meters))
+        lo = None if d_start is None else d_start.isoformat()
+        hi = None if d_end is None else d_end.isoformat()
+        out = []
+        for p in self.partitions.values():
+            if meters is not None and p["meter"] not in meters: continue
+            if lo is not None and p["d_max"] < lo: continue
+            if hi is not None and p["d_min"] > hi: continue
+            out.append(_part_path(root, p["month"], p["meter"]))
+        return sorted(out)
+
+def load_catalog(root=WAREHOUSE_DIR) -> Catalog:
+    """Каталог сховища; кешується за mtime файлу, тож повторні виклики майже безкоштовні."""
+    path = os.path.join(root, CATALOG_FILE)
+    try:
+        st = os.stat(path)
+        stamp = (st.st_mtime_ns, st.st_size)
+    except OSError: return Catalog()
+    hit = _catalog_cache.get(path)
+    if hit and hit[0] == stamp: return hit[1]
+    try:
+        with open(path, encoding="utf-8") as f: cat = Catalog(json.load(f))
+    except Exception:
+        cat = Catalog()
+    _catalog_cache[path] = (stamp, cat)
+    return cat
+
+def _save_catalog(cat, root):
+    path = os.path.join(root, CATALOG_FILE)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cat.to_dict(), f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+# --- ПАРТИЦІЇ ---
+def _cube_to_table(cube):
+    """Рядки (серія, доба) з хоча б одним значенням."""
+    s_idx, d_idx = np.nonzero(cube.mask.any(axis=2))
+    values = np.ascontiguousarray(cube.values[s_idx, d_idx], dtype=np.float32)
+    return pa.table({
+        "MeterID": pa.array([cube.series[i][0] for i in s_idx], type=pa.string()),
+        "Suffix": pa.array(np.array([cube.series[i][1] for i in s_idx], dtype=np.int8)),
+        "Date": pa.array((cube.day0 + d_idx).astype("datetime64[D]"), type=pa.date32()),
+        "Values": pa.FixedSizeListArray.from_arrays(pa.array(values.ravel()), SLOTS),
+    })
+
+def _table_to_cube(table):
+    if table.num_rows == 0: return SeriesCube.empty()
+    values = table.column("Values").combine_chunks().flatten().to_numpy(zero_copy_only=False)
+    values = values.reshape(-1, SLOTS).astype(np.float32)
+    # NaN у файлі - інтервал без даних (from_lines знімає для нього біт маски)
+    return SeriesCube.from_lines(
+        np.asarray(table.column("MeterID").to_pylist(), dtype=object),
+        table.column("Suffix").to_numpy().astype(np.int64),
+        table.column("Date").to_numpy().astype("datetime64[D]"),
+        values,
+    )
+
+def _read_partition(path):
+    if not os.path.exists(path): return SeriesCube.empty()
+    try: return _table_to_cube(pq.read_table(path))
+    except Exception: return SeriesCube.empty()
+
+def _write_partition(path, cube):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    pq.write_table(_cube_to_table(cube), tmp, compression="zstd")
+    os.replace(tmp, path)
+
+def _coverage_path(root, month):
+    return os.path.join(root, "coverage", f"month={month}.arrow")
+
+def _read_coverage(path):
+    if not os.path.exists(path): return Coverage.empty()
+    try:
+        with pa.memory_map(path) as src:
+            table = pa.ipc.open_file(src).read_all()
+        bits = table.column("Bits").combine_chunks().flatten().to_numpy(zero_copy_only=False)
+        return Coverage.from_rows(
+            np.asarray(table.column("MeterID").to_pylist(), dtype=object),
+            table.column("Suffix").to_numpy().astype(np.int64),
+            table.column("Date").to_numpy().astype("datetime64[D]"),
+            bits.reshape(-1, BYTES_PER_DAY).astype(np.uint8),
+        )
+    except Exception:
+        return Coverage.empty()
+
+def _write_coverage(path, cov):
+    meters, suffixes, days, bits = cov.to_rows()
+    table = pa.table({
+        "MeterID": pa.array(meters, type=pa.string()),
+        "Suffix": pa.array(suffixes),
+        "Date": pa.array(days.astype("datetime64[D]"), type=pa.date32()),
+        "Bits": pa.FixedSizeListArray.from_arrays(pa.array(np.ascontiguousarray(bits).ravel()), BYTES_PER_DAY),
+    })
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with pa.ipc.new_file(tmp, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp, path)
+
+def _read_baseline(path, version):
+    """База з файлу, якщо вона рахувалась для цієї версії каталогу; інакше None."""
+    if not os.path.exists(path): return None
+    try:
+        with pa.memory_map(path) as src:
+            table = pa.ipc.open_file(src).read_all()
+        if (table.schema.metadata or {}).get(b"version") != str(version).encode(): return None
+        col = lambda name: table.column(name).combine_chunks().flatten().to_numpy(zero_copy_only=False).reshape(-1, HOURS_OF_WEEK)
+        series = list(zip(table.column("MeterID").to_pylist(), table.column("Suffix").to_numpy().astype(np.int64).tolist()))
+        return Baseline(series, col("Center").astype(np.float32), col("Spread").astype(np.float32))
+    except Exception:
+        return None
+
+def _write_baseline(path, base, version):
+    table = pa.table({
+        "MeterID": pa.array([m for m, _ in base.series], type=pa.string()),
+        "Suffix": pa.array(np.array([s for _, s in base.series], dtype=np.int8)),
+        "Center": pa.FixedSizeListArray.from_arrays(pa.array(np.ascontiguousarray(base.center).ravel()), HOURS_OF_WEEK),
+        "Spread": pa.FixedSizeListArray.from_arrays(pa.array(np.ascontiguousarray(base.spread).ravel()), HOURS_OF_WEEK),
+    }).replace_schema_metadata({"version": str(version)})
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with pa.ipc.new_file(tmp, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp, path)
+
+def _split_by_month_meter(cube):
+    """(місяць, лічильник, під-куб) - серії відсортовані за лічильником, тож рядки лічильника суцільні."""
+    meters = np.array([m for m, _ in cube.series], dtype=object)
+    starts = np.flatnonzero(np.r_[True, meters[1:] != meters[:-1]])
+    bounds = list(zip(starts, np.r_[starts[1:], len(meters)]))
+    days = cube.days()
+    months = days.astype("datetime64[M]")
+    m_starts = np.flatnonzero(np.r_[True, months[1:] != months[:-1]])
+    for a, b in zip(m_starts, np.r_[m_starts[1:], len(days)]):
+        month = _month(months[a].astype(object))
+        for s0, s1 in bounds:
+            sub = SeriesCube(cube.series[s0:s1], days[a], cube.values[s0:s1, a:b], cube.mask[s0:s1, a:b])
+            if sub.mask.any(): yield month, meters[s0], sub
+
+# --- ЗАПИС І ЧИТАННЯ ---
+def write_cube(cube, file_info=None, root=WAREHOUSE_DIR):
+    """
+    Вливає куб у сховище: перезаписуються лише зачеплені партиції (місяць × лічильник),
+    у межах партиції нові дані перемагають. Повертає (нових інтервалів, перезаписаних).
+    """
+    if not is_available() or cube.is_empty(): return 0, 0
+    inserted = replaced = 0
+    with _write_lock:
+        os.makedirs(root, exist_ok=True)
+        cat = load_catalog(root)
+        # Копії: закешований каталог не змінюється, доки новий не записано
+        raw = {"version": cat.version, "partitions": dict(cat.partitions), "files": list(cat.file_info)}
+        touched, meters = {}, set()
+        for month, meter, sub in _split_by_month_meter(cube):
+            meters.add(str(meter))
+            path = _part_path(root, month, meter)
+            part = _read_partition(path)
+            ins, rep = part.update(sub)
+            inserted += ins; replaced += rep
+            _write_partition(path, part)
+            touched.setdefault(month, []).append(Coverage.from_cube(part))
+            d0, d1 = part.date_range()
+            raw["partitions"][f"{month}/{meter}"] = {
+                "month": month, "meter": meter, "suffixes": sorted(part.suffixes()),
+                "d_min": d0.isoformat(), "d_max": d1.isoformat(),
+            }
+        # Карта покриття: оновлюються лише зачеплені місяці, рядками повних партицій
+        for month, parts in touched.items():
+            cov = _read_coverage(_coverage_path(root, month))
+            for c in parts: cov = cov.update(c)
+            _write_coverage(_coverage_path(root, month), cov)
+        names = {f["name"] for f in raw["files"]}
+        raw["files"] += [f for f in (file_info or []) if f["name"] not in names]
+        raw["version"] += 1
+        _save_catalog(Catalog(raw), root)
+        _update_baseline(cat, raw["version"], sorted(meters), root)
+    return inserted, replaced
+
+def load_cube(meters=None, d_start=None, d_end=None, root=WAREHOUSE_DIR):
+    """Куб лише для вибраних лічильників і періоду: читаються партиції, що перетинають вікно."""
+    if not is_available(): return SeriesCube.empty()
+    paths = load_catalog(root).partition_paths(root, meters, d_start, d_end)
+    if not paths: return SeriesCube.empty()
+    flt = None
+    if d_start is not None: flt = pads.field("Date") >= pa.scalar(d_start, pa.date32())
+    if d_end is not None:
+        hi = pads.field("Date") <= pa.scalar(d_end, pa.date32())
+        flt = hi if flt is None else flt & hi
+    table = pads.dataset(paths, format="parquet").to_table(filter=flt)
+    return _table_to_cube(table)
+
+def load_coverage(meters=None, root=WAREHOUSE_DIR):
+    """Карта покриття всього архіву (без читання значень); meters - обмежити лічильниками."""
+    if not is_available(): return Coverage.empty()
+    months = sorted({p["month"] for p in load_catalog(root).partitions.values()})
+    parts = [_read_coverage(_coverage_path(root, m)) for m in months]
+    rows = [c.select(meters).to_rows() for c in parts if c.n_series]
+    rows = [r for r in rows if len(r[0])]
+    if not rows: return Coverage.empty()
+    return Coverage.from_rows(
+        np.concatenate([np.asarray(r[0], dtype=object) for r in rows]),
+        np.concatenate([r[1] for r in rows]).astype(np.int64),
+        np.concatenate([r[2] for r in rows]),
+        np.concatenate([r[3] for r in rows]),
+    )
+
+def _baseline_start(cat):
+    """Перша доба історії для бази: BASELINE_MONTHS до кінця архіву."""
+    d_end = cat.date_range()[1]
+    return None if d_end is None else (pd.Timestamp(d_end) - pd.DateOffset(months=BASELINE_MONTHS) + pd.Timedelta(days=1)).date()
+
+def _baseline_for(meters, root):
+    """База лічильників meters за останні BASELINE_MONTHS архіву - порціями по BASELINE_BATCH лічильників."""
+    since = _baseline_start(load_catalog(root))
+    parts = [Baseline.from_cube(load_cube(meters[i:i + BASELINE_BATCH], since, root=root)) for i in range(0, len(meters), BASELINE_BATCH)]
+    return Baseline(
+        [s for b in parts for s in b.series],
+        np.concatenate([b.center for b in parts] or [Baseline.empty().center]),
+        np.concatenate([b.spread for b in parts] or [Baseline.empty().spread]),
+    )
+
+def _update_baseline(prev_cat, version, meters, root):
+    """
+    Після запису: перераховуються лише зачеплені лічильники (медіана не складається з місячних частин, тож їхня історія
+    читається заново, але не глибше BASELINE_MONTHS), решта рядків - з бази попередньої версії.
+    Без неї база лишається застарілою, і load_baseline порахує все.
+    """
+    path = os.path.join(root, BASELINE_FILE)
+    prev = Baseline.empty() if prev_cat.is_empty() else _read_baseline(path, prev_cat.version)
+    if prev is None: return
+    try: _write_baseline(path, prev.update(_baseline_for(meters, root)), version)
+    except Exception: pass  # не вдалося - load_baseline перерахує
+
+def load_baseline(root=WAREHOUSE_DIR):
+    """
+    База детектора аномалій для всього сховища - позначки не залежать від вікна, яке читає сесія.
+    Зазвичай її оновлює write_cube для зачеплених лічильників; повний перерахунок - лише якщо файлу для
+    поточної версії каталогу немає (перший запуск, збій запису).
+    """
+    if not is_available(): return Baseline.empty()
+    cat = load_catalog(root)
+    path = os.path.join(root, BASELINE_FILE)
+    base = _read_baseline(path, cat.version)
+    if base is not None: return base
+    meters = cat.meters()
+    base = _baseline_for(meters, root)
+    if meters:
+        try: _write_baseline(path, base, cat.version)
+        except Exception: pass  # не вдалося зберегти - порахуємо наступного разу
+    return base
+
+def clear(root=WAREHOUSE_DIR):
+    """
+    Видаляє всі дані сховища - для всіх сесій. Лишається порожній каталог з наступною версією:
+    кеші, ключовані версією каталогу, не сплутають новий архів зі старим.
+    """
+    with _write_lock:
+        version = load_catalog(root).version
+        shutil.rmtree(root, ignore_errors=True)
+        _catalog_cache.pop(os.path.join(root, CATALOG_FILE), None)
+        os.makedirs(root, exist_ok=True)
+        _save_catalog(Catalog({"version": version + 1}), root)